@@ -0,0 +1,112 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import Counter
+
+from django.apps import apps
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+CARPETA_BLOBS = "evidencias/sha256"
+TAMANIO_BLOQUE = 64 * 1024
+
+_local = threading.local()
+
+
+def _reservas():
+    if not hasattr(_local, "reservas"):
+        _local.reservas = Counter()
+    return _local.reservas
+
+
+def consumir_reserva(ruta):
+    """
+    True si este hilo guardó `ruta` con el almacenamiento (que ya sumó la
+    referencia) y la reserva no se había usado; la marca como usada.
+    """
+    reservas = _reservas()
+    if reservas[ruta] <= 0:
+        return False
+    reservas[ruta] -= 1
+    if not reservas[ruta]:
+        del reservas[ruta]
+    return True
+
+
+@deconstructible(path="core.almacenamiento.AlmacenamientoDeduplicado")
+class AlmacenamientoDeduplicado(FileSystemStorage):
+    """
+    Guarda cada archivo una sola vez, nombrado por su SHA-256:
+    evidencias/sha256/ab/cd/<hash>.<ext>. Si el contenido ya existe se
+    reutiliza el archivo y no se escribe nada nuevo.
+
+    El hash se calcula mientras el contenido se copia al disco (o, si la
+    subida ya está en un archivo temporal, leyéndolo una vez antes de moverlo).
+    Cuántas filas Multimedia usan cada archivo se lleva en ArchivoEvidencia:
+    antes de decidir si reutiliza el archivo se bloquea su fila y se suma la
+    referencia de la evidencia que se está guardando, así una limpieza de
+    huérfanos concurrente (signals.borrar_si_huerfano, que toma el mismo
+    bloqueo) no puede borrarlo entre medio. La señal post_save de Multimedia
+    consume esa reserva en vez de sumar otra vez.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def ruta_blob(self, sha256, extension):
+        extension = f".{extension.lower()}" if extension else ""
+        return f"{CARPETA_BLOBS}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lstrip(".")
+        if hasattr(content, "temporary_file_path"):
+            return self._guardar_desde_temporal(content.temporary_file_path(), extension)
+
+        carpeta_tmp = self.path(f"{CARPETA_BLOBS}/tmp")
+        os.makedirs(carpeta_tmp, exist_ok=True)
+        sha = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=carpeta_tmp, delete=False) as tmp:
+            try:
+                if hasattr(content, "seek"):
+                    content.seek(0)
+                for bloque in content.chunks(TAMANIO_BLOQUE):
+                    sha.update(bloque)
+                    tmp.write(bloque)
+            except BaseException:
+                tmp.close()
+                os.remove(tmp.name)
+                raise
+        try:
+            return self._guardar_blob(self.ruta_blob(sha.hexdigest(), extension), tmp.name, os.replace)
+        finally:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+
+    def _guardar_desde_temporal(self, ruta, extension):
+        sha = hashlib.sha256()
+        with open(ruta, "rb") as fh:
+            for bloque in iter(lambda: fh.read(TAMANIO_BLOQUE), b""):
+                sha.update(bloque)
+        return self._guardar_blob(self.ruta_blob(sha.hexdigest(), extension), ruta, file_move_safe)
+
+    def _guardar_blob(self, nombre, origen, mover):
+        """Con la fila de ArchivoEvidencia bloqueada: mueve `origen` si el blob no existe y reserva una referencia."""
+        ArchivoEvidencia = apps.get_model("core", "ArchivoEvidencia")
+        destino = self.path(nombre)
+        with transaction.atomic():
+            registro, _ = ArchivoEvidencia.objects.select_for_update().get_or_create(ruta=nombre)
+            if not os.path.exists(destino):
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                mover(origen, destino)
+                self._aplicar_permisos(destino)
+            ArchivoEvidencia.objects.filter(pk=registro.pk).update(referencias=F("referencias") + 1)
+        _reservas()[nombre] += 1
+        return nombre
+
+    def _aplicar_permisos(self, destino):
+        if self.file_permissions_mode is not None:
+            os.chmod(destino, self.file_permissions_mode)
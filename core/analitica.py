@@ -0,0 +1,149 @@
+from functools import partial
+
+from django.db import connection, transaction
+from django.db.models import (
+    Aggregate, Avg, Count, Exists, FloatField, Max, Min, OuterRef, StdDev, Subquery, Value,
+)
+from django.db.models.functions import Cast, Coalesce, Lower, Replace, Trim
+
+from .busqueda import CONFIGURACION
+from .models import PreguntaEncuesta, RespuestaEncuesta, ResumenPregunta
+
+PERCENTILES = (0.25, 0.5, 0.75, 0.9)
+MAX_OPCIONES = 50
+MAX_TERMINOS = 15
+NUMERO = r"^\s*[-+]?[0-9]+([.,][0-9]+)?\s*$"
+
+
+class Percentil(Aggregate):
+    """percentile_cont de PostgreSQL (interpolado) sobre la expresión."""
+    function = "PERCENTILE_CONT"
+    template = "%(function)s(%(fraccion)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+    output_field = FloatField()
+
+    def __init__(self, expression, fraccion, **extra):
+        super().__init__(expression, fraccion=float(fraccion), **extra)
+
+
+def _opciones(respuestas, total):
+    filas = (
+        respuestas.annotate(clave=Lower(Trim("texto_respuesta")))
+        .values("clave")
+        .annotate(cantidad=Count("id"), opcion=Min(Trim("texto_respuesta")))
+        .order_by("-cantidad", "clave")[:MAX_OPCIONES]
+    )
+    return {
+        "opciones": [
+            {"opcion": f["opcion"], "cantidad": f["cantidad"],
+             "porcentaje": round(100 * f["cantidad"] / total, 1) if total else 0}
+            for f in filas
+        ]
+    }
+
+
+def _numeros(respuestas, total):
+    valor = Cast(Replace(Trim("texto_respuesta"), Value(","), Value(".")), FloatField())
+    agregados = {
+        "cantidad": Count("id"),
+        "minimo": Min(valor),
+        "maximo": Max(valor),
+        "promedio": Avg(valor),
+        "desviacion": StdDev(valor),
+    }
+    agregados.update({f"p{int(p * 100)}": Percentil(valor, p) for p in PERCENTILES})
+    datos = respuestas.filter(texto_respuesta__regex=NUMERO).aggregate(**agregados)
+    datos["no_numericas"] = total - datos["cantidad"]
+    return datos
+
+
+def _terminos(pregunta_id):
+    """
+    Palabras más frecuentes, contadas por la base con ts_stat. Se cuentan
+    tal como se escribieron (configuración 'simple') y se descartan las que
+    la configuración en español considera palabras vacías.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT word, nentry, ndoc FROM ts_stat(format("
+            "'SELECT to_tsvector(''simple'', texto_respuesta) FROM %%I WHERE pregunta_id = %%s', %s, %s)) "
+            "WHERE length(to_tsvector(%s::regconfig, word)) > 0 "
+            "ORDER BY nentry DESC, word LIMIT %s",
+            [RespuestaEncuesta._meta.db_table, pregunta_id, CONFIGURACION, MAX_TERMINOS],
+        )
+        return {
+            "terminos": [
+                {"termino": termino, "apariciones": apariciones, "respuestas": respuestas}
+                for termino, apariciones, respuestas in cursor.fetchall()
+            ]
+        }
+
+
+def calcular(pregunta):
+    """Agregados de las respuestas de la pregunta según su tipo; devuelve (total, datos)."""
+    respuestas = RespuestaEncuesta.objects.filter(pregunta_id=pregunta.pk).exclude(texto_respuesta="")
+    total = respuestas.count()
+    if pregunta.tipo == "opcion":
+        datos = _opciones(respuestas, total)
+    elif pregunta.tipo == "numero":
+        datos = _numeros(respuestas, total)
+    else:
+        datos = _terminos(pregunta.pk) if total else {"terminos": []}
+    datos["tipo"] = pregunta.tipo
+    return total, datos
+
+
+def actualizar_resumen(pregunta_id):
+    """
+    Recalcula y guarda el resumen de una pregunta (si todavía existe).
+    Es un recálculo completo, no incremental: los percentiles y los términos
+    de ts_stat no se pueden mantener sumando y restando, así que cada
+    resumen vuelve a agregar todas las respuestas de la pregunta (una
+    consulta de agregación apoyada en el índice de pregunta_id).
+    """
+    pregunta = PreguntaEncuesta.objects.filter(pk=pregunta_id).first()
+    if pregunta is None:
+        return None
+    total, datos = calcular(pregunta)
+    resumen, _ = ResumenPregunta.objects.update_or_create(
+        pregunta=pregunta, defaults={"total": total, "datos": datos}
+    )
+    return resumen
+
+
+def programar_resumen(pregunta_id):
+    """
+    Recalcula el resumen cuando se confirma la transacción que cambió sus
+    respuestas. Guardar k respuestas de la misma pregunta en una transacción
+    deja un solo recálculo pendiente, no k.
+    """
+    pendientes = transaction.get_connection().run_on_commit
+    for _, funcion, *_ in pendientes:
+        if getattr(funcion, "func", None) is actualizar_resumen and funcion.args == (pregunta_id,):
+            return
+    transaction.on_commit(partial(actualizar_resumen, pregunta_id))
+
+
+def resumenes_encuesta(encuesta):
+    """
+    Preguntas de la encuesta con su resumen ya calculado (una consulta).
+    Las que aún no tienen resumen se calculan una vez y quedan guardadas.
+    """
+    preguntas = list(encuesta.preguntaencuesta_set.select_related("resumen").order_by("pk"))
+    for pregunta in preguntas:
+        if not hasattr(pregunta, "resumen"):
+            pregunta.resumen = actualizar_resumen(pregunta.pk)
+    return preguntas
+
+
+def _contar(preguntas):
+    return Coalesce(Subquery(preguntas.annotate(n=Count("pk")).values("n")), Value(0))
+
+
+def avance_encuesta():
+    """
+    Expresiones para un UPDATE de Encuesta que recalculan `total_preguntas` y
+    `preguntas_respondidas` (preguntas con al menos una respuesta) de cada fila.
+    """
+    preguntas = PreguntaEncuesta.objects.filter(encuesta=OuterRef("pk")).order_by().values("encuesta")
+    respondidas = preguntas.filter(Exists(RespuestaEncuesta.objects.filter(pregunta=OuterRef("pk"))))
+    return {"total_preguntas": _contar(preguntas), "preguntas_respondidas": _contar(respondidas)}
@@ -0,0 +1,90 @@
+import re
+
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity,
+)
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast, Greatest
+
+from . import models
+
+CONFIGURACION = "spanish"
+CAMPOS_INCIDENCIA = ("titulo", "descripcion", "nombre_vecino")
+CAMPOS_ENCUESTA = ("titulo", "descripcion")
+CAMPOS_USUARIO = ("username", "first_name", "last_name", "email")
+OPERADORES_WEB = re.compile(r'"|(^|\s)-|\bor\b', re.IGNORECASE)
+PALABRA = re.compile(r"[^\W_]+")
+
+
+def _texto(campo, instancia):
+    return campo if instancia is None else Value(getattr(instancia, campo) or "")
+
+
+def vector_incidencia(incidencia=None):
+    """
+    Vector de búsqueda leído de las columnas (para UPDATE masivos) o de los
+    valores de `incidencia`, para guardarlo en el mismo INSERT/UPDATE de save().
+    """
+    return (
+        SearchVector(_texto("titulo", incidencia), weight="A", config=CONFIGURACION)
+        + SearchVector(_texto("descripcion", incidencia), weight="B", config=CONFIGURACION)
+        + SearchVector(_texto("nombre_vecino", incidencia), weight="C", config=CONFIGURACION)
+    )
+
+
+def vector_encuesta(nombre_departamento, encuesta=None):
+    return (
+        SearchVector(_texto("titulo", encuesta), weight="A", config=CONFIGURACION)
+        + SearchVector(_texto("descripcion", encuesta), weight="B", config=CONFIGURACION)
+        + SearchVector(Value(nombre_departamento or ""), weight="C", config=CONFIGURACION)
+    )
+
+
+def indexar_incidencias(**filtro):
+    """Recalcula `busqueda` de las incidencias que cumplen el filtro (todas si no hay filtro)."""
+    return models.Incidencia.objects.filter(**filtro).update(busqueda=vector_incidencia())
+
+
+def indexar_encuestas(departamento, **filtro):
+    """Recalcula `busqueda` de las encuestas de un departamento."""
+    return models.Encuesta.objects.filter(departamento=departamento, **filtro).update(
+        busqueda=vector_encuesta(departamento.nombre_departamento)
+    )
+
+
+def consulta_texto(texto):
+    """
+    Sin operadores, cada palabra se busca como prefijo (`bach` encuentra
+    `bache`, como el icontains de antes). Con sintaxis de buscadores web
+    ("frase exacta", -excluir, OR) se usa websearch_to_tsquery.
+    """
+    palabras = PALABRA.findall(texto)
+    if OPERADORES_WEB.search(texto) or not palabras:
+        return SearchQuery(texto, config=CONFIGURACION, search_type="websearch")
+    return SearchQuery(" & ".join(f"{p}:*" for p in palabras), config=CONFIGURACION, search_type="raw")
+
+
+def buscar(qs, texto):
+    """
+    Filtra `qs` (Incidencia o Encuesta) con búsqueda de texto completo en
+    español usando el índice GIN de `busqueda`, y anota `relevancia` (en
+    doble precisión, para que un cursor la reproduzca exacta).
+    """
+    consulta = consulta_texto(texto)
+    relevancia = Cast(SearchRank(F("busqueda"), consulta), FloatField())
+    return qs.filter(busqueda=consulta).annotate(relevancia=relevancia)
+
+
+def buscar_usuarios(qs, texto):
+    """
+    Búsqueda tolerante a errores de tipeo sobre usuarios (pg_trgm).
+    Coincide por subcadena o por similitud de palabras en usuario, nombre,
+    apellido o correo (ambas usan los índices GIN de trigramas) y ordena por
+    la mejor similitud, anotada como `similitud`.
+    """
+    condicion = Q()
+    for campo in CAMPOS_USUARIO:
+        condicion |= Q(**{f"{campo}__icontains": texto})
+        condicion |= Q(**{f"{campo}__trigram_word_similar": texto})
+    similitud = Greatest(*(TrigramWordSimilarity(texto, campo) for campo in CAMPOS_USUARIO))
+    return qs.filter(condicion).annotate(similitud=similitud).order_by("-similitud", "id")
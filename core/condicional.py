@@ -0,0 +1,48 @@
+import hashlib
+
+from django.middleware.csrf import get_token
+from django.views.decorators.http import condition
+
+from .utils import roles_de
+
+
+def _hay_mensajes_pendientes(request):
+    almacen = getattr(request, "_messages", None)
+    return almacen is not None and len(almacen) > 0
+
+
+def etag_por_actualizacion(obtener_marca):
+    """
+    Decorador de GET condicional basado en `actualizadoEl`.
+
+    `obtener_marca(request, *args, **kwargs)` debe devolver, con una sola
+    consulta, un valor que cambie cuando cambie lo que muestra la vista (por
+    ejemplo el máximo de `actualizadoEl` y el total de filas del listado), o
+    None para no usar caché. El ETag combina esa marca con el usuario, sus roles,
+    los parámetros GET y el secreto CSRF, de modo que un 304 nunca sirve la
+    vista de otro rol ni una página cuyos formularios llevan un token CSRF que
+    ya rotó (p. ej. tras cerrar sesión y volver a entrar).
+
+    Debe ir después de los decoradores de acceso, para que el control de
+    permisos ocurra antes de responder 304.
+    """
+
+    def etag(request, *args, **kwargs):
+        if _hay_mensajes_pendientes(request):
+            return None
+        marca = obtener_marca(request, *args, **kwargs)
+        if marca is None:
+            return None
+        usuario = request.user
+        get_token(request)
+        clave = "|".join([
+            request.META.get("CSRF_COOKIE", ""),
+            str(usuario.pk),
+            str(usuario.is_superuser),
+            ",".join(sorted(roles_de(usuario))),
+            request.GET.urlencode(),
+            repr(marca),
+        ])
+        return hashlib.sha1(clave.encode()).hexdigest()
+
+    return condition(etag_func=etag)
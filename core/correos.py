@@ -0,0 +1,114 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CorreoPendiente
+
+ESPERA_BASE = getattr(settings, "CORREOS_ESPERA_BASE", 60)
+ESPERA_MAXIMA = getattr(settings, "CORREOS_ESPERA_MAXIMA", 6 * 60 * 60)
+
+
+def encolar_correo(asunto, cuerpo, destinatarios, remitente=None):
+    """Guarda la notificación en la bandeja de salida; no contacta al servidor SMTP."""
+    return CorreoPendiente.objects.create(
+        asunto=asunto[:255],
+        cuerpo=cuerpo,
+        remitente=remitente or "",
+        destinatarios=list(destinatarios),
+    )
+
+
+def reclamar_correos(cantidad):
+    """
+    Marca como 'enviando' hasta `cantidad` correos cuyo próximo intento ya
+    venció y los devuelve. Con skip_locked pueden correr varios despachadores.
+    """
+    ahora = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            CorreoPendiente.objects.select_for_update(skip_locked=True)
+            .filter(estado="pendiente", proximo_intento__lte=ahora)
+            .order_by("proximo_intento")
+            .values_list("pk", flat=True)[:cantidad]
+        )
+        if not ids:
+            return []
+        CorreoPendiente.objects.filter(pk__in=ids).update(
+            estado="enviando", intentos=F("intentos") + 1, proximo_intento=ahora
+        )
+    return list(CorreoPendiente.objects.filter(pk__in=ids))
+
+
+def liberar_correos_colgados(minutos, max_intentos=5):
+    """
+    Devuelve a 'pendiente' los correos que quedaron en 'enviando' (p. ej. por
+    un corte). Los que ya agotaron `max_intentos` pasan a 'error', para que un
+    correo que tumba al despachador no se reintente para siempre.
+    """
+    colgados = CorreoPendiente.objects.filter(
+        estado="enviando", proximo_intento__lt=timezone.now() - timedelta(minutes=minutos)
+    )
+    fallidos = colgados.filter(intentos__gte=max_intentos).update(
+        estado="error",
+        ultimo_error=f"El despachador se detuvo sin terminar el envío {max_intentos} veces.",
+    )
+    return fallidos + colgados.update(estado="pendiente")
+
+
+def espera_reintento(intentos):
+    """Backoff exponencial: 1, 2, 4, ... minutos, con tope."""
+    return timedelta(seconds=min(ESPERA_BASE * 2 ** max(intentos - 1, 0), ESPERA_MAXIMA))
+
+
+def enviar_lote(correos, max_intentos=5):
+    """
+    Envía los correos por una sola conexión SMTP y registra el resultado de
+    cada uno. Los fallidos se reprograman hasta agotar `max_intentos`.
+    """
+    try:
+        conexion = get_connection()
+        conexion.open()
+    except Exception as e:
+        for correo in correos:
+            _registrar_fallo(correo, e, max_intentos)
+        return correos
+
+    try:
+        for correo in correos:
+            mensaje = EmailMessage(
+                correo.asunto,
+                correo.cuerpo,
+                correo.remitente or settings.DEFAULT_FROM_EMAIL,
+                correo.destinatarios,
+                connection=conexion,
+            )
+            try:
+                mensaje.send(fail_silently=False)
+            except Exception as e:
+                _registrar_fallo(correo, e, max_intentos)
+            else:
+                correo.estado = "enviado"
+                correo.enviadoEl = timezone.now()
+                correo.ultimo_error = ""
+                CorreoPendiente.objects.filter(pk=correo.pk).update(
+                    estado=correo.estado, enviadoEl=correo.enviadoEl, ultimo_error=""
+                )
+    finally:
+        conexion.close()
+    return correos
+
+
+def _registrar_fallo(correo, error, max_intentos):
+    correo.ultimo_error = f"{type(error).__name__}: {error}"
+    if correo.intentos >= max_intentos:
+        correo.estado = "error"
+    else:
+        correo.estado = "pendiente"
+        correo.proximo_intento = timezone.now() + espera_reintento(correo.intentos)
+    CorreoPendiente.objects.filter(pk=correo.pk).update(
+        estado=correo.estado, ultimo_error=correo.ultimo_error, proximo_intento=correo.proximo_intento
+    )
@@ -0,0 +1,163 @@
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import signals
+from .models import Encuesta, Incidencia, Multimedia, TrabajoDerivado
+
+TAMANIO_MINIATURA = getattr(settings, "DERIVADOS_TAMANIO_MINIATURA", (320, 320))
+TAMANIO_VISTA_PREVIA = getattr(settings, "DERIVADOS_TAMANIO_VISTA_PREVIA", (1280, 1280))
+CALIDAD_JPEG = getattr(settings, "DERIVADOS_CALIDAD_JPEG", 80)
+TIPOS_CON_DERIVADOS = ("imagen", "video")
+
+
+class DerivadoNoDisponible(Exception):
+    """No se puede generar el derivado en este servidor (falta Pillow o ffmpeg)."""
+
+
+def encolar(multimedia):
+    """Agrega un trabajo pendiente si la evidencia admite derivados."""
+    if multimedia.tipo not in TIPOS_CON_DERIVADOS or not multimedia.archivo:
+        return None
+    return TrabajoDerivado.objects.create(multimedia=multimedia)
+
+
+def reclamar_trabajos(cantidad):
+    """
+    Marca como 'procesando' hasta `cantidad` trabajos pendientes y los devuelve.
+    Con skip_locked varios procesadores pueden correr en paralelo sin tomar
+    el mismo trabajo.
+    """
+    with transaction.atomic():
+        ids = list(
+            TrabajoDerivado.objects.select_for_update(skip_locked=True)
+            .filter(estado="pendiente")
+            .order_by("creadoEl")
+            .values_list("pk", flat=True)[:cantidad]
+        )
+        if not ids:
+            return []
+        TrabajoDerivado.objects.filter(pk__in=ids).update(
+            estado="procesando", intentos=F("intentos") + 1, actualizadoEl=timezone.now()
+        )
+    return list(TrabajoDerivado.objects.filter(pk__in=ids).select_related("multimedia"))
+
+
+def liberar_trabajos_colgados(minutos, max_intentos=3):
+    """
+    Devuelve a 'pendiente' los trabajos que quedaron en 'procesando' (p. ej.
+    por un corte). Los que ya agotaron `max_intentos` pasan a 'error', para
+    que una evidencia que tumba al procesador no se reintente para siempre.
+    """
+    ahora = timezone.now()
+    colgados = TrabajoDerivado.objects.filter(
+        estado="procesando", actualizadoEl__lt=ahora - timedelta(minutes=minutos)
+    )
+    fallidos = colgados.filter(intentos__gte=max_intentos).update(
+        estado="error",
+        ultimo_error=f"El procesador se detuvo sin terminar el trabajo {max_intentos} veces.",
+        actualizadoEl=ahora,
+    )
+    return fallidos + colgados.update(estado="pendiente", actualizadoEl=ahora)
+
+
+def procesar(trabajo, max_intentos=3):
+    """Genera los derivados de un trabajo y registra el resultado."""
+    try:
+        generar_derivados(trabajo.multimedia)
+    except DerivadoNoDisponible as e:
+        trabajo.estado = "error"
+        trabajo.ultimo_error = str(e)
+    except Exception as e:
+        trabajo.estado = "error" if trabajo.intentos >= max_intentos else "pendiente"
+        trabajo.ultimo_error = f"{type(e).__name__}: {e}"
+    else:
+        trabajo.estado = "completado"
+        trabajo.ultimo_error = ""
+    TrabajoDerivado.objects.filter(pk=trabajo.pk).update(
+        estado=trabajo.estado, ultimo_error=trabajo.ultimo_error, actualizadoEl=timezone.now()
+    )
+    return trabajo
+
+
+def generar_derivados(multimedia):
+    """
+    Imagen: miniatura y vista previa web en JPEG.
+    Video: fotograma de portada (vista_previa) y su miniatura.
+    Los archivos quedan en evidencias/derivados/, junto a los originales.
+    Toca la incidencia o encuesta dueña para que su ETag cambie.
+    """
+    if multimedia.tipo == "imagen":
+        with multimedia.archivo.open("rb") as fh:
+            imagen = _abrir_imagen(fh)
+    elif multimedia.tipo == "video":
+        imagen = _fotograma_video(multimedia.archivo)
+    else:
+        return multimedia
+
+    base = f"evidencia_{multimedia.pk}"
+    multimedia.vista_previa.save(
+        f"{base}_previa.jpg", ContentFile(_reducir(imagen, TAMANIO_VISTA_PREVIA)), save=False
+    )
+    multimedia.miniatura.save(
+        f"{base}_miniatura.jpg", ContentFile(_reducir(imagen, TAMANIO_MINIATURA)), save=False
+    )
+    Multimedia.objects.filter(pk=multimedia.pk).update(
+        miniatura=multimedia.miniatura.name, vista_previa=multimedia.vista_previa.name
+    )
+    if multimedia.incidencia_id:
+        signals.tocar(Incidencia, pk=multimedia.incidencia_id)
+    if multimedia.encuesta_id:
+        signals.tocar(Encuesta, pk=multimedia.encuesta_id)
+    return multimedia
+
+
+def _abrir_imagen(fh):
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise DerivadoNoDisponible("Pillow no está instalado.")
+    imagen = Image.open(fh)
+    imagen = ImageOps.exif_transpose(imagen)
+    imagen.load()
+    return imagen
+
+
+def _reducir(imagen, tamanio):
+    copia = imagen.copy()
+    copia.thumbnail(tamanio)
+    if copia.mode not in ("RGB", "L"):
+        copia = copia.convert("RGB")
+    salida = io.BytesIO()
+    copia.save(salida, format="JPEG", quality=CALIDAD_JPEG, optimize=True)
+    return salida.getvalue()
+
+
+def _fotograma_video(archivo):
+    """Extrae un fotograma del primer segundo del video con ffmpeg."""
+    ffmpeg = shutil.which(getattr(settings, "DERIVADOS_FFMPEG", "ffmpeg"))
+    if not ffmpeg:
+        raise DerivadoNoDisponible("ffmpeg no está disponible.")
+    with tempfile.TemporaryDirectory() as tmp:
+        destino = os.path.join(tmp, "poster.jpg")
+        subprocess.run(
+            [ffmpeg, "-v", "error", "-y", "-ss", "1", "-i", archivo.path,
+             "-frames:v", "1", destino],
+            check=True, capture_output=True, timeout=120,
+        )
+        if not os.path.exists(destino):
+            subprocess.run(
+                [ffmpeg, "-v", "error", "-y", "-i", archivo.path, "-frames:v", "1", destino],
+                check=True, capture_output=True, timeout=120,
+            )
+        with open(destino, "rb") as fh:
+            return _abrir_imagen(fh)
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import Q
+
+from .models import Incidencia
+
+ESTADOS_ABIERTOS = ("Pendiente", "En Progreso")
+RADIO_KM = getattr(settings, "DUPLICADOS_RADIO_KM", 0.2)
+UMBRAL_SIMILITUD = getattr(settings, "DUPLICADOS_UMBRAL_SIMILITUD", 0.3)
+MAX_CANDIDATOS = 5
+
+
+def buscar_duplicados(titulo, latitud, longitud, tipo_incidencia=None, qs=None,
+                      radio_km=RADIO_KM, limite=MAX_CANDIDATOS):
+    """
+    Incidencias abiertas que probablemente reportan lo mismo: a `radio_km`
+    o menos (índice geohash), del mismo tipo si se conoce, y con título
+    parecido por trigramas. Una sola consulta; devuelve hasta `limite`
+    candidatas con `similitud` y `distancia_km`, las más parecidas primero.
+    No hay índice de trigramas sobre `titulo`: PostgreSQL no lo usaría para
+    `similarity() >= umbral` (solo para el operador %), y el filtro por
+    radio con el índice de geohash ya deja unas pocas filas abiertas, sobre
+    las que la similitud se calcula directamente.
+    """
+    if not titulo or latitud is None or longitud is None:
+        return []
+    qs = (qs if qs is not None else Incidencia.objects.all()).filter(estado__in=ESTADOS_ABIERTOS)
+    if tipo_incidencia is not None:
+        qs = qs.filter(Q(tipo_incidencia=tipo_incidencia) | Q(encuesta__tipo_incidencia=tipo_incidencia))
+    return list(
+        qs.en_radio(latitud, longitud, radio_km)
+        .annotate(similitud=TrigramSimilarity("titulo", titulo))
+        .filter(similitud__gte=UMBRAL_SIMILITUD)
+        .select_related("departamento")
+        .order_by("-similitud", "distancia_km")[:limite]
+    )
@@ -0,0 +1,161 @@
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+FILAS_POR_ENVIO = 500
+EPOCA_EXCEL = datetime(1899, 12, 30)
+CARACTERES_INVALIDOS_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+INICIO_FORMULA = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _texto(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, datetime):
+        if timezone.is_aware(valor):
+            valor = timezone.localtime(valor)
+        return valor.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(valor, str) and valor.startswith(INICIO_FORMULA):
+        return "'" + valor
+    return valor
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve lo escrito en vez de guardarlo."""
+
+    def write(self, valor):
+        return valor
+
+
+def filas_csv(encabezados, filas):
+    """
+    Genera el CSV de a una línea (con BOM para que Excel reconozca UTF-8).
+    Pensado para StreamingHttpResponse: nunca arma el archivo completo.
+    Los textos que empiezan como fórmula (=, +, -, @, tab, CR) llevan un
+    apóstrofo delante para que la planilla no los evalúe.
+    """
+    escritor = csv.writer(_Eco())
+    yield "\ufeff" + escritor.writerow(encabezados)
+    for fila in filas:
+        yield escritor.writerow([_texto(valor) for valor in fila])
+
+
+class _Salida:
+    """Destino no posicionable para ZipFile: acumula lo escrito hasta que se vacía."""
+
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b"".join(self.partes)
+        self.partes = []
+        return datos
+
+
+ARCHIVOS_XLSX = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm"/></numFmts>'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border/></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+
+
+def _celda(valor, estilo=""):
+    if valor is None or valor == "":
+        return "<c/>"
+    if isinstance(valor, bool):
+        return f'<c t="b"{estilo}><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float)):
+        return f"<c{estilo}><v>{valor!r}</v></c>"
+    if isinstance(valor, datetime):
+        if timezone.is_aware(valor):
+            valor = timezone.make_naive(timezone.localtime(valor))
+        return f'<c s="1"><v>{(valor - EPOCA_EXCEL).total_seconds() / 86400:.6f}</v></c>'
+    if isinstance(valor, date):
+        return _celda(datetime(valor.year, valor.month, valor.day))
+    texto = escape(CARACTERES_INVALIDOS_XML.sub("", str(valor)))
+    return f'<c t="inlineStr"{estilo}><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def filas_xlsx(encabezados, filas, hoja="Datos"):
+    """
+    Genera un .xlsx en memoria constante: la hoja se escribe fila a fila
+    dentro de un zip en modo streaming (textos en línea, sin sharedStrings)
+    y se entregan los bytes comprimidos cada FILAS_POR_ENVIO filas.
+    """
+    salida = _Salida()
+    with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_DEFLATED) as archivo:
+        for nombre, contenido in ARCHIVOS_XLSX.items():
+            archivo.writestr(nombre, contenido)
+        archivo.writestr("xl/workbook.xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(hoja[:31])}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ))
+        yield salida.vaciar()
+
+        with archivo.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as hoja_xml:
+            hoja_xml.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" state="frozen"/></sheetView></sheetViews>'
+                '<sheetData><row>' + "".join(_celda(e, ' s="2"') for e in encabezados) + "</row>"
+            ).encode())
+            for numero, fila in enumerate(filas, start=1):
+                hoja_xml.write(("<row>" + "".join(_celda(valor) for valor in fila) + "</row>").encode())
+                if numero % FILAS_POR_ENVIO == 0:
+                    yield salida.vaciar()
+            hoja_xml.write(b"</sheetData></worksheet>")
+    yield salida.vaciar()
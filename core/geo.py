@@ -0,0 +1,95 @@
+import math
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+PRECISION = 9
+RADIO_TIERRA_KM = 6371.0088
+MAX_CELDAS_BBOX = 32
+
+
+def geohash(latitud, longitud, precision=PRECISION):
+    """Codifica una coordenada como geohash (celdas anidadas: cada prefijo contiene a la celda)."""
+    lat_min, lat_max = -90.0, 90.0
+    lon_min, lon_max = -180.0, 180.0
+    resultado = []
+    bits = valor = 0
+    par = True
+    while len(resultado) < precision:
+        if par:
+            medio = (lon_min + lon_max) / 2
+            if longitud >= medio:
+                valor = (valor << 1) | 1
+                lon_min = medio
+            else:
+                valor <<= 1
+                lon_max = medio
+        else:
+            medio = (lat_min + lat_max) / 2
+            if latitud >= medio:
+                valor = (valor << 1) | 1
+                lat_min = medio
+            else:
+                valor <<= 1
+                lat_max = medio
+        par = not par
+        bits += 1
+        if bits == 5:
+            resultado.append(BASE32[valor])
+            bits = valor = 0
+    return "".join(resultado)
+
+
+def tamanio_celda(precision):
+    """(alto, ancho) en grados de una celda geohash de la precisión dada."""
+    bits = 5 * precision
+    bits_lon = (bits + 1) // 2
+    bits_lat = bits // 2
+    return 180.0 / (1 << bits_lat), 360.0 / (1 << bits_lon)
+
+
+def celdas_bbox(sur, oeste, norte, este, max_celdas=MAX_CELDAS_BBOX):
+    """
+    Prefijos geohash que cubren el rectángulo, con la mayor precisión que no
+    supere `max_celdas`. Filtrar por esos prefijos usa el índice B-tree;
+    el recorte exacto se hace después con latitud/longitud.
+    """
+    elegidas = [""]
+    for precision in range(1, PRECISION + 1):
+        alto, ancho = tamanio_celda(precision)
+        filas = math.floor(norte / alto) - math.floor(sur / alto) + 1
+        columnas = math.floor(este / ancho) - math.floor(oeste / ancho) + 1
+        if filas * columnas > max_celdas:
+            break
+        celdas = set()
+        for i in range(filas):
+            lat = min(sur + i * alto, norte)
+            for j in range(columnas):
+                lon = min(oeste + j * ancho, este)
+                celdas.add(geohash(lat, lon, precision))
+            celdas.add(geohash(lat, este, precision))
+        for j in range(columnas):
+            celdas.add(geohash(norte, min(oeste + j * ancho, este), precision))
+        celdas.add(geohash(norte, este, precision))
+        elegidas = sorted(celdas)
+    return elegidas
+
+
+def bbox_radio(latitud, longitud, radio_km):
+    """Rectángulo (sur, oeste, norte, este) que contiene el círculo de `radio_km`."""
+    delta_lat = math.degrees(radio_km / RADIO_TIERRA_KM)
+    coseno = max(math.cos(math.radians(latitud)), 1e-6)
+    delta_lon = min(math.degrees(radio_km / (RADIO_TIERRA_KM * coseno)), 180.0)
+    return (
+        max(latitud - delta_lat, -90.0),
+        max(longitud - delta_lon, -180.0),
+        min(latitud + delta_lat, 90.0),
+        min(longitud + delta_lon, 180.0),
+    )
+
+
+def distancia_km(lat1, lon1, lat2, lon2):
+    """Distancia del círculo máximo (haversine) en kilómetros."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dlat = p2 - p1
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dlon / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(math.sqrt(min(a, 1.0)))
@@ -0,0 +1,149 @@
+import math
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from django.template.base import Template
+
+PERCENTILES = (50, 90, 99)
+METRICAS = (
+    ("consultas", "vista_consultas", "Consultas SQL por request.", 1),
+    ("bd_ms", "vista_bd_segundos", "Tiempo en la base de datos por request.", 1000),
+    ("plantillas_ms", "vista_plantillas_segundos", "Tiempo renderizando plantillas por request.", 1000),
+    ("total_ms", "vista_duracion_segundos", "Tiempo total de la vista por request.", 1000),
+)
+
+_actual = ContextVar("medicion", default=None)
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano (sin interpolar) de una lista no vacía."""
+    ordenados = sorted(valores)
+    return ordenados[max(math.ceil(p / 100 * len(ordenados)) - 1, 0)]
+
+
+class Medicion:
+    """Lo acumulado durante un request muestreado."""
+    __slots__ = ("consultas", "bd", "plantillas", "profundidad")
+
+    def __init__(self):
+        self.consultas = 0
+        self.bd = 0.0
+        self.plantillas = 0.0
+        self.profundidad = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper: cuenta y cronometra cada consulta."""
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.bd += time.perf_counter() - inicio
+            self.consultas += 1
+
+
+def medir(funcion):
+    """
+    Ejecuta `funcion(medicion)` con una Medicion nueva activa para las
+    plantillas; `funcion` decide en qué conexiones instalarla como execute_wrapper.
+    """
+    medicion = Medicion()
+    token = _actual.set(medicion)
+    try:
+        return funcion(medicion), medicion
+    finally:
+        _actual.reset(token)
+
+
+_render_original = Template.render
+
+
+def _render_medido(self, context):
+    medicion = _actual.get()
+    if medicion is None:
+        return _render_original(self, context)
+    medicion.profundidad += 1
+    inicio = time.perf_counter()
+    try:
+        return _render_original(self, context)
+    finally:
+        medicion.profundidad -= 1
+        if not medicion.profundidad:
+            medicion.plantillas += time.perf_counter() - inicio
+
+
+def instalar():
+    """
+    Cronometra el render de plantillas (solo la plantilla exterior; los
+    include quedan dentro). Fuera de un request muestreado solo agrega una
+    lectura de ContextVar.
+    """
+    Template.render = _render_medido
+
+
+class Registro:
+    """
+    Últimas `ventana` mediciones por vista (buffer circular) más totales
+    acumulados para los contadores de Prometheus. Seguro entre hilos.
+    """
+
+    def __init__(self, ventana=1000):
+        self.ventana = ventana
+        self._lock = threading.Lock()
+        self._muestras = {}
+        self._totales = {}
+
+    def agregar(self, vista, consultas, bd_ms, plantillas_ms, total_ms):
+        fila = (consultas, bd_ms, plantillas_ms, total_ms)
+        with self._lock:
+            muestras = self._muestras.get(vista)
+            if muestras is None:
+                muestras = self._muestras[vista] = deque(maxlen=self.ventana)
+                self._totales[vista] = [0, 0.0, 0.0, 0.0, 0.0]
+            muestras.append(fila)
+            totales = self._totales[vista]
+            totales[0] += 1
+            for i, valor in enumerate(fila, start=1):
+                totales[i] += valor
+
+    def vaciar(self):
+        with self._lock:
+            self._muestras.clear()
+            self._totales.clear()
+
+    def _copia(self):
+        with self._lock:
+            return {vista: (list(m), list(self._totales[vista])) for vista, m in self._muestras.items()}
+
+    def resumen(self):
+        """Por vista: requests, y percentiles/promedio de cada métrica sobre la ventana."""
+        datos = {}
+        for vista, (muestras, totales) in sorted(self._copia().items()):
+            fila = {"requests": totales[0], "ventana": len(muestras)}
+            for i, (nombre, _, _, _) in enumerate(METRICAS):
+                valores = [m[i] for m in muestras]
+                fila[nombre] = {f"p{p}": round(percentil(valores, p), 2) for p in PERCENTILES}
+                fila[nombre]["promedio"] = round(sum(valores) / len(valores), 2)
+            datos[vista] = fila
+        return datos
+
+    def prometheus(self):
+        """Formato de texto de Prometheus: un summary por métrica con etiqueta `vista`."""
+        copia = sorted(self._copia().items())
+        lineas = []
+        for i, (_, metrica, ayuda, divisor) in enumerate(METRICAS):
+            lineas += [f"# HELP {metrica} {ayuda}", f"# TYPE {metrica} summary"]
+            for vista, (muestras, totales) in copia:
+                etiqueta = vista.replace("\\", "\\\\").replace('"', '\\"')
+                valores = [m[i] for m in muestras]
+                for p in PERCENTILES:
+                    lineas.append(
+                        f'{metrica}{{vista="{etiqueta}",quantile="{p / 100}"}} {percentil(valores, p) / divisor:g}'
+                    )
+                lineas.append(f'{metrica}_sum{{vista="{etiqueta}"}} {totales[i + 1] / divisor:g}')
+                lineas.append(f'{metrica}_count{{vista="{etiqueta}"}} {totales[0]}')
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
@@ -0,0 +1,144 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+
+from core.models import Departamento, Incidencia, JefeCuadrilla
+
+ABIERTAS = ["Pendiente", "En Progreso"]
+CERRADAS = ["Completada", "Validada", "Rechazada"]
+INDICES_NUEVOS = [
+    "incidencia_depto_estado_idx",
+    "incidencia_cuadr_estado_idx",
+    "incidencia_titulo_upper_idx",
+    "incidencia_abiertas_idx",
+]
+
+DATOS_SINTETICOS = """
+INSERT INTO {tabla} (
+    titulo, descripcion, estado, prioridad, "creadoEl", "actualizadoEl",
+    latitud, longitud, nombre_vecino, correo_vecino, telefono_vecino,
+    departamento_id, cuadrilla_id, geohash
+)
+SELECT
+    'Bench ' || i,
+    'Incidencia generada para benchmark',
+    CASE WHEN r.e < 0.12 THEN 'Pendiente' WHEN r.e < 0.20 THEN 'En Progreso'
+         WHEN r.e < 0.60 THEN 'Completada' WHEN r.e < 0.90 THEN 'Validada'
+         ELSE 'Rechazada' END,
+    (ARRAY['alta', 'media', 'baja'])[1 + i %% 3],
+    now() - make_interval(secs => r.edad),
+    now() - make_interval(secs => r.edad / 2),
+    -33.45 + r.d / 10, -70.66 + r.d / 10,
+    'Vecino', 'vecino@example.com', '+56900000000',
+    (%(departamentos)s)[1 + i %% cardinality(%(departamentos)s)],
+    (%(cuadrillas)s)[1 + (i * 7) %% cardinality(%(cuadrillas)s)],
+    ''
+FROM generate_series(1, %(filas)s) AS i,
+     LATERAL (SELECT random() AS e, random() * 3 * 365 * 86400 AS edad, random() - 0.5 AS d
+              WHERE i > 0) AS r
+"""
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera un conjunto sintético de incidencias (1M filas por defecto, "
+        "reproducible con --semilla) y compara con EXPLAIN ANALYZE las consultas "
+        "más frecuentes con y sin los índices de Incidencia. Todo ocurre dentro "
+        "de una transacción que se revierte al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--filas", type=int, default=1_000_000)
+        parser.add_argument("--departamentos", type=int, default=20)
+        parser.add_argument("--cuadrillas", type=int, default=100)
+        parser.add_argument("--semilla", type=float, default=0.42)
+        parser.add_argument("--repeticiones", type=int, default=3)
+
+    def handle(self, *args, **opts):
+        try:
+            with transaction.atomic():
+                self._generar(opts)
+                consultas = self._consultas()
+                self.stdout.write(f"{'consulta':24} {'con índices':>44} {'sin índices nuevos':>44}")
+                con = {nombre: self._explicar(qs, opts["repeticiones"]) for nombre, qs in consultas}
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        for indice in INDICES_NUEVOS:
+                            cursor.execute(f"DROP INDEX {connection.ops.quote_name(indice)}")
+                    sin = {nombre: self._explicar(qs, opts["repeticiones"]) for nombre, qs in consultas}
+                    transaction.set_rollback(True)
+                for nombre, _ in consultas:
+                    self.stdout.write(
+                        f"{nombre:24} {con[nombre][0]:10.2f} ms {con[nombre][1]:>30} "
+                        f"{sin[nombre][0]:10.2f} ms {sin[nombre][1]:>30}"
+                    )
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _generar(self, opts):
+        usuario = User.objects.create_user("bench_indices", "bench_indices@municipalidad.local", "bench")
+        departamentos = Departamento.objects.bulk_create([
+            Departamento(nombre_departamento=f"Bench {i}") for i in range(opts["departamentos"])
+        ])
+        cuadrillas = JefeCuadrilla.objects.bulk_create([
+            JefeCuadrilla(
+                nombre_cuadrilla=f"Cuadrilla bench {i}", usuario=usuario.profile,
+                departamento=departamentos[i % len(departamentos)],
+            )
+            for i in range(opts["cuadrillas"])
+        ])
+        self.departamento = departamentos[0]
+        self.cuadrilla = cuadrillas[0]
+
+        inicio = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT setseed(%s)", [opts["semilla"]])
+            cursor.execute(
+                DATOS_SINTETICOS.format(tabla=connection.ops.quote_name(Incidencia._meta.db_table)),
+                {
+                    "departamentos": [d.pk for d in departamentos],
+                    "cuadrillas": [c.pk for c in cuadrillas],
+                    "filas": opts["filas"],
+                },
+            )
+            cursor.execute(f"ANALYZE {connection.ops.quote_name(Incidencia._meta.db_table)}")
+        self.stdout.write(f"{opts['filas']} incidencias generadas en {time.perf_counter() - inicio:.1f} s")
+
+    def _consultas(self):
+        return [
+            ("departamento_pendientes",
+             Incidencia.objects.filter(departamento=self.departamento, estado="Pendiente").order_by("-creadoEl")[:25]),
+            ("cuadrilla_cerradas",
+             Incidencia.objects.filter(cuadrilla=self.cuadrilla, estado__in=CERRADAS).order_by("-actualizadoEl")[:10]),
+            ("titulo_iexact",
+             Incidencia.objects.filter(titulo__iexact="bench 500000").values("pk")[:1]),
+            ("abiertas_recientes",
+             Incidencia.objects.filter(estado__in=ABIERTAS).order_by("-creadoEl")[:50]),
+            ("conteo_departamento",
+             Incidencia.objects.filter(departamento=self.departamento).values("estado")
+             .annotate(total=Count("id")).order_by()),
+        ]
+
+    def _explicar(self, qs, repeticiones):
+        """Menor tiempo de ejecución de EXPLAIN ANALYZE y los índices que usa el plan."""
+        tiempos = []
+        for _ in range(repeticiones):
+            plan = json.loads(qs.explain(analyze=True, format="json"))[0]
+            tiempos.append(plan["Execution Time"])
+        return min(tiempos), ",".join(sorted(_indices(plan["Plan"]))) or "Seq Scan"
+
+
+def _indices(nodo):
+    encontrados = {nodo["Index Name"]} if "Index Name" in nodo else set()
+    for hijo in nodo.get("Plans", []):
+        encontrados |= _indices(hijo)
+    return encontrados
@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.rendimiento import ESCENARIOS, comparar, informe
+from core.sinteticos import PREFIJO
+
+
+class Command(BaseCommand):
+    help = (
+        "Recorre las vistas principales con el cliente de pruebas como los "
+        "usuarios de generar_datos y guarda un informe JSON con percentiles de "
+        "latencia y consultas SQL por vista, para comparar entre versiones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--salida", default="bench_vistas.json")
+        parser.add_argument("--repeticiones", type=int, default=20)
+        parser.add_argument("--prefijo", default=PREFIJO)
+        parser.add_argument("--vista", action="append", default=[],
+                            help="Medir solo los escenarios cuyo nombre contiene este texto (repetible).")
+        parser.add_argument("--comparar", help="Informe JSON anterior contra el cual mostrar diferencias.")
+
+    def handle(self, *args, **opts):
+        escenarios = [
+            e for e in ESCENARIOS if not opts["vista"] or any(v in e.nombre for v in opts["vista"])
+        ]
+        if not escenarios:
+            raise CommandError("Ningún escenario coincide con --vista.")
+        anterior = None
+        if opts["comparar"]:
+            try:
+                with open(opts["comparar"], encoding="utf-8") as archivo:
+                    anterior = json.load(archivo)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"No se pudo leer '{opts['comparar']}': {e}")
+
+        def progreso(nombre, datos):
+            self.stdout.write(
+                f"{nombre:58} {datos['estado']} consultas={datos['consultas']:>3} "
+                f"p50={datos['p50_ms']:8.1f} ms p95={datos['p95_ms']:8.1f} ms"
+            )
+
+        resultado = informe(escenarios, opts["repeticiones"], prefijo=opts["prefijo"], progreso=progreso)
+        with open(opts["salida"], "w", encoding="utf-8") as archivo:
+            json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f"Informe guardado en {opts['salida']}."))
+
+        if anterior:
+            self.stdout.write(f"\n{'vista':58} {'consultas':>13} {'p50 ms':>21}")
+            for nombre, c_antes, c_ahora, p_antes, p_ahora in comparar(anterior, resultado):
+                self.stdout.write(
+                    f"{nombre:58} {_valor(c_antes):>5} -> {c_ahora:<5} {_valor(p_antes):>9} -> {p_ahora:<9}"
+                )
+
+
+def _valor(valor):
+    return "-" if valor is None else valor
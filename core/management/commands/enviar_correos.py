@@ -0,0 +1,56 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from core import correos
+
+
+def _enviar(lote, max_intentos):
+    try:
+        return correos.enviar_lote(lote, max_intentos)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Despacha la bandeja de salida de notificaciones (CorreoPendiente) "
+        "en lotes, con un grupo de hilos y reintentos con espera exponencial."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hilos", type=int, default=4)
+        parser.add_argument("--lote", type=int, default=50, help="Correos por conexión SMTP.")
+        parser.add_argument("--max-intentos", type=int, default=5)
+        parser.add_argument(
+            "--continuo", action="store_true",
+            help="No terminar al vaciar la cola; volver a revisarla cada --intervalo segundos.",
+        )
+        parser.add_argument("--intervalo", type=float, default=5)
+
+    def handle(self, *args, **opts):
+        hilos, lote = opts["hilos"], opts["lote"]
+        enviados = fallidos = 0
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            while True:
+                close_old_connections()
+                correos.liberar_correos_colgados(minutos=30, max_intentos=opts["max_intentos"])
+                reclamados = correos.reclamar_correos(hilos * lote)
+                if not reclamados:
+                    if not opts["continuo"]:
+                        break
+                    time.sleep(opts["intervalo"])
+                    continue
+
+                lotes = [reclamados[i:i + lote] for i in range(0, len(reclamados), lote)]
+                for resultado in pool.map(lambda l: _enviar(l, opts["max_intentos"]), lotes):
+                    for correo in resultado:
+                        if correo.estado == "enviado":
+                            enviados += 1
+                        else:
+                            fallidos += 1
+                            self.stderr.write(f"Correo {correo.pk} ({correo.estado}): {correo.ultimo_error}")
+
+        self.stdout.write(self.style.SUCCESS(f"Correos enviados: {enviados} (fallidos: {fallidos})"))
@@ -0,0 +1,62 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.sinteticos import PREFIJO, ROLES, escala, generar, usuario
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera datos sintéticos realistas (direcciones, departamentos, cuadrillas, "
+        "encuestas con preguntas y respuestas, incidencias y evidencias) con "
+        "bulk_create, a escala configurable (10k a 5M incidencias). Crea además "
+        "un usuario por rol (incluido un administrador) para recorrer el sistema "
+        "y para bench_vistas. Solo corre con DEBUG activo, salvo con --forzar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--incidencias", type=int, default=10_000)
+        parser.add_argument("--semilla", type=int, default=0,
+                            help="Con la misma semilla se generan los mismos datos.")
+        parser.add_argument("--prefijo", default=PREFIJO,
+                            help="Prefijo de los usuarios creados (debe no estar en uso).")
+        parser.add_argument("--lote", type=int, default=5_000)
+        parser.add_argument("--simular", action="store_true",
+                            help="Solo muestra cuántas filas se crearían.")
+        parser.add_argument("--contrasena", default=os.getenv("DJANGO_SINTETICOS_CONTRASENA"),
+                            help="Contraseña de los usuarios creados (o DJANGO_SINTETICOS_CONTRASENA). "
+                                 "Sin ella no pueden iniciar sesión.")
+        parser.add_argument("--forzar", action="store_true",
+                            help="Permite generar datos con DEBUG desactivado.")
+
+    def handle(self, *args, **opts):
+        if opts["incidencias"] < 1:
+            raise CommandError("--incidencias debe ser mayor que cero.")
+        if opts["simular"]:
+            for modelo, cantidad in escala(opts["incidencias"]).items():
+                self.stdout.write(f"{modelo:28} {cantidad:>9}")
+            return
+        if not settings.DEBUG and not opts["forzar"]:
+            raise CommandError(
+                "DEBUG está desactivado: esta base parece de producción y el comando crea "
+                "un administrador. Usa --forzar si de verdad quieres generar datos aquí."
+            )
+
+        inicio = time.monotonic()
+        try:
+            creados = generar(
+                opts["incidencias"], semilla=opts["semilla"], prefijo=opts["prefijo"],
+                lote=opts["lote"], progreso=self.stdout.write, contrasena=opts["contrasena"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for modelo, cantidad in creados.items():
+            self.stdout.write(f"{modelo:14} {cantidad:>9}")
+        acceso = "con la contraseña indicada" if opts["contrasena"] else "sin contraseña utilizable"
+        self.stdout.write(self.style.SUCCESS(
+            f"Datos generados en {time.monotonic() - inicio:.1f} s. Usuarios "
+            f"{', '.join(usuario(rol, prefijo=opts['prefijo']) for rol in ROLES)} ({acceso})."
+        ))
@@ -0,0 +1,30 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import CargaEvidencia
+
+
+class Command(BaseCommand):
+    help = "Elimina las subidas por partes abandonadas y sus archivos parciales."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--horas", type=int, default=getattr(settings, "CARGA_HORAS_EXPIRACION", 24),
+            help="Antigüedad mínima (desde el último trozo recibido) para considerar abandonada una carga.",
+        )
+
+    def handle(self, *args, **opts):
+        limite = timezone.now() - timedelta(hours=opts["horas"])
+        vencidas = CargaEvidencia.objects.filter(multimedia__isnull=True, actualizadoEl__lt=limite)
+        total = 0
+        for carga in vencidas.iterator():
+            ruta = carga.ruta_parcial()
+            if os.path.exists(ruta):
+                os.remove(ruta)
+            carga.delete()
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f"Cargas abandonadas eliminadas: {total}"))
@@ -0,0 +1,72 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from django.db.models import Q
+
+from core import derivados
+from core.models import Multimedia, TrabajoDerivado
+
+
+def _procesar(trabajo, max_intentos):
+    try:
+        return derivados.procesar(trabajo, max_intentos)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera miniaturas, vistas previas y portadas de video para las "
+        "evidencias en cola, usando un grupo de hilos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hilos", type=int, default=4)
+        parser.add_argument("--lote", type=int, default=20)
+        parser.add_argument("--max-intentos", type=int, default=3)
+        parser.add_argument(
+            "--continuo", action="store_true",
+            help="No terminar al vaciar la cola; volver a revisarla cada --intervalo segundos.",
+        )
+        parser.add_argument("--intervalo", type=float, default=5)
+        parser.add_argument(
+            "--encolar-existentes", action="store_true",
+            help="Encola las imágenes y videos que aún no tienen miniatura.",
+        )
+
+    def handle(self, *args, **opts):
+        if opts["encolar_existentes"]:
+            self._encolar_existentes()
+
+        procesados = errores = 0
+        with ThreadPoolExecutor(max_workers=opts["hilos"]) as pool:
+            while True:
+                close_old_connections()
+                derivados.liberar_trabajos_colgados(minutos=30, max_intentos=opts["max_intentos"])
+                trabajos = derivados.reclamar_trabajos(opts["lote"])
+                if not trabajos:
+                    if not opts["continuo"]:
+                        break
+                    time.sleep(opts["intervalo"])
+                    continue
+
+                for trabajo in pool.map(lambda t: _procesar(t, opts["max_intentos"]), trabajos):
+                    procesados += 1
+                    if trabajo.estado == "error":
+                        errores += 1
+                        self.stderr.write(f"Evidencia {trabajo.multimedia_id}: {trabajo.ultimo_error}")
+
+        self.stdout.write(self.style.SUCCESS(f"Trabajos procesados: {procesados} (con error: {errores})"))
+
+    def _encolar_existentes(self):
+        pendientes = (
+            Multimedia.objects.filter(tipo__in=derivados.TIPOS_CON_DERIVADOS)
+            .filter(Q(miniatura__isnull=True) | Q(miniatura=""))
+            .exclude(trabajos_derivados__estado__in=["pendiente", "procesando"])
+        )
+        nuevos = TrabajoDerivado.objects.bulk_create(
+            [TrabajoDerivado(multimedia=m) for m in pendientes.only("pk")]
+        )
+        self.stdout.write(f"Evidencias encoladas: {len(nuevos)}")
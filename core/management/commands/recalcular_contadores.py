@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from core.analitica import avance_encuesta
+from core.models import Incidencia, ContadorIncidencias, Encuesta
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruye la tabla de contadores de incidencias por departamento y estado, "
+        "y el avance de respuesta guardado en cada encuesta."
+    )
+
+    def handle(self, *args, **kwargs):
+        filas = (
+            Incidencia.objects.values("departamento_id", "estado")
+            .annotate(total=Count("id"))
+            .order_by()
+        )
+        with transaction.atomic():
+            ContadorIncidencias.objects.all().delete()
+            ContadorIncidencias.objects.bulk_create([
+                ContadorIncidencias(departamento_id=f["departamento_id"], estado=f["estado"], total=f["total"])
+                for f in filas
+            ])
+            Encuesta.objects.update(**avance_encuesta())
+        self.stdout.write(self.style.SUCCESS("Contadores de incidencias y avance de encuestas recalculados."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from core.analitica import actualizar_resumen
+from core.models import PreguntaEncuesta
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula los resultados agregados de todas las preguntas de encuesta "
+        "(necesario tras cargas masivas de respuestas que no disparan señales)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--encuesta", type=int, default=None, help="Solo las preguntas de esta encuesta.")
+
+    def handle(self, *args, **opts):
+        preguntas = PreguntaEncuesta.objects.order_by("pk")
+        if opts["encuesta"]:
+            preguntas = preguntas.filter(encuesta_id=opts["encuesta"])
+        total = 0
+        for pregunta_id in preguntas.values_list("pk", flat=True).iterator():
+            actualizar_resumen(pregunta_id)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f"Resultados recalculados para {total} preguntas."))
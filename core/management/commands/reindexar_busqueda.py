@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import busqueda
+from core.models import Departamento
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula los vectores de búsqueda de texto completo de incidencias y "
+        "encuestas (necesario tras cargas masivas con bulk_create o update)."
+    )
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            incidencias = busqueda.indexar_incidencias()
+            encuestas = sum(busqueda.indexar_encuestas(d) for d in Departamento.objects.all())
+        self.stdout.write(self.style.SUCCESS(
+            f"Índice de búsqueda actualizado: {incidencias} incidencias, {encuestas} encuestas."
+        ))
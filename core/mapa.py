@@ -0,0 +1,86 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import geo
+
+MAX_ZOOM = 18
+CELDAS_POR_TILE = 8
+CLAVE_GENERACION = "mapa:generacion"
+CACHES_POR_PROCESO = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+MAPA_CACHE_TIMEOUT_LOCAL = getattr(settings, "MAPA_CACHE_TIMEOUT_LOCAL", 15)
+
+
+def _cache_timeout():
+    """
+    Las versiones de tile viven en la caché por defecto. Si es de un solo
+    proceso (LocMem), una invalidación no llega a los demás workers, así que
+    los tiles duran a lo más MAPA_CACHE_TIMEOUT_LOCAL segundos; el TTL largo
+    (MAPA_CACHE_TIMEOUT) solo se usa con una caché compartida (Redis, Memcached, BD).
+    """
+    timeout = getattr(settings, "MAPA_CACHE_TIMEOUT", 300)
+    if settings.CACHES["default"]["BACKEND"] in CACHES_POR_PROCESO:
+        return min(timeout, MAPA_CACHE_TIMEOUT_LOCAL)
+    return timeout
+
+
+MAPA_CACHE_TIMEOUT = _cache_timeout()
+
+
+def tile_de(latitud, longitud, z):
+    """Tile (x, y) de Web Mercator que contiene la coordenada en el zoom `z`."""
+    n = 1 << z
+    latitud = max(min(latitud, 85.05112878), -85.05112878)
+    x = int((longitud + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(latitud))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def bbox_tile(z, x, y):
+    """(sur, oeste, norte, este) del tile."""
+    n = 1 << z
+
+    def lat(fila):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * fila / n))))
+
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+def precision_para_zoom(z):
+    """Precisión de geohash cuyas celdas dan unas CELDAS_POR_TILE columnas por tile."""
+    ancho_objetivo = 360.0 / (1 << z) / CELDAS_POR_TILE
+    for precision in range(1, geo.PRECISION + 1):
+        if geo.tamanio_celda(precision)[1] <= ancho_objetivo:
+            return precision
+    return geo.PRECISION
+
+
+def _clave_version(z, x, y):
+    return f"mapa:v:{z}:{x}:{y}"
+
+
+def version_tile(z, x, y):
+    """Versión actual del tile; cambia cuando una incidencia dentro de él se crea, mueve o cambia."""
+    valores = cache.get_many([CLAVE_GENERACION, _clave_version(z, x, y)])
+    return f"{valores.get(CLAVE_GENERACION, 0)}.{valores.get(_clave_version(z, x, y), 0)}"
+
+
+def invalidar_punto(latitud, longitud):
+    """Cambia la versión de los tiles que contienen el punto, en todos los zoom."""
+    if latitud is None or longitud is None:
+        return
+    marca = time.time_ns()
+    cache.set_many(
+        {_clave_version(z, *tile_de(latitud, longitud, z)): marca for z in range(MAX_ZOOM + 1)},
+        timeout=None,
+    )
+
+
+def invalidar_todo():
+    """Invalida todos los tiles (p. ej. tras cargas masivas que no disparan señales)."""
+    cache.set(CLAVE_GENERACION, time.time_ns(), timeout=None)
@@ -0,0 +1,117 @@
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from . import instrumentacion
+from .utils import presupuesto_de, roles_en_sesion
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentacionMiddleware:
+    """
+    Registra por nombre de URL (p. ej. incidencias:incidencias_lista) las
+    consultas SQL, el tiempo en base de datos, en plantillas y total de una
+    fracción INSTRUMENTACION_MUESTREO de los requests, en core.instrumentacion.registro.
+    Con muestreo 0 el middleware se desactiva y no agrega ningún costo.
+    Las respuestas en streaming (exportaciones) se registran al cerrarse su
+    contenido, con las consultas que se hacen mientras se recorre.
+    """
+
+    def __init__(self, get_response):
+        self.muestreo = getattr(settings, "INSTRUMENTACION_MUESTREO", 0)
+        if self.muestreo <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        instrumentacion.registro.ventana = getattr(settings, "INSTRUMENTACION_VENTANA", 1000)
+        instrumentacion.instalar()
+
+    def __call__(self, request):
+        if self.muestreo < 1 and random.random() >= self.muestreo:
+            return self.get_response(request)
+        inicio = time.perf_counter()
+
+        def atender(medicion):
+            with connection.execute_wrapper(medicion):
+                return self.get_response(request)
+
+        respuesta, medicion = instrumentacion.medir(atender)
+        coincidencia = getattr(request, "resolver_match", None)
+        if coincidencia is None:
+            return respuesta
+
+        def registrar():
+            instrumentacion.registro.agregar(
+                coincidencia.view_name,
+                medicion.consultas,
+                medicion.bd * 1000,
+                medicion.plantillas * 1000,
+                (time.perf_counter() - inicio) * 1000,
+            )
+
+        if respuesta.streaming and not respuesta.is_async:
+            respuesta.streaming_content = self._recorrer_medido(respuesta.streaming_content, medicion, registrar)
+        else:
+            registrar()
+        return respuesta
+
+    @staticmethod
+    def _recorrer_medido(contenido, medicion, registrar):
+        try:
+            with connection.execute_wrapper(medicion):
+                yield from contenido
+        finally:
+            registrar()
+
+
+class PresupuestoConsultasMiddleware:
+    """
+    Solo con DEBUG: cuenta las consultas de cada request y registra un aviso
+    si la vista tiene presupuesto (utils.presupuesto_consultas) y lo supera.
+    Sin DEBUG no se carga. Conviene ponerlo antes de sesiones y autenticación
+    para que cuente lo mismo que las pruebas.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        consultas = 0
+
+        def contar(execute, sql, params, many, context):
+            nonlocal consultas
+            consultas += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(contar):
+            respuesta = self.get_response(request)
+        coincidencia = getattr(request, "resolver_match", None)
+        maximo = presupuesto_de(coincidencia.func) if coincidencia else None
+        if maximo is not None and consultas > maximo:
+            logger.warning(
+                "%s hizo %d consultas SQL (presupuesto: %d) en %s",
+                coincidencia.view_name, consultas, maximo, request.get_full_path(),
+            )
+        return respuesta
+
+
+class RolesMiddleware:
+    """
+    Deja listos los roles del usuario desde su sesión (ver roles_en_sesion),
+    así roles_de no consulta auth_group en cada request. Debe ir después de
+    AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.user.is_authenticated:
+            roles_en_sesion(request.session, request.user)
+        return self.get_response(request)
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_alter_multimedia_incidencia'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='incidencia',
+            index=models.Index(fields=['creadoEl', 'id'], name='incidencia_creado_id_idx'),
+        ),
+    ]
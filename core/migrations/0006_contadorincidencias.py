@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def poblar_contadores(apps, schema_editor):
+    Incidencia = apps.get_model('core', 'Incidencia')
+    ContadorIncidencias = apps.get_model('core', 'ContadorIncidencias')
+    filas = (
+        Incidencia.objects.values('departamento_id', 'estado')
+        .annotate(total=models.Count('id'))
+        .order_by()
+    )
+    ContadorIncidencias.objects.bulk_create([
+        ContadorIncidencias(departamento_id=f['departamento_id'], estado=f['estado'], total=f['total'])
+        for f in filas
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_incidencia_creado_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorIncidencias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('Pendiente', 'Pendiente'), ('En Progreso', 'En Progreso'), ('Completada', 'Completada'), ('Rechazada', 'Rechazada'), ('Validada', 'Validada')], max_length=50)),
+                ('total', models.IntegerField(default=0)),
+                ('departamento', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='contadores', to='core.departamento')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('departamento__isnull', False)), fields=('departamento', 'estado'), name='contador_departamento_estado_uq'), models.UniqueConstraint(condition=models.Q(('departamento__isnull', True)), fields=('estado',), name='contador_sin_departamento_estado_uq')],
+            },
+        ),
+        migrations.RunPython(poblar_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:39
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_contadorincidencias'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CargaEvidencia',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nombre', models.CharField(max_length=100)),
+                ('nombre_archivo', models.CharField(max_length=255)),
+                ('tamanio_total', models.BigIntegerField()),
+                ('recibidos', models.BigIntegerField(default=0)),
+                ('creadoEl', models.DateTimeField(auto_now_add=True)),
+                ('actualizadoEl', models.DateTimeField(auto_now=True)),
+                ('encuesta', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.encuesta')),
+                ('incidencia', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.incidencia')),
+                ('multimedia', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.multimedia')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cargas_evidencia', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
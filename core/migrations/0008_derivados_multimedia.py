@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_cargaevidencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='multimedia',
+            name='miniatura',
+            field=models.FileField(blank=True, null=True, upload_to='evidencias/derivados/%Y/%m/%d/'),
+        ),
+        migrations.AddField(
+            model_name='multimedia',
+            name='vista_previa',
+            field=models.FileField(blank=True, null=True, upload_to='evidencias/derivados/%Y/%m/%d/'),
+        ),
+        migrations.CreateModel(
+            name='TrabajoDerivado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=20)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('ultimo_error', models.TextField(blank=True, default='')),
+                ('creadoEl', models.DateTimeField(auto_now_add=True)),
+                ('actualizadoEl', models.DateTimeField(auto_now=True)),
+                ('multimedia', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trabajos_derivados', to='core.multimedia')),
+            ],
+            options={
+                'ordering': ['creadoEl'],
+                'indexes': [models.Index(fields=['estado', 'creadoEl'], name='trabajo_derivado_estado_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:43
+
+import core.almacenamiento
+import django.core.validators
+from django.db import migrations, models
+
+
+def poblar_referencias(apps, schema_editor):
+    Multimedia = apps.get_model('core', 'Multimedia')
+    ArchivoEvidencia = apps.get_model('core', 'ArchivoEvidencia')
+    filas = (
+        Multimedia.objects.exclude(archivo='')
+        .values('archivo')
+        .annotate(total=models.Count('id'))
+        .order_by()
+    )
+    ArchivoEvidencia.objects.bulk_create([
+        ArchivoEvidencia(ruta=f['archivo'], referencias=f['total'])
+        for f in filas
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_derivados_multimedia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivoEvidencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ruta', models.CharField(max_length=255, unique=True)),
+                ('referencias', models.PositiveIntegerField(default=0)),
+                ('creadoEl', models.DateTimeField(auto_now_add=True)),
+                ('actualizadoEl', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='multimedia',
+            name='archivo',
+            field=models.FileField(storage=core.almacenamiento.AlmacenamientoDeduplicado(), upload_to='evidencias/%Y/%m/%d/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'gif', 'webp', 'mp4', 'mpeg', 'avi', 'mov', 'mp3', 'wav', 'ogg', 'm4a', 'pdf', 'doc', 'docx', 'txt'])]),
+        ),
+        migrations.RunPython(poblar_referencias, migrations.RunPython.noop),
+    ]
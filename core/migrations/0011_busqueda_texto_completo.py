@@ -0,0 +1,53 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:46
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import Value
+
+
+def poblar_busqueda(apps, schema_editor):
+    Incidencia = apps.get_model('core', 'Incidencia')
+    Encuesta = apps.get_model('core', 'Encuesta')
+    Departamento = apps.get_model('core', 'Departamento')
+    Incidencia.objects.update(busqueda=(
+        SearchVector('titulo', weight='A', config='spanish')
+        + SearchVector('descripcion', weight='B', config='spanish')
+        + SearchVector('nombre_vecino', weight='C', config='spanish')
+    ))
+    for departamento in Departamento.objects.all():
+        Encuesta.objects.filter(departamento=departamento).update(busqueda=(
+            SearchVector('titulo', weight='A', config='spanish')
+            + SearchVector('descripcion', weight='B', config='spanish')
+            + SearchVector(Value(departamento.nombre_departamento or ''), weight='C', config='spanish')
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_correopendiente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='encuesta',
+            name='busqueda',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='incidencia',
+            name='busqueda',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='encuesta',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['busqueda'], name='encuesta_busqueda_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='incidencia',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['busqueda'], name='incidencia_busqueda_gin'),
+        ),
+        migrations.RunPython(poblar_busqueda, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+CAMPOS = ['username', 'first_name', 'last_name', 'email']
+
+
+def crear_indices():
+    sentencias = []
+    for campo in CAMPOS:
+        sentencias.append(
+            f'CREATE INDEX IF NOT EXISTS usuario_{campo}_trgm '
+            f'ON auth_user USING gin ({campo} gin_trgm_ops);'
+        )
+        sentencias.append(
+            f'CREATE INDEX IF NOT EXISTS usuario_{campo}_upper_trgm '
+            f'ON auth_user USING gin (UPPER({campo}::text) gin_trgm_ops);'
+        )
+    return sentencias
+
+
+def borrar_indices():
+    sentencias = []
+    for campo in CAMPOS:
+        sentencias.append(f'DROP INDEX IF EXISTS usuario_{campo}_trgm;')
+        sentencias.append(f'DROP INDEX IF EXISTS usuario_{campo}_upper_trgm;')
+    return sentencias
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0011_busqueda_texto_completo'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(crear_indices(), borrar_indices()),
+    ]
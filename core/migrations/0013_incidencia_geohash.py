@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:49
+
+from django.db import migrations, models
+
+from core.geo import geohash
+
+
+def poblar_geohash(apps, schema_editor):
+    Incidencia = apps.get_model('core', 'Incidencia')
+    lote = []
+    for incidencia in Incidencia.objects.only('id', 'latitud', 'longitud').iterator(chunk_size=2000):
+        incidencia.geohash = geohash(incidencia.latitud, incidencia.longitud)
+        lote.append(incidencia)
+        if len(lote) >= 2000:
+            Incidencia.objects.bulk_update(lote, ['geohash'])
+            lote = []
+    if lote:
+        Incidencia.objects.bulk_update(lote, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_usuarios_trigramas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='incidencia',
+            name='geohash',
+            field=models.CharField(blank=True, db_collation='C', default='', editable=False, max_length=12),
+        ),
+        migrations.AddIndex(
+            model_name='incidencia',
+            index=models.Index(fields=['geohash'], name='incidencia_geohash_idx'),
+        ),
+        migrations.RunPython(poblar_geohash, migrations.RunPython.noop),
+    ]
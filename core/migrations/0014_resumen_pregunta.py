@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_incidencia_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenPregunta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('datos', models.JSONField(default=dict)),
+                ('actualizadoEl', models.DateTimeField(auto_now=True)),
+                ('pregunta', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='resumen', to='core.preguntaencuesta')),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:20
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_resumen_pregunta'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='incidencia',
+            index=models.Index(fields=['departamento', 'estado', 'creadoEl'], name='incidencia_depto_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incidencia',
+            index=models.Index(fields=['cuadrilla', 'estado', 'actualizadoEl'], name='incidencia_cuadr_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incidencia',
+            index=models.Index(django.db.models.functions.text.Upper('titulo'), name='incidencia_titulo_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incidencia',
+            index=models.Index(condition=models.Q(('estado__in', ['Pendiente', 'En Progreso'])), fields=['creadoEl'], name='incidencia_abiertas_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:35
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def poblar_avance(apps, schema_editor):
+    Encuesta = apps.get_model('core', 'Encuesta')
+    PreguntaEncuesta = apps.get_model('core', 'PreguntaEncuesta')
+    RespuestaEncuesta = apps.get_model('core', 'RespuestaEncuesta')
+    preguntas = PreguntaEncuesta.objects.filter(encuesta=models.OuterRef('pk')).order_by().values('encuesta')
+    respondidas = preguntas.filter(models.Exists(RespuestaEncuesta.objects.filter(pregunta=models.OuterRef('pk'))))
+
+    def contar(qs):
+        return Coalesce(models.Subquery(qs.annotate(n=models.Count('pk')).values('n')), models.Value(0))
+
+    Encuesta.objects.update(total_preguntas=contar(preguntas), preguntas_respondidas=contar(respondidas))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_incidencia_indices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='encuesta',
+            name='preguntas_respondidas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='encuesta',
+            name='total_preguntas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(poblar_avance, migrations.RunPython.noop),
+    ]
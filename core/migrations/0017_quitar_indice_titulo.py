@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 22:09
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_encuesta_avance'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='incidencia',
+            name='incidencia_titulo_upper_idx',
+        ),
+    ]
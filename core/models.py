@@ -1,6 +1,18 @@
-from django.db import models
+import os
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+from django.utils import timezone
 from registration.models import Profile
 from django.core.validators import FileExtensionValidator                                                          
+from .almacenamiento import AlmacenamientoDeduplicado
+from . import busqueda, geo
 
 class Perfil(models.Model):
     rol = models.CharField(max_length=50)
@@ -51,10 +63,49 @@ class Encuesta(models.Model):
     prioridad = models.CharField(max_length=50, choices=PRIORIDAD_CHOICES)
     departamento = models.ForeignKey(Departamento, on_delete=models.CASCADE)
     tipo_incidencia = models.ForeignKey('TipoIncidencia', on_delete=models.SET_NULL, null=True, blank=True)
+    busqueda = SearchVectorField(null=True, editable=False)
+    total_preguntas = models.PositiveIntegerField(default=0, editable=False)
+    preguntas_respondidas = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['busqueda'], name='encuesta_busqueda_gin'),
+        ]
 
     def __str__(self):
         return self.titulo
 
+    CAMPOS_AVANCE = ('total_preguntas', 'preguntas_respondidas')
+
+    def save(self, *args, **kwargs):
+        """
+        Un save completo de una encuesta existente no escribe CAMPOS_AVANCE:
+        los mantiene signals.tocar_encuesta y los valores cargados con la
+        instancia pueden estar atrasados respecto de una respuesta reciente.
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            update_fields = kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in self.CAMPOS_AVANCE
+            ]
+        campos = set(busqueda.CAMPOS_ENCUESTA) | {'departamento'}
+        if update_fields is None or campos & set(update_fields):
+            nombre = self.departamento.nombre_departamento if self.departamento_id else ""
+            self.busqueda = busqueda.vector_encuesta(nombre, self)
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'busqueda'}
+        super().save(*args, **kwargs)
+
+    @property
+    def completa(self):
+        """Todas sus preguntas tienen respuesta. Usa los contadores guardados, sin consultas."""
+        return self.preguntas_respondidas >= self.total_preguntas
+
+    @property
+    def preguntas_pendientes(self):
+        return max(self.total_preguntas - self.preguntas_respondidas, 0)
+
 
 class PreguntaEncuesta(models.Model):
     texto_pregunta = models.CharField(max_length=200)
@@ -92,6 +143,7 @@ class Multimedia(models.Model):
     nombre = models.CharField(max_length=100)
     archivo = models.FileField(
         upload_to='evidencias/%Y/%m/%d/',
+        storage=AlmacenamientoDeduplicado(),
         validators=[
             FileExtensionValidator(
                 allowed_extensions=[
@@ -106,6 +158,8 @@ class Multimedia(models.Model):
     tipo = models.CharField(max_length=50, choices=TIPO_CHOICES)
     formato = models.CharField(max_length=50)
     tamanio = models.IntegerField(help_text="Tamaño en bytes", null=True, blank=True)
+    miniatura = models.FileField(upload_to='evidencias/derivados/%Y/%m/%d/', null=True, blank=True)
+    vista_previa = models.FileField(upload_to='evidencias/derivados/%Y/%m/%d/', null=True, blank=True)
     creadoEl = models.DateTimeField(auto_now_add=True)
     
                                                   
@@ -133,6 +187,36 @@ class Multimedia(models.Model):
     def __str__(self):
         return f"{self.nombre} ({self.tipo})"
     
+    EXTENSIONES_POR_TIPO = {
+        'imagen': ['jpg', 'jpeg', 'png', 'gif', 'webp'],
+        'video': ['mp4', 'mpeg', 'avi', 'mov'],
+        'audio': ['mp3', 'wav', 'ogg', 'm4a'],
+        'documento': ['pdf', 'doc', 'docx', 'txt'],
+    }
+
+    @classmethod
+    def detectar_tipo(cls, nombre_archivo):
+        """Tipo de evidencia según la extensión del archivo"""
+        ext = nombre_archivo.rsplit('.', 1)[-1].lower()
+        for tipo, extensiones in cls.EXTENSIONES_POR_TIPO.items():
+            if ext in extensiones:
+                return tipo
+        return 'otro'
+
+    @property
+    def url_miniatura(self):
+        """Miniatura si ya fue generada; si no, el original en imágenes."""
+        if self.miniatura:
+            return self.miniatura.url
+        return self.archivo.url if self.tipo == 'imagen' and self.archivo else None
+
+    @property
+    def url_vista_previa(self):
+        """Versión web (imagen) o fotograma de portada (video), si existe."""
+        if self.vista_previa:
+            return self.vista_previa.url
+        return self.archivo.url if self.tipo == 'imagen' and self.archivo else None
+
     def get_icono(self):
         """Retorna el icono a mostrar según el tipo de archivo"""
         iconos = {
@@ -145,6 +229,124 @@ class Multimedia(models.Model):
         return iconos.get(self.tipo, '📎')
 
 
+class ArchivoEvidencia(models.Model):
+    """
+    Archivo físico de evidencia y cuántas filas Multimedia lo usan.
+    Con el almacenamiento deduplicado varias evidencias pueden compartir el
+    mismo archivo; se borra del disco cuando la última deja de usarlo.
+    """
+    ruta = models.CharField(max_length=255, unique=True)
+    referencias = models.PositiveIntegerField(default=0)
+    creadoEl = models.DateTimeField(auto_now_add=True)
+    actualizadoEl = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.ruta} ({self.referencias})"
+
+
+class CargaEvidencia(models.Model):
+    """
+    Subida de evidencia por partes (reanudable).
+    Los bytes se van escribiendo en un archivo parcial bajo MEDIA_ROOT/evidencias/
+    y, al finalizar, el archivo se mueve a su ubicación definitiva y se crea
+    el registro Multimedia.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='cargas_evidencia')
+    incidencia = models.ForeignKey('Incidencia', on_delete=models.CASCADE, null=True, blank=True)
+    encuesta = models.ForeignKey('Encuesta', on_delete=models.CASCADE, null=True, blank=True)
+    nombre = models.CharField(max_length=100)
+    nombre_archivo = models.CharField(max_length=255)
+    tamanio_total = models.BigIntegerField()
+    recibidos = models.BigIntegerField(default=0)
+    multimedia = models.OneToOneField(Multimedia, on_delete=models.SET_NULL, null=True, blank=True)
+    creadoEl = models.DateTimeField(auto_now_add=True)
+    actualizadoEl = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.nombre_archivo} ({self.recibidos}/{self.tamanio_total})"
+
+    @property
+    def completa(self):
+        return self.recibidos >= self.tamanio_total
+
+    def ruta_parcial(self):
+        return os.path.join(settings.MEDIA_ROOT, 'evidencias', 'parciales', f'{self.pk}.part')
+
+
+class TrabajoDerivado(models.Model):
+    """
+    Cola (en base de datos) de miniaturas y vistas previas pendientes de
+    generar para una evidencia. La procesa el comando procesar_derivados.
+    """
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+    ]
+
+    multimedia = models.ForeignKey(Multimedia, on_delete=models.CASCADE, related_name='trabajos_derivados')
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    ultimo_error = models.TextField(blank=True, default='')
+    creadoEl = models.DateTimeField(auto_now_add=True)
+    actualizadoEl = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['creadoEl']
+        indexes = [models.Index(fields=['estado', 'creadoEl'], name='trabajo_derivado_estado_idx')]
+
+    def __str__(self):
+        return f"Derivados de {self.multimedia_id} ({self.estado})"
+
+
+class CorreoPendiente(models.Model):
+    """
+    Bandeja de salida de notificaciones. Las vistas solo insertan la fila;
+    el comando enviar_correos las despacha con reintentos.
+    """
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('enviando', 'Enviando'),
+        ('enviado', 'Enviado'),
+        ('error', 'Error'),
+    ]
+
+    asunto = models.CharField(max_length=255)
+    cuerpo = models.TextField()
+    remitente = models.CharField(max_length=254, blank=True, default='')
+    destinatarios = models.JSONField(default=list)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True, default='')
+    creadoEl = models.DateTimeField(auto_now_add=True)
+    enviadoEl = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['creadoEl']
+        indexes = [models.Index(fields=['estado', 'proximo_intento'], name='correo_estado_proximo_idx')]
+
+    def __str__(self):
+        return f"{self.asunto} ({self.estado})"
+
+
+class ResumenPregunta(models.Model):
+    """
+    Resultados agregados de una pregunta (conteo por opción, estadísticas
+    numéricas o términos frecuentes). core.analitica los recalcula cuando
+    cambian sus respuestas, así la página de resultados solo los lee.
+    """
+    pregunta = models.OneToOneField(PreguntaEncuesta, on_delete=models.CASCADE, related_name='resumen')
+    total = models.PositiveIntegerField(default=0)
+    datos = models.JSONField(default=dict)
+    actualizadoEl = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Resumen de {self.pregunta_id} ({self.total})"
+
+
 class TipoIncidencia(models.Model):
     nombre_problema = models.CharField(max_length=100)
     descripcion = models.TextField()
@@ -171,6 +373,75 @@ class JefeCuadrilla(models.Model):
         return self.nombre_cuadrilla
 
                                                   
+class IncidenciaQuerySet(models.QuerySet):
+    """Consultas espaciales sobre latitud/longitud apoyadas en el índice de `geohash`."""
+
+    def en_bbox(self, sur, oeste, norte, este):
+        prefijos = Q()
+        for celda in geo.celdas_bbox(sur, oeste, norte, este):
+            prefijos |= Q(geohash__startswith=celda)
+        return self.filter(
+            prefijos,
+            latitud__gte=sur, latitud__lte=norte,
+            longitud__gte=oeste, longitud__lte=este,
+        )
+
+    def con_distancia(self, latitud, longitud):
+        """Anota `distancia_km` (haversine) desde el punto dado."""
+        lat0 = Radians(Value(float(latitud)))
+        dlat = Radians(F("latitud") - Value(float(latitud))) / Value(2.0)
+        dlon = Radians(F("longitud") - Value(float(longitud))) / Value(2.0)
+        a = Power(Sin(dlat), 2) + Cos(lat0) * Cos(Radians(F("latitud"))) * Power(Sin(dlon), 2)
+        return self.annotate(
+            distancia_km=Value(2 * geo.RADIO_TIERRA_KM) * ASin(Sqrt(a)),
+        )
+
+    def en_radio(self, latitud, longitud, radio_km):
+        """Incidencias a `radio_km` o menos del punto, con `distancia_km`."""
+        return (
+            self.en_bbox(*geo.bbox_radio(latitud, longitud, radio_km))
+            .con_distancia(latitud, longitud)
+            .filter(distancia_km__lte=radio_km)
+        )
+
+    def mas_cercanas(self, latitud, longitud, k=10, radio_max_km=50.0):
+        """
+        Las `k` incidencias más cercanas (lista ordenada por distancia).
+        Busca en radios crecientes para no recorrer toda la tabla.
+        """
+        radio = min(0.5, radio_max_km)
+        while True:
+            cercanas = list(self.en_radio(latitud, longitud, radio).order_by("distancia_km", "id")[:k])
+            if len(cercanas) >= k or radio >= radio_max_km:
+                return cercanas
+            radio = min(radio * 4, radio_max_km)
+
+    def update(self, **kwargs):
+        """
+        QuerySet.update() no dispara post_save: si cambia el estado o el
+        departamento, ajusta aquí ContadorIncidencias con lo que cambió.
+        """
+        if not {"estado", "departamento", "departamento_id"} & set(kwargs):
+            return super().update(**kwargs)
+        from .signals import ajustar_contador
+
+        with transaction.atomic(using=self.db):
+            pks = list(self.select_for_update().values_list("pk", flat=True))
+            antes = self._totales_contador(pks)
+            filas = super().update(**kwargs)
+            despues = self._totales_contador(pks)
+            for clave in antes.keys() | despues.keys():
+                ajustar_contador(*clave, despues[clave] - antes[clave])
+        return filas
+
+    def _totales_contador(self, pks):
+        filas = (
+            self.model._base_manager.using(self.db).filter(pk__in=pks)
+            .values_list("departamento_id", "estado").annotate(total=Count("pk")).order_by()
+        )
+        return Counter({(departamento_id, estado): total for departamento_id, estado, total in filas})
+
+
 class Incidencia(models.Model):
                   
                                                
@@ -206,11 +477,86 @@ class Incidencia(models.Model):
     departamento = models.ForeignKey(Departamento, on_delete=models.SET_NULL, null=True)
     encuesta = models.ForeignKey(Encuesta, on_delete=models.SET_NULL, null=True)
     tipo_incidencia = models.ForeignKey(TipoIncidencia, on_delete=models.SET_NULL, null=True)
+    busqueda = SearchVectorField(null=True, editable=False)
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False, db_collation='C')
+
+    objects = IncidenciaQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['creadoEl', 'id'], name='incidencia_creado_id_idx'),
+            GinIndex(fields=['busqueda'], name='incidencia_busqueda_gin'),
+            models.Index(fields=['geohash'], name='incidencia_geohash_idx'),
+            models.Index(fields=['departamento', 'estado', 'creadoEl'], name='incidencia_depto_estado_idx'),
+            models.Index(fields=['cuadrilla', 'estado', 'actualizadoEl'], name='incidencia_cuadr_estado_idx'),
+            models.Index(
+                fields=['creadoEl'], name='incidencia_abiertas_idx',
+                condition=models.Q(estado__in=['Pendiente', 'En Progreso']),
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.latitud is not None and self.longitud is not None:
+            self.geohash = geo.geohash(self.latitud, self.longitud)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(busqueda.CAMPOS_INCIDENCIA) & set(update_fields):
+            self.busqueda = busqueda.vector_incidencia(self)
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if {'latitud', 'longitud'} & update_fields:
+                update_fields.add('geohash')
+            if set(busqueda.CAMPOS_INCIDENCIA) & update_fields:
+                update_fields.add('busqueda')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.titulo
 
 
+class ContadorIncidencias(models.Model):
+    """
+    Total de incidencias por departamento y estado.
+    Se mantiene con las señales de core.signals y con
+    IncidenciaQuerySet.update(), para que los dashboards lean un número en
+    vez de contar la tabla de incidencias. bulk_create no lo actualiza: quien
+    lo use llama a ajustar_contador o a recalcular_contadores.
+    """
+    departamento = models.ForeignKey(
+        Departamento, on_delete=models.CASCADE, null=True, related_name='contadores'
+    )
+    estado = models.CharField(max_length=50, choices=Incidencia.ESTADO_CHOICES)
+    total = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['departamento', 'estado'],
+                condition=models.Q(departamento__isnull=False),
+                name='contador_departamento_estado_uq',
+            ),
+            models.UniqueConstraint(
+                fields=['estado'],
+                condition=models.Q(departamento__isnull=True),
+                name='contador_sin_departamento_estado_uq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.departamento or 'Sin departamento'} - {self.estado}: {self.total}"
+
+    @classmethod
+    def totales_por_estado(cls, departamento=None):
+        """Diccionario estado -> total, global o de un departamento."""
+        qs = cls.objects.all()
+        if departamento is not None:
+            qs = qs.filter(departamento=departamento)
+        totales = {estado: 0 for estado, _ in Incidencia.ESTADO_CHOICES}
+        for fila in qs.values('estado').annotate(suma=models.Sum('total')):
+            totales[fila['estado']] = fila['suma'] or 0
+        return totales
+
+
 class Territorial(models.Model):
     incidencia = models.ForeignKey(
         Incidencia, on_delete=models.CASCADE, related_name='territoriales'
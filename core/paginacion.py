@@ -0,0 +1,103 @@
+import base64
+from dataclasses import dataclass, field
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+@dataclass
+class PaginaCursor:
+    """Resultado de una paginación por cursor (keyset)."""
+    objetos: list = field(default_factory=list)
+    cursor_siguiente: str = ""
+    cursor_anterior: str = ""
+
+    @property
+    def tiene_siguiente(self):
+        return bool(self.cursor_siguiente)
+
+    @property
+    def tiene_anterior(self):
+        return bool(self.cursor_anterior)
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self):
+        return len(self.objetos)
+
+
+def codificar_cursor(direccion, valor, pk):
+    """Serializa la posición (valor, pk) en un token opaco apto para URLs."""
+    texto = valor.isoformat() if hasattr(valor, "isoformat") else repr(valor)
+    crudo = f"{direccion}|{texto}|{pk}"
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(token, convertir=parse_datetime):
+    """
+    Devuelve (direccion, valor, pk) o None si el token no es válido; `convertir`
+    lee el valor (fecha por defecto, `float` para la relevancia).
+    Un cursor corrupto se trata como 'primera página' en lugar de fallar.
+    """
+    if not token:
+        return None
+    try:
+        relleno = "=" * (-len(token) % 4)
+        crudo = base64.urlsafe_b64decode(token + relleno).decode()
+        direccion, valor_txt, pk_txt = crudo.split("|")
+        valor = convertir(valor_txt)
+        pk = int(pk_txt)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if direccion not in ("s", "a") or valor is None:
+        return None
+    return direccion, valor, pk
+
+
+def paginar_por_cursor(qs, cursor=None, por_pagina=25, campo="creadoEl", convertir=parse_datetime):
+    """
+    Pagina `qs` de mayor a menor (más reciente a más antiguo) usando
+    (campo, id) como clave. `campo` puede ser una anotación, como la
+    `relevancia` de busqueda.buscar, con `convertir=float`.
+
+    A diferencia de OFFSET, cada página se resuelve con un rango sobre el índice
+    compuesto, por lo que el costo no depende de cuán profunda sea la página.
+    Se lee un registro extra para saber si existe otra página en esa dirección.
+    """
+    posicion = decodificar_cursor(cursor, convertir)
+    orden_desc = (f"-{campo}", "-id")
+    orden_asc = (campo, "id")
+
+    if posicion is None:
+        filas = list(qs.order_by(*orden_desc)[:por_pagina + 1])
+        hay_mas = len(filas) > por_pagina
+        filas = filas[:por_pagina]
+        hay_anterior = False
+        hay_siguiente = hay_mas
+    else:
+        direccion, valor, pk = posicion
+        if direccion == "s":
+            despues = Q(**{f"{campo}__lt": valor}) | Q(**{campo: valor, "id__lt": pk})
+            filas = list(qs.filter(despues).order_by(*orden_desc)[:por_pagina + 1])
+            hay_mas = len(filas) > por_pagina
+            filas = filas[:por_pagina]
+            hay_anterior = True
+            hay_siguiente = hay_mas
+        else:
+            antes = Q(**{f"{campo}__gt": valor}) | Q(**{campo: valor, "id__gt": pk})
+            filas = list(qs.filter(antes).order_by(*orden_asc)[:por_pagina + 1])
+            hay_mas = len(filas) > por_pagina
+            filas = filas[:por_pagina]
+            filas.reverse()
+            hay_anterior = hay_mas
+            hay_siguiente = True
+
+    pagina = PaginaCursor(objetos=filas)
+    if filas:
+        primero, ultimo = filas[0], filas[-1]
+        if hay_siguiente:
+            pagina.cursor_siguiente = codificar_cursor("s", getattr(ultimo, campo), ultimo.pk)
+        if hay_anterior:
+            pagina.cursor_anterior = codificar_cursor("a", getattr(primero, campo), primero.pk)
+    return pagina
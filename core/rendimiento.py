@@ -0,0 +1,135 @@
+import platform
+import statistics
+import time
+from dataclasses import dataclass, field
+
+import django
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import mapa
+from .instrumentacion import percentil
+from .models import Encuesta, Incidencia
+from .sinteticos import PREFIJO, usuario
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+@dataclass
+class Escenario:
+    """Una vista a medir: nombre de URL, rol (ver sinteticos.ROLES) y cómo obtener sus argumentos."""
+    url: str
+    rol: str
+    argumentos: object = None
+    parametros: dict = field(default_factory=dict)
+    nombre: str = ""
+
+    def __post_init__(self):
+        self.nombre = self.nombre or f"{self.url}[{self.rol}]"
+
+
+def _incidencia():
+    return {"pk": Incidencia.objects.order_by("-pk").values_list("pk", flat=True).first()}
+
+
+def _encuesta():
+    return {"encuesta_id": Encuesta.objects.filter(incidencia__isnull=False).order_by("-pk")
+            .values_list("pk", flat=True).first()}
+
+
+def _tile():
+    x, y = mapa.tile_de(-33.45, -70.66, 12)
+    return {"z": 12, "x": x, "y": y}
+
+
+ESCENARIOS = [
+    Escenario("incidencias:incidencias_lista", "admin"),
+    Escenario("incidencias:incidencias_lista", "admin", parametros={"estado": "Pendiente", "q": "bache"},
+              nombre="incidencias:incidencias_lista[admin,filtros]"),
+    Escenario("incidencias:incidencias_lista", "jefe"),
+    Escenario("incidencias:incidencia_detalle", "admin", _incidencia),
+    Escenario("personas:dashboard_admin", "admin"),
+    Escenario("personas:dashboard_departamento", "depto"),
+    Escenario("personas:dashboard_jefeCuadrilla", "jefe"),
+    Escenario("personas:dashboard_territorial", "territorial"),
+    Escenario("territorial_app:encuestas_lista", "territorial"),
+    Escenario("territorial_app:encuesta_detalle", "territorial", _encuesta),
+    Escenario("territorial_app:encuesta_resultados", "territorial", _encuesta),
+    Escenario("organizacion:direcciones_lista", "admin"),
+    Escenario("organizacion:departamentos_lista", "admin"),
+    Escenario("incidencias:api_incidencias-list", "admin"),
+    Escenario("incidencias:api_incidencias-detail", "admin", _incidencia),
+    Escenario("incidencias:api_incidencias-cercanas", "admin", parametros={"lat": -33.45, "lon": -70.66, "k": 20}),
+    Escenario("incidencias:api_mapa_clusters", "admin", _tile),
+]
+
+
+def medir(escenario, repeticiones=20, calentamiento=2, prefijo=PREFIJO):
+    """
+    Llama a la vista con el cliente de pruebas como un usuario sintético del
+    rol y devuelve latencias (ms) y consultas SQL de las repeticiones.
+    Las primeras `calentamiento` llamadas llenan cachés y no se cuentan.
+    """
+    cliente = Client(SERVER_NAME="localhost")
+    cliente.force_login(User.objects.get(username=usuario(escenario.rol, prefijo=prefijo)))
+    kwargs = escenario.argumentos() if escenario.argumentos else {}
+    url = reverse(escenario.url, kwargs=kwargs)
+
+    for _ in range(calentamiento):
+        cliente.get(url, escenario.parametros)
+    tiempos, consultas = [], []
+    for _ in range(repeticiones):
+        with CaptureQueriesContext(connection) as capturadas:
+            inicio = time.perf_counter()
+            respuesta = cliente.get(url, escenario.parametros)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        consultas.append(len(capturadas.captured_queries))
+
+    resultado = {
+        "url": url,
+        "rol": escenario.rol,
+        "estado": respuesta.status_code,
+        "repeticiones": repeticiones,
+        "consultas": max(consultas),
+        "media_ms": round(statistics.fmean(tiempos), 2),
+        "max_ms": round(max(tiempos), 2),
+    }
+    resultado.update({f"p{p}_ms": round(percentil(tiempos, p), 2) for p in PERCENTILES})
+    return resultado
+
+
+def informe(escenarios=ESCENARIOS, repeticiones=20, prefijo=PREFIJO, progreso=None):
+    """Mide todos los escenarios y arma el informe (serializable a JSON)."""
+    vistas = {}
+    for escenario in escenarios:
+        vistas[escenario.nombre] = medir(escenario, repeticiones, prefijo=prefijo)
+        if progreso:
+            progreso(escenario.nombre, vistas[escenario.nombre])
+    return {
+        "fecha": timezone.now().isoformat(),
+        "entorno": {
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "base_de_datos": f"{connection.vendor} {getattr(connection, 'pg_version', '')}".strip(),
+        },
+        "datos": {"incidencias": Incidencia.objects.count(), "encuestas": Encuesta.objects.count()},
+        "vistas": vistas,
+    }
+
+
+def comparar(anterior, actual):
+    """
+    Diferencias por vista entre dos informes: (nombre, consultas antes,
+    consultas ahora, p50 antes, p50 ahora). Las vistas nuevas tienen None como 'antes'.
+    """
+    filas = []
+    for nombre, datos in actual["vistas"].items():
+        previo = anterior["vistas"].get(nombre, {})
+        filas.append((
+            nombre, previo.get("consultas"), datos["consultas"], previo.get("p50_ms"), datos["p50_ms"],
+        ))
+    return filas
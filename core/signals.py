@@ -0,0 +1,247 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import analitica, busqueda, derivados, mapa
+from .almacenamiento import consumir_reserva
+from .models import (
+    Incidencia, ContadorIncidencias, Departamento, Encuesta, JefeCuadrilla,
+    Multimedia, PreguntaEncuesta, RespuestaEncuesta, ArchivoEvidencia,
+)
+
+_DIFERIDO = object()
+
+
+def ajustar_contador(departamento_id, estado, delta):
+    """Suma `delta` al contador (departamento, estado), creándolo si no existe."""
+    if not estado or not delta:
+        return
+    filtro = {"departamento_id": departamento_id, "estado": estado}
+    if ContadorIncidencias.objects.filter(**filtro).update(total=F("total") + delta):
+        return
+    try:
+        with transaction.atomic():
+            ContadorIncidencias.objects.create(total=delta, **filtro)
+    except IntegrityError:
+        ContadorIncidencias.objects.filter(**filtro).update(total=F("total") + delta)
+
+
+def _recordar_clave(instance):
+    instance._contador_clave = (
+        instance.__dict__.get("departamento_id", _DIFERIDO),
+        instance.__dict__.get("estado", _DIFERIDO),
+    )
+
+
+@receiver(post_init, sender=Incidencia)
+def incidencia_post_init(sender, instance, **kwargs):
+    _recordar_clave(instance)
+    _recordar_mapa(instance)
+
+
+CAMPOS_MAPA = (
+    "latitud", "longitud", "estado", "departamento_id", "tipo_incidencia_id", "cuadrilla_id", "correo_vecino",
+) + busqueda.CAMPOS_INCIDENCIA
+
+
+def _recordar_mapa(instance):
+    instance._mapa_clave = tuple(instance.__dict__.get(c, _DIFERIDO) for c in CAMPOS_MAPA)
+
+
+def _invalidar_mapa(*puntos):
+    def invalidar():
+        for latitud, longitud in puntos:
+            mapa.invalidar_punto(latitud, longitud)
+    transaction.on_commit(invalidar)
+
+
+@receiver(post_save, sender=Incidencia)
+def incidencia_mapa(sender, instance, created, raw=False, **kwargs):
+    """Los tiles del mapa que contenían o contienen la incidencia dejan de ser válidos."""
+    if raw:
+        return
+    nueva = tuple(getattr(instance, c) for c in CAMPOS_MAPA)
+    anterior = tuple(
+        actual if previo is _DIFERIDO else previo
+        for previo, actual in zip(instance._mapa_clave, nueva)
+    )
+    if created:
+        _invalidar_mapa(nueva[:2])
+    elif anterior != nueva:
+        _invalidar_mapa(anterior[:2], nueva[:2])
+    _recordar_mapa(instance)
+
+
+@receiver(post_save, sender=JefeCuadrilla)
+@receiver(post_delete, sender=JefeCuadrilla)
+def cuadrilla_mapa(sender, instance, raw=False, **kwargs):
+    """Cambiar el jefe o encargado de una cuadrilla cambia qué incidencias ve cada jefe en el mapa."""
+    if not raw:
+        transaction.on_commit(mapa.invalidar_todo)
+
+
+@receiver(post_save, sender=Incidencia)
+def incidencia_post_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    nueva = (instance.departamento_id, instance.estado)
+    if created:
+        ajustar_contador(*nueva, 1)
+    else:
+        anterior = tuple(
+            actual if previo is _DIFERIDO else previo
+            for previo, actual in zip(instance._contador_clave, nueva)
+        )
+        if anterior != nueva:
+            ajustar_contador(*anterior, -1)
+            ajustar_contador(*nueva, 1)
+    _recordar_clave(instance)
+
+
+@receiver(post_delete, sender=Incidencia)
+def incidencia_post_delete(sender, instance, **kwargs):
+    ajustar_contador(instance.departamento_id, instance.estado, -1)
+    _invalidar_mapa((instance.latitud, instance.longitud))
+
+
+@receiver(pre_delete, sender=Departamento)
+def departamento_pre_delete(sender, instance, **kwargs):
+    """
+    Las incidencias del departamento quedan con departamento NULL (SET_NULL se
+    aplica con un UPDATE sin señales), así que sus totales pasan a esa fila.
+    """
+    for contador in instance.contadores.all():
+        ajustar_contador(None, contador.estado, contador.total)
+
+
+def _cambio_texto(update_fields, campos):
+    return update_fields is None or bool(set(update_fields) & set(campos))
+
+
+@receiver(post_save, sender=Departamento)
+def departamento_indexar(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if not created and not raw and _cambio_texto(update_fields, ("nombre_departamento",)):
+        busqueda.indexar_encuestas(instance)
+
+
+def tocar(modelo, **filtro):
+    """
+    Actualiza `actualizadoEl` sin pasar por save(), para que las vistas con
+    ETag noten cambios en datos hijos (evidencias, preguntas, respuestas).
+    """
+    modelo.objects.filter(**filtro).update(actualizadoEl=timezone.now())
+
+
+@receiver(post_save, sender=Multimedia)
+@receiver(post_delete, sender=Multimedia)
+def multimedia_cambiada(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.incidencia_id:
+        tocar(Incidencia, pk=instance.incidencia_id)
+    if instance.encuesta_id:
+        tocar(Encuesta, pk=instance.encuesta_id)
+
+
+@receiver(post_save, sender=Multimedia)
+def multimedia_creada(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        derivados.encolar(instance)
+
+
+def ajustar_referencias(ruta, delta):
+    """Suma `delta` a las referencias del archivo; al llegar a cero lo borra tras el commit."""
+    if not ruta or not delta:
+        return
+    filtro = {"ruta": ruta}
+    if ArchivoEvidencia.objects.filter(**filtro).update(referencias=F("referencias") + delta):
+        pass
+    elif delta > 0:
+        try:
+            with transaction.atomic():
+                ArchivoEvidencia.objects.create(referencias=delta, **filtro)
+        except IntegrityError:
+            ArchivoEvidencia.objects.filter(**filtro).update(referencias=F("referencias") + delta)
+    if delta < 0:
+        transaction.on_commit(lambda: borrar_si_huerfano(ruta))
+
+
+def borrar_si_huerfano(ruta):
+    """
+    Elimina el archivo físico solo si ninguna evidencia lo referencia. El
+    archivo se borra con la fila aún bloqueada, para que una subida del mismo
+    contenido (que toma el mismo bloqueo) lo vuelva a escribir en vez de reutilizarlo.
+    Sin fila no se borra nada: otra limpieza ya se encargó.
+    """
+    with transaction.atomic():
+        registro = ArchivoEvidencia.objects.select_for_update().filter(ruta=ruta).first()
+        if registro is None or registro.referencias > 0:
+            return
+        registro.delete()
+        Multimedia._meta.get_field("archivo").storage.delete(ruta)
+
+
+@receiver(post_init, sender=Multimedia)
+def multimedia_post_init(sender, instance, **kwargs):
+    instance._archivo_original = instance.__dict__.get("archivo", _DIFERIDO)
+
+
+@receiver(post_save, sender=Multimedia)
+def multimedia_referencias(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    actual = instance.archivo.name or None
+    anterior = None if created else instance._archivo_original
+    if anterior is _DIFERIDO:
+        anterior = actual
+    anterior = str(anterior) if anterior else None
+    reservada = bool(actual) and consumir_reserva(actual)
+    if anterior != actual:
+        ajustar_referencias(anterior, -1)
+        if not reservada:
+            ajustar_referencias(actual, 1)
+    elif reservada:
+        ajustar_referencias(actual, -1)
+    instance._archivo_original = actual
+
+
+@receiver(post_delete, sender=Multimedia)
+def multimedia_post_delete(sender, instance, **kwargs):
+    ajustar_referencias(instance.archivo.name or None, -1)
+
+
+def tocar_encuesta(**filtro):
+    """
+    tocar() para encuestas que, en el mismo UPDATE, recalcula su avance
+    (total_preguntas y preguntas_respondidas) con analitica.avance_encuesta().
+    """
+    Encuesta.objects.filter(**filtro).update(actualizadoEl=timezone.now(), **analitica.avance_encuesta())
+
+
+@receiver(post_save, sender=PreguntaEncuesta)
+@receiver(post_delete, sender=PreguntaEncuesta)
+def pregunta_cambiada(sender, instance, raw=False, **kwargs):
+    if not raw:
+        tocar_encuesta(pk=instance.encuesta_id)
+
+
+@receiver(post_save, sender=RespuestaEncuesta)
+@receiver(post_delete, sender=RespuestaEncuesta)
+def respuesta_cambiada(sender, instance, raw=False, **kwargs):
+    if not raw:
+        tocar_encuesta(preguntaencuesta__id=instance.pregunta_id)
+
+
+@receiver(post_save, sender=RespuestaEncuesta)
+@receiver(post_delete, sender=RespuestaEncuesta)
+def respuesta_resumen(sender, instance, raw=False, **kwargs):
+    if not raw:
+        analitica.programar_resumen(instance.pregunta_id)
+
+
+@receiver(post_save, sender=PreguntaEncuesta)
+def pregunta_resumen(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if not created and not raw and _cambio_texto(update_fields, ("tipo",)):
+        analitica.programar_resumen(instance.pk)
@@ -0,0 +1,321 @@
+import io
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import DateTimeField, DurationField, ExpressionWrapper, F, Func, Value
+from django.utils import timezone
+
+from registration.models import Profile
+
+from . import geo, mapa
+from .busqueda import indexar_encuestas, vector_incidencia
+from .models import (
+    ArchivoEvidencia, Departamento, Direccion, Encuesta, Incidencia, JefeCuadrilla,
+    Multimedia, PreguntaEncuesta, RespuestaEncuesta, TipoIncidencia,
+)
+
+PREFIJO = "sintetico"
+LOTE = 5000
+VENTANA_SEGUNDOS = 3 * 365 * 86400
+CENTRO = (-33.45, -70.66)
+ARCHIVOS_COMPARTIDOS = 200
+
+ROLES = {
+    "admin": "Administrador",
+    "direccion": "Dirección",
+    "depto": "Departamento",
+    "jefe": "Jefe de Cuadrilla",
+    "territorial": "Territorial",
+}
+ESTADOS = (
+    ("Pendiente", 0.12), ("En Progreso", 0.08), ("Completada", 0.40),
+    ("Validada", 0.30), ("Rechazada", 0.10),
+)
+PRIORIDADES = (("alta", 0.2), ("media", 0.5), ("baja", 0.3))
+TIPOS = (
+    ("Bache", "M"), ("Luminaria apagada", "M"), ("Microbasural", "A"), ("Árbol caído", "A"),
+    ("Semáforo en falla", "A"), ("Vereda en mal estado", "B"), ("Ruidos molestos", "B"),
+    ("Fuga de agua", "A"), ("Grafiti", "B"), ("Señalética dañada", "M"),
+    ("Plaga de roedores", "M"), ("Animal abandonado", "B"),
+)
+CALLES = (
+    "Av. Libertador", "Los Aromos", "Pedro de Valdivia", "San Martín", "Los Carrera",
+    "Gran Avenida", "Vicuña Mackenna", "Irarrázaval", "Las Acacias", "El Roble",
+    "Santa Rosa", "Independencia", "Recoleta", "Manuel Montt", "Tobalaba",
+)
+NOMBRES = ("María", "José", "Camila", "Juan", "Valentina", "Pedro", "Fernanda", "Luis", "Catalina", "Diego")
+APELLIDOS = ("González", "Muñoz", "Rojas", "Díaz", "Pérez", "Soto", "Contreras", "Silva", "Martínez", "Sepúlveda")
+DESCRIPCIONES = (
+    "Vecinos reportan el problema hace varios días.",
+    "Se solicita revisión urgente por riesgo para peatones.",
+    "El problema se repite cada semana en el mismo lugar.",
+    "Reportado por la junta de vecinos del sector.",
+    "Afecta el acceso a la plaza y al paradero.",
+)
+PREGUNTAS = (
+    ("¿El problema persiste?", "opcion", ("Sí", "No", "Parcialmente")),
+    ("¿Cuántas personas se ven afectadas?", "numero", None),
+    ("Metros lineales afectados", "numero", None),
+    ("Describa el estado en que quedó el lugar", "texto", None),
+    ("¿Se requiere una segunda visita?", "opcion", ("Sí", "No")),
+    ("Observaciones del vecino", "texto", None),
+)
+EVIDENCIAS = (("imagen", "jpg"), ("imagen", "png"), ("video", "mp4"), ("documento", "pdf"))
+
+
+class _Segundos(Func):
+    template = "make_interval(secs => %(expressions)s)"
+    output_field = DurationField()
+
+
+def escala(incidencias):
+    """Tamaño del resto del grafo para una cantidad de incidencias."""
+    departamentos = min(max(incidencias // 20_000, 5), 250)
+    return {
+        "direcciones": (departamentos + 4) // 5,
+        "departamentos": departamentos,
+        "cuadrillas_por_departamento": 4,
+        "territoriales": max(departamentos // 2, 3),
+        "encuestas": min(max(incidencias // 100, 10), 20_000),
+        "incidencias": incidencias,
+    }
+
+
+def usuario(rol, numero=1, prefijo=PREFIJO):
+    """Nombre de usuario de la persona sintética `numero` con ese rol (ver ROLES)."""
+    return f"{prefijo}_{rol}" if rol == "admin" else f"{prefijo}_{rol}_{numero}"
+
+
+def _elegir(azar, opciones):
+    valores, pesos = zip(*opciones)
+    return azar.choices(valores, pesos)[0]
+
+
+def _crear_usuarios(azar, prefijo, cantidades, contrasena=None):
+    """
+    Usuarios con perfil y grupo, todos con la misma contraseña (se cifra una
+    vez). Sin `contrasena` quedan con una contraseña inutilizable.
+    """
+    grupos = {rol: Group.objects.get_or_create(name=nombre)[0] for rol, nombre in ROLES.items()}
+    clave = make_password(contrasena)
+    personas = [("admin", 1)] + [
+        (rol, numero) for rol, cantidad in cantidades.items() for numero in range(1, cantidad + 1)
+    ]
+    usuarios = User.objects.bulk_create([
+        User(
+            username=usuario(rol, numero, prefijo),
+            first_name=azar.choice(NOMBRES),
+            last_name=azar.choice(APELLIDOS),
+            email=f"{usuario(rol, numero, prefijo)}@municipalidad.local",
+            password=clave,
+            is_staff=rol == "admin",
+        )
+        for rol, numero in personas
+    ])
+    perfiles = Profile.objects.bulk_create([
+        Profile(user=u, group=grupos[rol], cargo=ROLES[rol], telefono=f"+5691{azar.randrange(10**7):07d}")
+        for u, (rol, _) in zip(usuarios, personas)
+    ])
+    User.groups.through.objects.bulk_create([
+        User.groups.through(user_id=u.pk, group_id=grupos[rol].pk) for u, (rol, _) in zip(usuarios, personas)
+    ])
+    por_rol = {}
+    for perfil, (rol, _) in zip(perfiles, personas):
+        por_rol.setdefault(rol, []).append(perfil)
+    return por_rol
+
+
+def _crear_organizacion(azar, prefijo, tamanio, contrasena=None):
+    perfiles = _crear_usuarios(azar, prefijo, {
+        "direccion": tamanio["direcciones"],
+        "depto": tamanio["departamentos"],
+        "jefe": tamanio["departamentos"] * tamanio["cuadrillas_por_departamento"],
+        "territorial": tamanio["territoriales"],
+    }, contrasena)
+    direcciones = Direccion.objects.bulk_create([
+        Direccion(nombre_direccion=f"Dirección {i}", encargado=perfil)
+        for i, perfil in enumerate(perfiles["direccion"], start=1)
+    ])
+    departamentos = Departamento.objects.bulk_create([
+        Departamento(
+            nombre_departamento=f"Departamento {i}", encargado=perfil,
+            direccion=direcciones[(i - 1) // 5],
+        )
+        for i, perfil in enumerate(perfiles["depto"], start=1)
+    ])
+    cuadrillas = JefeCuadrilla.objects.bulk_create([
+        JefeCuadrilla(
+            nombre_cuadrilla=f"Cuadrilla {i}", usuario=perfil, encargado=perfil,
+            departamento=departamentos[(i - 1) // tamanio["cuadrillas_por_departamento"]],
+        )
+        for i, perfil in enumerate(perfiles["jefe"], start=1)
+    ])
+    return departamentos, cuadrillas
+
+
+def _crear_encuestas(azar, departamentos, tipos, cantidad):
+    encuestas = Encuesta.objects.bulk_create([
+        Encuesta(
+            titulo=f"Seguimiento {tipo.nombre_problema.lower()} {i}",
+            descripcion=azar.choice(DESCRIPCIONES),
+            ubicacion=f"{azar.choice(CALLES)} {azar.randrange(100, 9999)}",
+            prioridad=azar.choice(("Baja", "Media", "Alta")),
+            departamento=azar.choice(departamentos),
+            tipo_incidencia=tipo,
+            estado=azar.random() < 0.9,
+        )
+        for i, tipo in ((i, azar.choice(tipos)) for i in range(1, cantidad + 1))
+    ], batch_size=LOTE)
+    for departamento in departamentos:
+        indexar_encuestas(departamento)
+
+    preguntas = PreguntaEncuesta.objects.bulk_create([
+        PreguntaEncuesta(encuesta=encuesta, texto_pregunta=texto, descripcion="", tipo=tipo)
+        for encuesta in encuestas
+        for texto, tipo, _ in azar.sample(PREGUNTAS, azar.randint(3, len(PREGUNTAS)))
+    ], batch_size=LOTE)
+    opciones = {texto: valores for texto, _, valores in PREGUNTAS}
+    respuestas = []
+    for pregunta in preguntas:
+        for _ in range(azar.randrange(16)):
+            if pregunta.tipo == "opcion":
+                texto = azar.choice(opciones[pregunta.texto_pregunta])
+            elif pregunta.tipo == "numero":
+                texto = str(azar.randint(1, 120))
+            else:
+                texto = azar.choice(DESCRIPCIONES)
+            respuestas.append(RespuestaEncuesta(pregunta=pregunta, texto_respuesta=texto, tipo=pregunta.tipo))
+    RespuestaEncuesta.objects.bulk_create(respuestas, batch_size=LOTE)
+    return encuestas, len(preguntas), len(respuestas)
+
+
+def _incidencia(azar, numero, departamento, cuadrillas, encuestas, tipos):
+    estado = _elegir(azar, ESTADOS)
+    encuesta = azar.choice(encuestas) if encuestas and azar.random() < 0.7 else None
+    tipo = encuesta.tipo_incidencia if encuesta else azar.choice(tipos)
+    latitud = CENTRO[0] + azar.gauss(0, 0.08)
+    longitud = CENTRO[1] + azar.gauss(0, 0.08)
+    nombre = f"{azar.choice(NOMBRES)} {azar.choice(APELLIDOS)}"
+    return Incidencia(
+        titulo=f"{tipo.nombre_problema} en {azar.choice(CALLES)} {azar.randrange(100, 9999)} #{numero}",
+        descripcion=azar.choice(DESCRIPCIONES),
+        estado=estado,
+        prioridad=_elegir(azar, PRIORIDADES),
+        latitud=latitud,
+        longitud=longitud,
+        geohash=geo.geohash(latitud, longitud),
+        nombre_vecino=nombre,
+        correo_vecino=f"vecino{numero}@correo.cl",
+        telefono_vecino=f"+5699{azar.randrange(10**7):07d}",
+        departamento=departamento,
+        cuadrilla=None if estado == "Pendiente" and azar.random() < 0.3 else azar.choice(cuadrillas),
+        encuesta=encuesta,
+        tipo_incidencia=tipo,
+    )
+
+
+def _fechar(ids, ahora):
+    """
+    Reparte creadoEl/actualizadoEl en los últimos tres años (auto_now_add no
+    deja fijarlas en bulk_create) y calcula el vector de búsqueda en el mismo UPDATE.
+    """
+    edad = F("id") * 7919 % VENTANA_SEGUNDOS
+    Incidencia.objects.filter(pk__in=ids).update(
+        creadoEl=ExpressionWrapper(Value(ahora) - _Segundos(edad), output_field=DateTimeField()),
+        actualizadoEl=ExpressionWrapper(Value(ahora) - _Segundos(edad / 2), output_field=DateTimeField()),
+        busqueda=vector_incidencia(),
+    )
+
+
+def _crear_evidencias(azar, incidencias):
+    multimedias = []
+    for incidencia in incidencias:
+        if azar.random() >= 0.25:
+            continue
+        tipo, formato = azar.choice(EVIDENCIAS)
+        multimedias.append(Multimedia(
+            nombre=f"Evidencia {incidencia.pk}",
+            archivo=f"evidencias/sinteticas/{azar.randrange(ARCHIVOS_COMPARTIDOS)}.{formato}",
+            tipo=tipo,
+            formato=formato,
+            tamanio=azar.randint(50_000, 5_000_000),
+            incidencia=incidencia,
+            encuesta=incidencia.encuesta,
+        ))
+    Multimedia.objects.bulk_create(multimedias)
+    return multimedias
+
+
+def _registrar_archivos(referencias):
+    """Las evidencias sintéticas comparten archivos como lo haría el almacenamiento deduplicado."""
+    ArchivoEvidencia.objects.bulk_create(
+        [ArchivoEvidencia(ruta=ruta, referencias=total) for ruta, total in referencias.items()],
+        update_conflicts=True, unique_fields=["ruta"], update_fields=["referencias"],
+    )
+
+
+def generar(incidencias, semilla=0, prefijo=PREFIJO, lote=LOTE, progreso=None, contrasena=None):
+    """
+    Crea un grafo completo de datos de prueba (Dirección → Departamento →
+    JefeCuadrilla → Encuesta/PreguntaEncuesta/RespuestaEncuesta → Incidencia
+    → Multimedia) con usuarios de cada rol, proporcional a `incidencias`.
+    Todo se inserta con bulk_create; como eso no dispara señales, al final
+    se recalculan contadores e índice de búsqueda y se invalida el mapa.
+    Con la misma `semilla` se generan los mismos datos. Los usuarios solo
+    pueden iniciar sesión si se indica `contrasena`.
+    Devuelve un diccionario con la cantidad de filas creadas por modelo.
+    """
+    if User.objects.filter(username__startswith=f"{prefijo}_").exists():
+        raise ValueError(f"Ya existen usuarios con el prefijo '{prefijo}_'.")
+    azar = random.Random(semilla)
+    tamanio = escala(incidencias)
+    ahora = timezone.now()
+
+    with transaction.atomic():
+        tipos = TipoIncidencia.objects.bulk_create([
+            TipoIncidencia(nombre_problema=nombre, descripcion=f"{nombre} en la vía pública", tipo_gravedad=gravedad)
+            for nombre, gravedad in TIPOS
+        ])
+        departamentos, cuadrillas = _crear_organizacion(azar, prefijo, tamanio, contrasena)
+        encuestas, preguntas, respuestas = _crear_encuestas(azar, departamentos, tipos, tamanio["encuestas"])
+    if progreso:
+        progreso(f"Organización y {len(encuestas)} encuestas creadas.")
+
+    cuadrillas_de = {d.pk: [c for c in cuadrillas if c.departamento_id == d.pk] for d in departamentos}
+    encuestas_de = {d.pk: [e for e in encuestas if e.departamento_id == d.pk] for d in departamentos}
+    referencias = {}
+    evidencias = 0
+    for inicio in range(0, incidencias, lote):
+        nuevas = []
+        for numero in range(inicio + 1, min(inicio + lote, incidencias) + 1):
+            departamento = azar.choice(departamentos)
+            nuevas.append(_incidencia(
+                azar, numero, departamento, cuadrillas_de[departamento.pk], encuestas_de[departamento.pk], tipos
+            ))
+        with transaction.atomic():
+            Incidencia.objects.bulk_create(nuevas)
+            _fechar([i.pk for i in nuevas], ahora)
+            multimedias = _crear_evidencias(azar, nuevas)
+        for multimedia in multimedias:
+            referencias[multimedia.archivo.name] = referencias.get(multimedia.archivo.name, 0) + 1
+        evidencias += len(multimedias)
+        if progreso:
+            progreso(f"{inicio + len(nuevas)}/{incidencias} incidencias.")
+
+    _registrar_archivos(referencias)
+    call_command("recalcular_contadores", stdout=io.StringIO())
+    call_command("recalcular_resultados", stdout=io.StringIO())
+    mapa.invalidar_todo()
+    return {
+        "direcciones": tamanio["direcciones"],
+        "departamentos": len(departamentos),
+        "cuadrillas": len(cuadrillas),
+        "encuestas": len(encuestas),
+        "preguntas": preguntas,
+        "respuestas": respuestas,
+        "incidencias": incidencias,
+        "multimedia": evidencias,
+    }
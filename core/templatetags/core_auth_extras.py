@@ -1,4 +1,5 @@
 from django import template
+from core.utils import roles_de
 
 register = template.Library()
 
@@ -9,6 +10,6 @@ def has_group(user, group_name: str) -> bool:
     Uso en plantilla:  {% if user|has_group:"Administrador" %} ... {% endif %}
     """
     try:
-        return user.is_authenticated and user.groups.filter(name=group_name).exists()
+        return user.is_authenticated and group_name in roles_de(user)
     except Exception:
         return False
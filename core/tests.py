@@ -1,3 +1,993 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import os
+import shutil
+import smtplib
+import tempfile
+import threading
+import unittest
+import zipfile
+from datetime import datetime, timedelta
+from xml.etree import ElementTree
 
-                         
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends import locmem
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Count
+from django.template import engines
+from django.template.base import Template
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from core.models import (
+    ArchivoEvidencia, CargaEvidencia, ContadorIncidencias, CorreoPendiente, Departamento, Direccion, Encuesta, Incidencia, JefeCuadrilla, Multimedia,
+    PreguntaBase, PreguntaEncuesta, RespuestaEncuesta, ResumenPregunta, TipoIncidencia, TrabajoDerivado,
+)
+from core import analitica, correos, derivados, instrumentacion
+from core.busqueda import buscar, buscar_usuarios
+from core.paginacion import codificar_cursor, paginar_por_cursor
+from core.exportacion import filas_csv, filas_xlsx
+from core.sinteticos import generar, usuario
+from core.utils import presupuesto_de
+from incidencias import urls as incidencias_urls
+from organizacion import urls as organizacion_urls
+from personas import urls as personas_urls
+from territorial_app import urls as territorial_urls
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+MODULOS_URLS = (incidencias_urls, territorial_urls, personas_urls, organizacion_urls)
+
+
+def _vista(funcion):
+    """Lo que lleva el presupuesto: la función, o la clase en vistas as_view()."""
+    return getattr(funcion, "cls", None) or getattr(funcion, "view_class", None) or funcion
+
+
+class PresupuestoConsultasTests(TestCase):
+    """Cada vista de incidencias, territorial_app, personas y organizacion declara y respeta su presupuesto de consultas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        generar(incidencias=400, semilla=1)
+        cls.usuarios = {rol: User.objects.get(username=usuario(rol)) for rol in ("admin", "depto", "jefe", "territorial", "direccion")}
+        cuadrilla = JefeCuadrilla.objects.get(usuario__user=cls.usuarios["jefe"])
+        cls.incidencia = Incidencia.objects.filter(cuadrilla=cuadrilla, encuesta__isnull=False).order_by("pk").first()
+        cls.encuesta = cls.incidencia.encuesta
+        cls.incidencia_respondida = Incidencia.objects.filter(cuadrilla=cuadrilla, encuesta__isnull=False).exclude(
+            encuesta=cls.encuesta
+        ).order_by("pk").first()
+        for pregunta in cls.incidencia_respondida.encuesta.preguntaencuesta_set.filter(respuestas__isnull=True):
+            RespuestaEncuesta.objects.create(pregunta=pregunta, texto_respuesta="Sí", tipo=pregunta.tipo)
+        cls.evidencia = Multimedia.objects.filter(encuesta__isnull=False).order_by("pk").first()
+        cls.tipo = TipoIncidencia.objects.order_by("pk").first()
+        cls.pregunta_base = PreguntaBase.objects.create(tipo_incidencia=cls.tipo, texto_pregunta="¿Hay riesgo para peatones?")
+        cls.carga = CargaEvidencia.objects.create(
+            usuario=cls.usuarios["admin"], incidencia=cls.incidencia, nombre="Foto",
+            nombre_archivo="foto.jpg", tamanio_total=1024,
+        )
+        cls.departamento = Departamento.objects.order_by("pk").first()
+        cls.direccion = Direccion.objects.order_by("pk").first()
+        propias = Incidencia.objects.filter(cuadrilla=cuadrilla).exclude(
+            pk__in=[cls.incidencia.pk, cls.incidencia_respondida.pk]
+        ).order_by("pk")
+        cls.en_progreso, cls.completada, cls.por_finalizar, cls.por_asignar = propias[:4]
+        Incidencia.objects.filter(pk=cls.en_progreso.pk).update(estado="En Progreso")
+        Incidencia.objects.filter(pk=cls.completada.pk).update(estado="Completada")
+        Incidencia.objects.filter(pk=cls.por_finalizar.pk).update(estado="en_progreso")
+        Incidencia.objects.filter(pk=cls.por_asignar.pk).update(estado="pendiente")
+        Multimedia.objects.create(
+            nombre="Foto", archivo="evidencias/sinteticas/0.jpg", tipo="imagen", formato="jpg",
+            incidencia=cls.por_finalizar,
+        )
+        cls.carga.incidencia = cls.en_progreso
+        cls.carga.recibidos = cls.carga.tamanio_total
+        cls.carga.save()
+        cls.encuesta_inactiva = (
+            Encuesta.objects.filter(incidencia__isnull=False).exclude(
+                pk__in=[cls.encuesta.pk, cls.incidencia_respondida.encuesta_id]
+            ).order_by("pk").first()
+        )
+        Encuesta.objects.filter(pk=cls.encuesta_inactiva.pk).update(estado=False)
+        cls.evidencia_inactiva = Multimedia.objects.create(
+            nombre="Plano", archivo="evidencias/sinteticas/1.pdf", tipo="documento", formato="pdf",
+            encuesta=cls.encuesta_inactiva,
+        )
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajuste = override_settings(MEDIA_ROOT=self.media)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        os.makedirs(os.path.dirname(self.carga.ruta_parcial()))
+        with open(self.carga.ruta_parcial(), "wb") as parcial:
+            parcial.write(b"x" * self.carga.tamanio_total)
+
+    def escenarios(self):
+        """(nombre de URL, rol, kwargs, método, parámetros) para cada vista."""
+        incidencia = {"pk": self.incidencia.pk}
+        encuesta = {"encuesta_id": self.encuesta.pk}
+        return [
+            ("incidencias:cuadrillas_por_departamento", "admin", {"departamento_id": self.departamento.pk}, "get", {}),
+            ("incidencias:tipo_lista", "admin", {}, "get", {}),
+            ("incidencias:tipo_crear", "admin", {}, "get", {}),
+            ("incidencias:tipo_editar", "admin", {"pk": self.tipo.pk}, "get", {}),
+            ("incidencias:tipo_eliminar", "admin", {"pk": self.tipo.pk}, "get", {}),
+            ("incidencias:preguntas_base_lista", "admin", {"tipo_id": self.tipo.pk}, "get", {}),
+            ("incidencias:pregunta_base_crear", "admin", {"tipo_id": self.tipo.pk}, "get", {}),
+            ("incidencias:pregunta_base_editar", "admin", {"pk": self.pregunta_base.pk}, "get", {}),
+            ("incidencias:pregunta_base_eliminar", "admin", {"pk": self.pregunta_base.pk}, "get", {}),
+            ("incidencias:incidencias_lista", "admin", {}, "get", {}),
+            ("incidencias:incidencias_lista", "jefe", {}, "get", {"estado": "Pendiente", "q": "bache"}),
+            ("incidencias:incidencias_exportar", "admin", {}, "get", {"formato": "csv"}),
+            ("incidencias:incidencia_crear", "admin", {}, "get", {}),
+            ("incidencias:incidencia_editar", "admin", incidencia, "get", {}),
+            ("incidencias:incidencia_detalle", "admin", incidencia, "get", {}),
+            ("incidencias:incidencia_eliminar", "admin", incidencia, "get", {}),
+            ("incidencias:subir_evidencia", "jefe", {"pk": self.en_progreso.pk}, "get", {}),
+            ("incidencias:finalizar_incidencia", "jefe", {"pk": self.por_finalizar.pk}, "get", {}),
+            ("incidencias:incidencias_importar", "admin", {}, "post", {"archivo": self.archivo_importacion()}),
+            ("incidencias:carga_iniciar", "admin", {}, "post",
+             {"nombre_archivo": "foto.jpg", "tamanio": 4, "incidencia_id": self.en_progreso.pk}),
+            ("incidencias:carga_chunk", "admin", {"carga_id": self.carga.pk}, "get", {}),
+            ("incidencias:carga_finalizar", "admin", {"carga_id": self.carga.pk}, "post", {}),
+            ("incidencias:api_mapa_clusters", "admin", {"z": 12, "x": 1244, "y": 2464}, "get", {}),
+            ("incidencias:api_incidencias-list", "admin", {}, "get", {}),
+            ("incidencias:api_incidencias-detail", "admin", incidencia, "get", {}),
+            ("incidencias:api_incidencias-cercanas", "admin", {}, "get", {"lat": -33.45, "lon": -70.66}),
+            ("incidencias:api_incidencias-duplicados", "admin", {}, "get",
+             {"titulo": self.incidencia.titulo, "lat": self.incidencia.latitud, "lon": self.incidencia.longitud}),
+            ("territorial_app:validar_incidencia", "territorial", {"pk": self.completada.pk}, "get", {}),
+            ("territorial_app:rechazar_incidencia", "territorial", incidencia, "get", {}),
+            ("territorial_app:reasignar_incidencia", "territorial", incidencia, "get", {}),
+            ("territorial_app:finalizar_incidencia", "jefe", incidencia, "get", {}),
+            ("territorial_app:finalizar_incidencia", "jefe", {"pk": self.incidencia_respondida.pk}, "get", {}),
+            ("territorial_app:encuestas_lista", "territorial", {}, "get", {}),
+            ("territorial_app:encuestas_lista", "territorial", {}, "get", {"q": "bache", "estado": "activo"}),
+            ("territorial_app:encuesta_crear", "territorial", {}, "get", {}),
+            ("territorial_app:encuesta_detalle", "territorial", encuesta, "get", {}),
+            ("territorial_app:encuesta_resultados", "territorial", encuesta, "get", {}),
+            ("territorial_app:encuesta_editar", "territorial", {"pk": self.encuesta_inactiva.pk}, "get", {}),
+            ("territorial_app:encuesta_toggle_estado", "territorial", {"pk": self.encuesta.pk}, "post", {}),
+            ("territorial_app:encuesta_eliminar", "territorial", {"pk": self.encuesta.pk}, "get", {}),
+            ("territorial_app:pregunta_agregar", "territorial", encuesta, "get", {}),
+            ("territorial_app:responder_encuesta", "jefe", {**encuesta, "incidencia_id": self.incidencia.pk}, "get", {}),
+            ("territorial_app:json_preguntas", "territorial", {}, "get", {"tipo": self.tipo.pk}),
+            ("territorial_app:evidencia_subir", "territorial", {"encuesta_id": self.encuesta_inactiva.pk}, "get", {}),
+            ("territorial_app:evidencia_eliminar", "territorial", {"evidencia_id": self.evidencia_inactiva.pk}, "post", {}),
+            ("personas:check_profile", "depto", {}, "get", {}),
+            ("personas:dashboard_admin", "admin", {}, "get", {}),
+            ("personas:dashboard_territorial", "territorial", {}, "get", {}),
+            ("personas:dashboard_jefeCuadrilla", "jefe", {}, "get", {}),
+            ("personas:dashboard_direccion", "direccion", {}, "get", {}),
+            ("personas:dashboard_departamento", "depto", {}, "get", {}),
+            ("personas:usuarios_lista", "admin", {}, "get", {}),
+            ("personas:usuario_crear", "admin", {}, "get", {}),
+            ("personas:usuario_detalle", "admin", {"pk": self.usuarios["territorial"].pk}, "get", {}),
+            ("personas:usuario_editar", "admin", {"pk": self.usuarios["territorial"].pk}, "get", {}),
+            ("personas:usuario_toggle_activo", "admin", {"pk": self.usuarios["direccion"].pk}, "post", {}),
+            ("personas:cerrar_sesion", "admin", {}, "get", {}),
+            ("organizacion:direcciones_lista", "admin", {}, "get", {}),
+            ("organizacion:direccion_crear", "admin", {}, "get", {}),
+            ("organizacion:direccion_editar", "admin", {"pk": self.direccion.pk}, "get", {}),
+            ("organizacion:direccion_detalle", "admin", {"pk": self.direccion.pk}, "get", {}),
+            ("organizacion:direccion_eliminar", "admin", {"pk": self.direccion.pk}, "get", {}),
+            ("organizacion:direccion_toggle_estado", "admin", {"pk": self.direccion.pk}, "post", {}),
+            ("organizacion:departamentos_lista", "admin", {}, "get", {}),
+            ("organizacion:departamento_crear", "admin", {}, "get", {}),
+            ("organizacion:departamento_editar", "admin", {"pk": self.departamento.pk}, "get", {}),
+            ("organizacion:departamento_detalle", "admin", {"pk": self.departamento.pk}, "get", {}),
+            ("organizacion:departamento_eliminar", "admin", {"pk": self.departamento.pk}, "get", {}),
+            ("organizacion:departamento_toggle_estado", "admin", {"pk": self.departamento.pk}, "post", {}),
+            ("organizacion:asignar_cuadrilla", "depto", {"pk": self.por_asignar.pk}, "get", {}),
+        ]
+
+    def archivo_importacion(self):
+        """CSV de tres incidencias válidas para recorrer la importación completa."""
+        encuesta = self.encuesta
+        fila = (
+            f"Poste caído,Sin luz,alta,-33.45,-70.66,Vecino,vecino@correo.cl,+56911112222,"
+            f"{encuesta.departamento.nombre_departamento},{encuesta.pk}\n"
+        )
+        contenido = "titulo,descripcion,prioridad,latitud,longitud,nombre_vecino,correo_vecino,telefono_vecino,departamento,encuesta\n"
+        return SimpleUploadedFile("incidencias.csv", (contenido + fila * 3).encode())
+
+    def consultas(self, nombre, rol, kwargs, metodo, parametros):
+        """Consultas de un request a la vista, con cachés vacías (el peor caso)."""
+        cache.clear()
+        self.client.force_login(self.usuarios[rol])
+        url = reverse(nombre, kwargs=kwargs)
+        with CaptureQueriesContext(connection) as capturadas:
+            respuesta = getattr(self.client, metodo)(url, parametros)
+            if respuesta.streaming:
+                b"".join(respuesta.streaming_content)
+        self.assertLess(respuesta.status_code, 400, url)
+        return url, len(capturadas.captured_queries)
+
+    def test_todas_las_vistas_declaran_presupuesto(self):
+        sin_presupuesto = [
+            f"{modulo.app_name}:{patron.name}"
+            for modulo in MODULOS_URLS for patron in modulo.urlpatterns
+            if presupuesto_de(patron.callback) is None
+        ]
+        self.assertEqual(sin_presupuesto, [])
+
+    def test_escenarios_cubren_todas_las_vistas(self):
+        vistas = {_vista(patron.callback) for modulo in MODULOS_URLS for patron in modulo.urlpatterns}
+        cubiertas = {_vista(resolve(reverse(nombre, kwargs=kwargs)).func) for nombre, _, kwargs, _, _ in self.escenarios()}
+        self.assertEqual(sorted(v.__qualname__ for v in vistas - cubiertas), [])
+
+    def test_vistas_respetan_su_presupuesto(self):
+        for escenario in self.escenarios():
+            nombre, rol = escenario[:2]
+            with self.subTest(vista=nombre, rol=rol):
+                url, consultas = self.consultas(*escenario)
+                maximo = presupuesto_de(resolve(url).func)
+                self.assertIsNotNone(maximo, url)
+                self.assertLessEqual(consultas, maximo, f"{url} como {rol}")
+
+
+class AvanceEncuestaTests(TestCase):
+    """total_preguntas y preguntas_respondidas de Encuesta siguen a sus preguntas y respuestas."""
+
+    def setUp(self):
+        departamento = Departamento.objects.create(nombre_departamento="Aseo")
+        self.encuesta = Encuesta.objects.create(
+            titulo="Microbasural", descripcion="", ubicacion="Plaza", prioridad="Media", departamento=departamento,
+        )
+        self.preguntas = [
+            PreguntaEncuesta.objects.create(encuesta=self.encuesta, texto_pregunta=texto, descripcion="")
+            for texto in ("¿Volumen?", "¿Hay escombros?")
+        ]
+
+    def avance(self):
+        self.encuesta.refresh_from_db()
+        return self.encuesta.preguntas_respondidas, self.encuesta.total_preguntas
+
+    def test_respuestas_actualizan_avance(self):
+        self.assertEqual(self.avance(), (0, 2))
+        self.assertFalse(self.encuesta.completa)
+        primera = RespuestaEncuesta.objects.create(pregunta=self.preguntas[0], texto_respuesta="Alto", tipo="texto")
+        RespuestaEncuesta.objects.create(pregunta=self.preguntas[0], texto_respuesta="Medio", tipo="texto")
+        self.assertEqual(self.avance(), (1, 2))
+        RespuestaEncuesta.objects.create(pregunta=self.preguntas[1], texto_respuesta="Sí", tipo="texto")
+        self.assertEqual(self.avance(), (2, 2))
+        self.assertTrue(self.encuesta.completa)
+        primera.delete()
+        self.assertEqual(self.avance(), (2, 2))
+        self.preguntas[1].delete()
+        self.assertEqual(self.avance(), (1, 1))
+        PreguntaEncuesta.objects.create(encuesta=self.encuesta, texto_pregunta="¿Olor?", descripcion="")
+        self.assertEqual(self.avance(), (1, 2))
+        self.assertEqual(self.encuesta.preguntas_pendientes, 1)
+
+    def test_editar_encuesta_no_pisa_el_avance_de_una_respuesta_concurrente(self):
+        cargada = Encuesta.objects.get(pk=self.encuesta.pk)
+        RespuestaEncuesta.objects.create(pregunta=self.preguntas[0], texto_respuesta="Alto", tipo="texto")
+        PreguntaEncuesta.objects.create(encuesta=self.encuesta, texto_pregunta="¿Olores?", descripcion="")
+        cargada.titulo = "Microbasural junto al colegio"
+        cargada.save()
+        self.assertEqual(self.avance(), (1, 3))
+        self.assertEqual(self.encuesta.titulo, "Microbasural junto al colegio")
+        self.assertEqual(buscar(Encuesta.objects.all(), "colegio").get(), self.encuesta)
+
+
+class ExportacionTests(SimpleTestCase):
+    """CSV y XLSX de core.exportacion."""
+
+    encabezados = ["ID", "Título", "Teléfono", "Latitud", "Creada"]
+    filas = [
+        (1, "=HYPERLINK(\"http://x\")", "+56911112222", -33.45, datetime(2025, 3, 1, 10, 30)),
+        (2, "Bache ñandú", None, -70.5, None),
+        (3, "@SUM(A1)", "-1", 0.0, None),
+        (4, "\tcelda", "\rcelda", 1.0, None),
+    ]
+
+    def csv(self):
+        return "".join(filas_csv(self.encabezados, iter(self.filas)))
+
+    def test_csv_empieza_con_bom_y_trae_encabezados(self):
+        contenido = self.csv()
+        self.assertTrue(contenido.startswith("\ufeff"))
+        lineas = list(csv.reader(io.StringIO(contenido[1:])))
+        self.assertEqual(lineas[0], self.encabezados)
+        self.assertEqual(len(lineas), len(self.filas) + 1)
+        self.assertEqual(lineas[2][1:3], ["Bache ñandú", ""])
+        self.assertEqual(lineas[1][4], "2025-03-01 10:30:00")
+
+    def test_csv_neutraliza_formulas(self):
+        lineas = list(csv.reader(io.StringIO(self.csv()[1:])))
+        self.assertEqual(lineas[1][1], "\'=HYPERLINK(\"http://x\")")
+        self.assertEqual(lineas[1][2], "\'+56911112222")
+        self.assertEqual(lineas[3][1:3], ["\'@SUM(A1)", "\'-1"])
+        self.assertEqual(lineas[4][1], "\'\tcelda")
+        self.assertEqual(lineas[1][3], "-33.45")
+
+    def xlsx(self):
+        return b"".join(filas_xlsx(self.encabezados, iter(self.filas), hoja="Incidencias"))
+
+    def test_xlsx_es_un_zip_valido_con_las_filas(self):
+        with zipfile.ZipFile(io.BytesIO(self.xlsx())) as archivo:
+            self.assertIsNone(archivo.testzip())
+            hoja = ElementTree.fromstring(archivo.read("xl/worksheets/sheet1.xml"))
+        ns = {"s": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+        filas = hoja.findall("s:sheetData/s:row", ns)
+        self.assertEqual(len(filas), len(self.filas) + 1)
+        textos = [t.text for t in filas[2].iter(f"{{{ns['s']}}}t")]
+        self.assertEqual(textos, ["Bache ñandú"])
+
+    @unittest.skipIf(openpyxl is None, "openpyxl no está instalado")
+    def test_xlsx_abre_con_openpyxl(self):
+        libro = openpyxl.load_workbook(io.BytesIO(self.xlsx()), read_only=True)
+        filas = list(libro["Incidencias"].iter_rows(values_only=True))
+        self.assertEqual(list(filas[0]), self.encabezados)
+        self.assertEqual(filas[1][1], "=HYPERLINK(\"http://x\")")
+        self.assertEqual(filas[1][4], datetime(2025, 3, 1, 10, 30))
+
+
+
+class EtagCsrfTests(TestCase):
+    """El ETag de las vistas con formularios cambia cuando rota el token CSRF."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", "admin@municipalidad.local", "clave-segura-123")
+        Direccion.objects.create(nombre_direccion="Operaciones")
+        self.client.force_login(self.admin)
+        self.url = reverse("organizacion:direcciones_lista")
+
+    def test_304_con_el_mismo_token_y_200_tras_rotarlo(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.cookies["csrftoken"] = "a" * 32
+        respuesta = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta["ETag"], etag)
+
+
+class ReferenciasArchivoTests(TestCase):
+    """ArchivoEvidencia cuenta cuántas evidencias comparten cada archivo deduplicado."""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajuste = override_settings(MEDIA_ROOT=self.media)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        self.storage = Multimedia._meta.get_field("archivo").storage
+
+    def evidencia(self, contenido, nombre="foto.txt"):
+        return Multimedia.objects.create(
+            nombre=nombre, archivo=ContentFile(contenido, name=nombre), tipo="documento", formato="txt",
+        )
+
+    def referencias(self, ruta):
+        registro = ArchivoEvidencia.objects.filter(ruta=ruta).first()
+        return registro.referencias if registro else None
+
+    def test_subidas_iguales_comparten_archivo(self):
+        a, b = self.evidencia(b"mismo contenido"), self.evidencia(b"mismo contenido")
+        self.assertEqual(a.archivo.name, b.archivo.name)
+        self.assertEqual(self.referencias(a.archivo.name), 2)
+        self.assertTrue(self.storage.exists(a.archivo.name))
+
+    def test_borrar_una_de_dos_referencias_conserva_el_archivo(self):
+        a, b = self.evidencia(b"compartido"), self.evidencia(b"compartido")
+        ruta = a.archivo.name
+        with self.captureOnCommitCallbacks(execute=True):
+            a.delete()
+        self.assertEqual(self.referencias(ruta), 1)
+        self.assertTrue(self.storage.exists(ruta))
+        with self.captureOnCommitCallbacks(execute=True):
+            b.delete()
+        self.assertIsNone(self.referencias(ruta))
+        self.assertFalse(self.storage.exists(ruta))
+
+    def test_reemplazar_archivo_mueve_la_referencia(self):
+        evidencia = self.evidencia(b"version 1")
+        anterior = evidencia.archivo.name
+        with self.captureOnCommitCallbacks(execute=True):
+            evidencia.archivo = ContentFile(b"version 2", name="foto.txt")
+            evidencia.save()
+        self.assertNotEqual(evidencia.archivo.name, anterior)
+        self.assertIsNone(self.referencias(anterior))
+        self.assertFalse(self.storage.exists(anterior))
+        self.assertEqual(self.referencias(evidencia.archivo.name), 1)
+
+    def test_volver_a_guardar_el_mismo_contenido_no_suma(self):
+        evidencia = self.evidencia(b"igual")
+        evidencia.archivo = ContentFile(b"igual", name="foto.txt")
+        evidencia.save()
+        self.assertEqual(self.referencias(evidencia.archivo.name), 1)
+
+    def test_subida_durante_la_limpieza_no_pierde_el_archivo(self):
+        primera = self.evidencia(b"carrera")
+        ruta = primera.archivo.name
+        with self.captureOnCommitCallbacks() as limpiezas:
+            primera.delete()
+        segunda = Multimedia(nombre="foto.txt", tipo="documento", formato="txt")
+        segunda.archivo.save("foto.txt", ContentFile(b"carrera"), save=False)
+        for limpieza in limpiezas:
+            limpieza()
+        segunda.save()
+        self.assertEqual(segunda.archivo.name, ruta)
+        self.assertEqual(self.referencias(ruta), 1)
+        self.assertTrue(self.storage.exists(ruta))
+
+
+class DerivadosTests(TestCase):
+    """La cola de derivados toca al dueño de la evidencia y no reintenta para siempre."""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajuste = override_settings(MEDIA_ROOT=self.media)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        departamento = Departamento.objects.create(nombre_departamento="Obras")
+        self.incidencia = Incidencia.objects.create(
+            titulo="Bache", descripcion="d", latitud=-33.45, longitud=-70.66, nombre_vecino="V",
+            correo_vecino="v@correo.cl", telefono_vecino="1", departamento=departamento,
+        )
+
+    def evidencia(self, contenido=b"x", tipo="documento"):
+        return Multimedia.objects.create(
+            nombre="foto", archivo=ContentFile(contenido, name="foto.png"), tipo=tipo, formato="png",
+            incidencia=self.incidencia,
+        )
+
+    @unittest.skipIf(Image is None, "Pillow no está instalado")
+    def test_generar_derivados_actualiza_la_incidencia(self):
+        salida = io.BytesIO()
+        Image.new("RGB", (8, 8), "red").save(salida, format="PNG")
+        evidencia = self.evidencia(salida.getvalue(), tipo="imagen")
+        antes = timezone.now() - timedelta(hours=1)
+        Incidencia.objects.filter(pk=self.incidencia.pk).update(actualizadoEl=antes)
+        derivados.generar_derivados(evidencia)
+        self.incidencia.refresh_from_db()
+        self.assertGreater(self.incidencia.actualizadoEl, antes)
+        self.assertTrue(Multimedia.objects.get(pk=evidencia.pk).miniatura)
+
+    def test_trabajo_colgado_se_reencola_hasta_agotar_intentos(self):
+        evidencia = self.evidencia()
+        reintentable = TrabajoDerivado.objects.create(multimedia=evidencia, estado="procesando", intentos=1)
+        agotado = TrabajoDerivado.objects.create(multimedia=evidencia, estado="procesando", intentos=3)
+        TrabajoDerivado.objects.update(actualizadoEl=timezone.now() - timedelta(hours=1))
+        self.assertEqual(derivados.liberar_trabajos_colgados(minutos=30, max_intentos=3), 2)
+        reintentable.refresh_from_db()
+        agotado.refresh_from_db()
+        self.assertEqual(reintentable.estado, "pendiente")
+        self.assertEqual(agotado.estado, "error")
+        self.assertEqual(derivados.reclamar_trabajos(10), [reintentable])
+
+
+class BusquedaTests(TestCase):
+    """buscar() acepta prefijos y el vector se guarda en la misma escritura de save()."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@municipalidad.local", "clave-segura-123")
+        cls.departamento = Departamento.objects.create(nombre_departamento="Obras")
+        cls.en_titulo = cls.incidencia("Bache profundo", "Calle Larga")
+        cls.en_descripcion = cls.incidencia("Calzada dañada", "Hay un bache enorme")
+
+    @classmethod
+    def incidencia(cls, titulo, descripcion):
+        return Incidencia.objects.create(
+            titulo=titulo, descripcion=descripcion, latitud=-33.45, longitud=-70.66, nombre_vecino="V",
+            correo_vecino="v@correo.cl", telefono_vecino="1", departamento=cls.departamento,
+        )
+
+    def ids(self, texto):
+        return set(buscar(Incidencia.objects.all(), texto).values_list("pk", flat=True))
+
+    def test_prefijo_encuentra_la_palabra_completa(self):
+        self.assertEqual(self.ids("bach"), {self.en_titulo.pk, self.en_descripcion.pk})
+        self.assertEqual(self.ids("calz"), {self.en_descripcion.pk})
+
+    def test_sintaxis_web_sigue_disponible(self):
+        self.assertEqual(self.ids("bache -calzada"), {self.en_titulo.pk})
+        self.assertEqual(self.ids('"bache enorme"'), {self.en_descripcion.pk})
+
+    def test_save_indexa_sin_un_segundo_update(self):
+        self.en_titulo.titulo = "Poste caído"
+        with CaptureQueriesContext(connection) as consultas:
+            self.en_titulo.save(update_fields=["titulo"])
+        updates = [c["sql"] for c in consultas if c["sql"].startswith('UPDATE "core_incidencia"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"busqueda"', updates[0])
+        self.assertEqual(self.ids("poste"), {self.en_titulo.pk})
+
+    def test_encuesta_se_indexa_con_su_departamento(self):
+        encuesta = Encuesta.objects.create(
+            titulo="Alumbrado", descripcion="d", ubicacion="u", prioridad="Alta", departamento=self.departamento,
+        )
+        self.assertEqual(list(buscar(Encuesta.objects.all(), "obra").values_list("pk", flat=True)), [encuesta.pk])
+
+    def test_lista_ordena_por_relevancia(self):
+        self.client.force_login(self.admin)
+        pagina = self.client.get(reverse("incidencias:incidencias_lista"), {"q": "bache"}).context["pagina"]
+        self.assertEqual([i.pk for i in pagina], [self.en_titulo.pk, self.en_descripcion.pk])
+
+    def test_cursor_por_relevancia(self):
+        qs = buscar(Incidencia.objects.all(), "bache")
+        primera = paginar_por_cursor(qs, por_pagina=1, campo="relevancia", convertir=float)
+        segunda = paginar_por_cursor(qs, primera.cursor_siguiente, por_pagina=1, campo="relevancia", convertir=float)
+        vuelta = paginar_por_cursor(qs, segunda.cursor_anterior, por_pagina=1, campo="relevancia", convertir=float)
+        self.assertEqual([i.pk for i in primera], [self.en_titulo.pk])
+        self.assertEqual([i.pk for i in segunda], [self.en_descripcion.pk])
+        self.assertFalse(segunda.tiene_siguiente)
+        self.assertEqual([i.pk for i in vuelta], [self.en_titulo.pk])
+
+
+class BuscarUsuariosTests(TestCase):
+    """buscar_usuarios tolera errores de tipeo (pg_trgm), coincide por subcadena y ordena por similitud."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.gonzales = User.objects.create_user("mgonzales", "marta@municipalidad.local", first_name="Marta", last_name="Gonzales")
+        cls.gonzalez = User.objects.create_user("fgonzalez", "fernanda@municipalidad.local", first_name="Fernanda", last_name="Gonzalez")
+        cls.rojas = User.objects.create_user("projas", "pedro.rojas@municipalidad.local", first_name="Pedro", last_name="Rojas")
+
+    def buscar(self, texto):
+        return list(buscar_usuarios(User.objects.all(), texto))
+
+    def test_subcadena_corta_coincide_aunque_no_sea_parecida(self):
+        self.assertEqual(self.buscar("oja"), [self.rojas])
+        self.assertEqual(self.buscar("PEDRO.R"), [self.rojas])
+
+    def test_tolera_errores_de_tipeo(self):
+        self.assertEqual(self.buscar("Fernada"), [self.gonzalez])
+        self.assertCountEqual(self.buscar("Gonzalex"), [self.gonzalez, self.gonzales])
+        self.assertEqual(self.buscar("Zapata"), [])
+
+    def test_ordena_por_similitud_y_no_por_id(self):
+        resultado = self.buscar("Gonzalez")
+        self.assertEqual(resultado, [self.gonzalez, self.gonzales])
+        self.assertEqual(resultado[0].similitud, 1)
+        self.assertLess(resultado[1].similitud, 1)
+        self.assertEqual(self.buscar("Gonzales"), [self.gonzales, self.gonzalez])
+
+    def test_usuarios_lista_usa_la_busqueda(self):
+        admin = User.objects.create_superuser("admin", "admin@municipalidad.local", "clave-segura-123")
+        self.client.force_login(admin)
+        url = reverse("core:usuarios_lista")
+        self.assertEqual(list(self.client.get(url, {"q": "Fernada"}).context["usuarios"]), [self.gonzalez])
+        self.assertEqual(list(self.client.get(url, {"q": "Gonzalez"}).context["usuarios"]), [self.gonzalez, self.gonzales])
+
+
+class ResumenPreguntaTests(TestCase):
+    """analitica.calcular agrega por tipo de pregunta y el resumen se recalcula una vez por transacción."""
+
+    @classmethod
+    def setUpTestData(cls):
+        departamento = Departamento.objects.create(nombre_departamento="Aseo")
+        cls.encuesta = Encuesta.objects.create(
+            titulo="Microbasural", descripcion="", ubicacion="Plaza", prioridad="Media", departamento=departamento,
+        )
+
+    def pregunta(self, tipo, *respuestas):
+        pregunta = PreguntaEncuesta.objects.create(
+            encuesta=self.encuesta, texto_pregunta=f"¿{tipo}?", descripcion="", tipo=tipo
+        )
+        RespuestaEncuesta.objects.bulk_create(
+            [RespuestaEncuesta(pregunta=pregunta, texto_respuesta=texto, tipo=tipo) for texto in respuestas]
+        )
+        return pregunta
+
+    def test_opciones_agrupan_sin_distinguir_mayusculas(self):
+        total, datos = analitica.calcular(self.pregunta("opcion", "Si", " si ", "No", ""))
+        self.assertEqual(total, 3)
+        self.assertEqual(
+            [(o["opcion"], o["cantidad"], o["porcentaje"]) for o in datos["opciones"]],
+            [("Si", 2, 66.7), ("No", 1, 33.3)],
+        )
+
+    def test_numeros_con_coma_y_no_numericas(self):
+        total, datos = analitica.calcular(self.pregunta("numero", "1", "2,5", "4", "mucho"))
+        self.assertEqual((total, datos["cantidad"], datos["no_numericas"]), (4, 3, 1))
+        self.assertEqual((datos["minimo"], datos["maximo"], datos["p50"]), (1.0, 4.0, 2.5))
+
+    def test_terminos_frecuentes_sin_palabras_vacias(self):
+        _, datos = analitica.calcular(self.pregunta("texto", "hay basura en la esquina", "basura y escombros"))
+        terminos = {t["termino"]: t["respuestas"] for t in datos["terminos"]}
+        self.assertEqual(terminos["basura"], 2)
+        self.assertNotIn("en", terminos)
+
+    def test_un_recalculo_por_pregunta_y_transaccion(self):
+        pregunta = self.pregunta("opcion")
+        with self.captureOnCommitCallbacks(execute=True) as pendientes:
+            for texto in ("Si", "No", "Si"):
+                RespuestaEncuesta.objects.create(pregunta=pregunta, texto_respuesta=texto, tipo="opcion")
+        self.assertEqual(len(pendientes), 1)
+        self.assertEqual(ResumenPregunta.objects.get(pregunta=pregunta).total, 3)
+
+    def test_vista_de_resultados_en_json(self):
+        pregunta = self.pregunta("opcion", "Si", "No")
+        self.client.force_login(User.objects.create_user("vecino", "vecino@correo.cl", "clave-segura-123"))
+        respuesta = self.client.get(
+            reverse("territorial_app:encuesta_resultados", args=[self.encuesta.pk]), {"formato": "json"}
+        )
+        datos = respuesta.json()
+        self.assertEqual(datos["encuesta"], self.encuesta.pk)
+        self.assertEqual([(p["id"], p["total_respuestas"]) for p in datos["preguntas"]], [(pregunta.pk, 2)])
+
+
+class GenerarDatosTests(TestCase):
+    """generar_datos no planta un administrador con contraseña conocida."""
+
+    def test_se_niega_sin_debug(self):
+        with self.assertRaises(CommandError):
+            call_command("generar_datos", incidencias=10, stdout=io.StringIO())
+        self.assertFalse(User.objects.exists())
+
+    def test_contrasena_solo_si_se_indica(self):
+        call_command("generar_datos", incidencias=10, forzar=True, contrasena="otra-clave-larga", stdout=io.StringIO())
+        self.assertTrue(User.objects.get(username=usuario("admin")).check_password("otra-clave-larga"))
+
+    def test_sin_contrasena_no_se_puede_iniciar_sesion(self):
+        generar(incidencias=10, prefijo="sinclave")
+        self.assertFalse(User.objects.get(username=usuario("admin", prefijo="sinclave")).has_usable_password())
+
+
+class ContadorIncidenciasTests(TestCase):
+    """ContadorIncidencias sigue a las incidencias por save(), delete() y QuerySet.update()."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.obras = Departamento.objects.create(nombre_departamento="Obras")
+        cls.aseo = Departamento.objects.create(nombre_departamento="Aseo")
+
+    def crear(self, departamento, **campos):
+        return Incidencia.objects.create(
+            titulo="Bache", descripcion="d", latitud=-33.45, longitud=-70.66, nombre_vecino="V",
+            correo_vecino="v@correo.cl", telefono_vecino="1", departamento=departamento, **campos,
+        )
+
+    def contadores(self):
+        return {
+            (c.departamento_id, c.estado): c.total
+            for c in ContadorIncidencias.objects.exclude(total=0)
+        }
+
+    def en_vivo(self):
+        return {
+            (f["departamento_id"], f["estado"]): f["total"]
+            for f in Incidencia.objects.values("departamento_id", "estado").annotate(total=Count("id")).order_by()
+        }
+
+    def test_crear_cambiar_estado_y_departamento_y_borrar(self):
+        incidencia = self.crear(self.obras)
+        self.assertEqual(self.contadores(), {(self.obras.pk, "Pendiente"): 1})
+        incidencia.estado = "En Progreso"
+        incidencia.save()
+        self.assertEqual(self.contadores(), {(self.obras.pk, "En Progreso"): 1})
+        incidencia.departamento = self.aseo
+        incidencia.save(update_fields=["departamento"])
+        self.assertEqual(self.contadores(), {(self.aseo.pk, "En Progreso"): 1})
+        incidencia.delete()
+        self.assertEqual(self.contadores(), {})
+
+    def test_queryset_update_ajusta_contadores(self):
+        for _ in range(3):
+            self.crear(self.obras)
+        self.crear(self.aseo, estado="Completada")
+        primeras = Incidencia.objects.filter(departamento=self.obras).order_by("pk").values("pk")[:2]
+        Incidencia.objects.filter(estado="Pendiente", pk__in=primeras).update(estado="En Progreso")
+        Incidencia.objects.filter(departamento=self.aseo).update(departamento=None)
+        self.assertEqual(self.contadores(), self.en_vivo())
+        self.assertEqual(self.contadores()[(self.obras.pk, "En Progreso")], 2)
+
+    def test_recalcular_contadores_coincide_con_count(self):
+        incidencias = [self.crear(self.obras), self.crear(self.obras), self.crear(self.aseo)]
+        incidencias[0].estado = "En Progreso"
+        incidencias[0].save()
+        incidencias[2].delete()
+        esperados = self.en_vivo()
+        self.assertEqual(self.contadores(), esperados)
+        ContadorIncidencias.objects.update(total=99)
+        call_command("recalcular_contadores", stdout=io.StringIO())
+        self.assertEqual(self.contadores(), esperados)
+
+
+class PaginacionCursorTests(TestCase):
+    """paginar_por_cursor recorre páginas en ambas direcciones, con empates en creadoEl."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@municipalidad.local", "clave-segura-123")
+        departamento = Departamento.objects.create(nombre_departamento="Obras")
+        Incidencia.objects.bulk_create([
+            Incidencia(
+                titulo=f"Incidencia {i}", descripcion="d", latitud=-33.45, longitud=-70.66, nombre_vecino="V",
+                correo_vecino="v@correo.cl", telefono_vecino="1", departamento=departamento,
+            )
+            for i in range(7)
+        ])
+        cls.fecha = timezone.now() - timedelta(days=1)
+        Incidencia.objects.update(creadoEl=cls.fecha)
+        cls.orden = list(Incidencia.objects.order_by("-id").values_list("pk", flat=True))
+
+    def pagina(self, cursor=None):
+        return paginar_por_cursor(Incidencia.objects.all(), cursor, por_pagina=3)
+
+    def test_avanza_y_retrocede_con_empates_en_creado(self):
+        paginas = [self.pagina()]
+        while paginas[-1].tiene_siguiente:
+            paginas.append(self.pagina(paginas[-1].cursor_siguiente))
+        self.assertEqual([[i.pk for i in p] for p in paginas], [self.orden[:3], self.orden[3:6], self.orden[6:]])
+        self.assertFalse(paginas[0].tiene_anterior)
+
+        atras = self.pagina(paginas[2].cursor_anterior)
+        self.assertEqual([i.pk for i in atras], self.orden[3:6])
+        primera = self.pagina(atras.cursor_anterior)
+        self.assertEqual([i.pk for i in primera], self.orden[:3])
+        self.assertFalse(primera.tiene_anterior)
+        self.assertTrue(primera.tiene_siguiente)
+
+    def test_cursor_corrupto_vuelve_a_la_primera_pagina(self):
+        fecha = self.fecha.isoformat()
+        invalidos = ["%%%", "no-es-base64"] + [
+            base64.urlsafe_b64encode(crudo).decode()
+            for crudo in (
+                f"x|{fecha}|1".encode(), b"s|2024-13-45T99:00:00|1", f"s|{fecha}|uno".encode(),
+                f"s|{fecha}".encode(), b"\xff\xfe|a|b",
+            )
+        ]
+        for cursor in invalidos:
+            with self.subTest(cursor=cursor):
+                self.assertEqual([i.pk for i in self.pagina(cursor)], self.orden[:3])
+
+    def test_vista_no_falla_con_cursor_alterado(self):
+        self.client.force_login(self.admin)
+        url = reverse("incidencias:incidencias_lista")
+        for cursor in ("%%%", codificar_cursor("s", self.fecha, 10 ** 30)):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(url, {"cursor": cursor}).status_code, 200)
+
+
+class BackendContado(locmem.EmailBackend):
+    """locmem que cuenta conexiones y rechaza destinatarios de @rechaza.cl."""
+
+    aperturas = 0
+
+    def open(self):
+        type(self).aperturas += 1
+        return super().open()
+
+    def send_messages(self, mensajes):
+        for mensaje in mensajes:
+            if any(d.endswith("@rechaza.cl") for d in mensaje.to):
+                raise smtplib.SMTPRecipientsRefused({mensaje.to[0]: (550, b"No existe")})
+        return super().send_messages(mensajes)
+
+
+class BackendCaido(locmem.EmailBackend):
+    def open(self):
+        raise ConnectionRefusedError("SMTP caído")
+
+
+@override_settings(EMAIL_BACKEND="core.tests.BackendContado")
+class CorreosTests(TestCase):
+    """La bandeja de salida envía por una conexión, reintenta con espera y no reintenta para siempre."""
+
+    def setUp(self):
+        BackendContado.aperturas = 0
+
+    def encolar(self, destinatario="vecino@correo.cl", **campos):
+        correo = correos.encolar_correo("Aviso", "Cuerpo", [destinatario])
+        if campos:
+            CorreoPendiente.objects.filter(pk=correo.pk).update(**campos)
+        return correo
+
+    def test_reclamar_solo_toma_los_vencidos_y_los_marca_enviando(self):
+        vencido = self.encolar()
+        self.encolar(proximo_intento=timezone.now() + timedelta(minutes=5))
+        reclamados = correos.reclamar_correos(10)
+        self.assertEqual([c.pk for c in reclamados], [vencido.pk])
+        self.assertEqual((reclamados[0].estado, reclamados[0].intentos), ("enviando", 1))
+        self.assertEqual(correos.reclamar_correos(10), [])
+
+    def test_espera_reintento_crece_exponencialmente_con_tope(self):
+        self.assertEqual(
+            [correos.espera_reintento(i).total_seconds() for i in (1, 2, 3, 4)],
+            [correos.ESPERA_BASE * 2 ** n for n in range(4)],
+        )
+        self.assertEqual(correos.espera_reintento(50).total_seconds(), correos.ESPERA_MAXIMA)
+
+    def test_enviar_lote_usa_una_conexion_y_reprograma_los_fallidos(self):
+        self.encolar("ana@correo.cl")
+        self.encolar("nadie@rechaza.cl")
+        self.encolar("beto@correo.cl")
+        antes = timezone.now()
+        resultado = {c.destinatarios[0]: c for c in correos.enviar_lote(correos.reclamar_correos(10))}
+        self.assertEqual(BackendContado.aperturas, 1)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ["ana@correo.cl", "beto@correo.cl"])
+        self.assertEqual(resultado["ana@correo.cl"].estado, "enviado")
+        fallido = CorreoPendiente.objects.get(pk=resultado["nadie@rechaza.cl"].pk)
+        self.assertEqual(fallido.estado, "pendiente")
+        self.assertTrue(fallido.ultimo_error.startswith("SMTPRecipientsRefused"))
+        self.assertGreaterEqual(fallido.proximo_intento, antes + correos.espera_reintento(1))
+
+    def test_fallo_al_agotar_intentos_queda_en_error(self):
+        self.encolar("nadie@rechaza.cl", intentos=2)
+        [correo] = correos.enviar_lote(correos.reclamar_correos(10), max_intentos=3)
+        correo.refresh_from_db()
+        self.assertEqual((correo.estado, correo.intentos), ("error", 3))
+
+    @override_settings(EMAIL_BACKEND="core.tests.BackendCaido")
+    def test_servidor_caido_reprograma_todo_el_lote(self):
+        self.encolar()
+        self.encolar()
+        correos.enviar_lote(correos.reclamar_correos(10))
+        self.assertEqual(list(CorreoPendiente.objects.values_list("estado", flat=True)), ["pendiente"] * 2)
+        self.assertEqual(mail.outbox, [])
+
+    def test_correo_colgado_se_reencola_hasta_agotar_intentos(self):
+        hace_una_hora = timezone.now() - timedelta(hours=1)
+        reintentable = self.encolar(estado="enviando", intentos=1, proximo_intento=hace_una_hora)
+        agotado = self.encolar(estado="enviando", intentos=5, proximo_intento=hace_una_hora)
+        self.assertEqual(correos.liberar_correos_colgados(minutos=30, max_intentos=5), 2)
+        reintentable.refresh_from_db()
+        agotado.refresh_from_db()
+        self.assertEqual(reintentable.estado, "pendiente")
+        self.assertEqual(agotado.estado, "error")
+        self.assertEqual(correos.reclamar_correos(10), [reintentable])
+
+
+@override_settings(EMAIL_BACKEND="core.tests.BackendContado")
+class DespachoCorreosTests(TransactionTestCase):
+    """El despacho en hilos: cada uno con su conexión, sin reclamar el mismo correo dos veces."""
+
+    def test_comando_despacha_la_cola(self):
+        correos.encolar_correo("Aviso", "Cuerpo", ["ana@correo.cl"])
+        correos.encolar_correo("Aviso", "Cuerpo", ["nadie@rechaza.cl"])
+        salida, errores = io.StringIO(), io.StringIO()
+        call_command("enviar_correos", hilos=2, lote=1, stdout=salida, stderr=errores)
+        self.assertIn("Correos enviados: 1 (fallidos: 1)", salida.getvalue())
+        self.assertIn("(pendiente): SMTPRecipientsRefused", errores.getvalue())
+        self.assertEqual(
+            sorted(CorreoPendiente.objects.values_list("estado", flat=True)), ["enviado", "pendiente"]
+        )
+
+    def test_salta_los_correos_bloqueados_por_otro_despachador(self):
+        bloqueado = correos.encolar_correo("Aviso", "Cuerpo", ["a@correo.cl"])
+        libre = correos.encolar_correo("Aviso", "Cuerpo", ["b@correo.cl"])
+        tomado, soltar = threading.Event(), threading.Event()
+
+        def otro_despachador():
+            try:
+                with transaction.atomic():
+                    CorreoPendiente.objects.select_for_update().get(pk=bloqueado.pk)
+                    tomado.set()
+                    soltar.wait(10)
+            finally:
+                connection.close()
+
+        hilo = threading.Thread(target=otro_despachador)
+        hilo.start()
+        try:
+            self.assertTrue(tomado.wait(10))
+            self.assertEqual([c.pk for c in correos.reclamar_correos(10)], [libre.pk])
+        finally:
+            soltar.set()
+            hilo.join()
+        self.assertEqual(CorreoPendiente.objects.get(pk=bloqueado.pk).estado, "pendiente")
+
+
+class InstrumentacionTests(TestCase):
+    """Percentiles, buffer circular, formato Prometheus y medición de requests (también en streaming)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@municipalidad.local", "clave-segura-123")
+
+    def setUp(self):
+        self.addCleanup(setattr, Template, "render", Template.render)
+        instrumentacion.registro.vaciar()
+        self.addCleanup(instrumentacion.registro.vaciar)
+
+    def test_percentil_por_rango_mas_cercano(self):
+        valores = list(range(10, 0, -1))
+        self.assertEqual([instrumentacion.percentil(valores, p) for p in (50, 90, 99, 100)], [5, 9, 10, 10])
+        self.assertEqual(instrumentacion.percentil([7], 1), 7)
+
+    def test_registro_conserva_solo_la_ventana_pero_cuenta_todo(self):
+        registro = instrumentacion.Registro(ventana=3)
+        for consultas in (100, 1, 2, 3):
+            registro.agregar("core:metricas", consultas, 0, 0, 0)
+        fila = registro.resumen()["core:metricas"]
+        self.assertEqual((fila["requests"], fila["ventana"]), (4, 3))
+        self.assertEqual(fila["consultas"], {"p50": 2, "p90": 3, "p99": 3, "promedio": 2})
+
+    def test_formato_prometheus(self):
+        registro = instrumentacion.Registro()
+        registro.agregar('a"b', 4, 20, 0, 1500)
+        registro.agregar('a"b', 2, 10, 0, 500)
+        texto = registro.prometheus()
+        self.assertTrue(texto.endswith("\n"))
+        lineas = texto.splitlines()
+        self.assertIn("# TYPE vista_consultas summary", lineas)
+        self.assertIn('vista_consultas{vista="a\\"b",quantile="0.5"} 2', lineas)
+        self.assertIn('vista_consultas_sum{vista="a\\"b"} 6', lineas)
+        self.assertIn('vista_duracion_segundos{vista="a\\"b",quantile="0.99"} 1.5', lineas)
+        self.assertIn('vista_duracion_segundos_count{vista="a\\"b"} 2', lineas)
+
+    def test_render_cronometrado_solo_dentro_de_una_medicion(self):
+        instrumentacion.instalar()
+        plantilla = engines["django"].from_string("{{ valor }}")
+        self.assertEqual(plantilla.render({"valor": "fuera"}), "fuera")
+        salida, medicion = instrumentacion.medir(lambda m: plantilla.render({"valor": "dentro"}))
+        self.assertEqual(salida, "dentro")
+        self.assertGreater(medicion.plantillas, 0)
+        self.assertEqual(medicion.profundidad, 0)
+
+    @override_settings(INSTRUMENTACION_MUESTREO=1)
+    def test_middleware_registra_consultas_y_plantillas_por_vista(self):
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(reverse("incidencias:incidencias_lista")).status_code, 200)
+        fila = instrumentacion.registro.resumen()["incidencias:incidencias_lista"]
+        self.assertEqual(fila["requests"], 1)
+        self.assertGreater(fila["consultas"]["p50"], 0)
+        self.assertGreater(fila["plantillas_ms"]["p50"], 0)
+
+    @override_settings(INSTRUMENTACION_MUESTREO=1)
+    def test_streaming_se_registra_al_terminar_de_recorrerlo(self):
+        self.client.force_login(self.admin)
+        respuesta = self.client.get(reverse("incidencias:incidencias_exportar"))
+        self.assertNotIn("incidencias:incidencias_exportar", instrumentacion.registro.resumen())
+        b"".join(respuesta.streaming_content)
+        fila = instrumentacion.registro.resumen()["incidencias:incidencias_exportar"]
+        self.assertEqual(fila["requests"], 1)
+        self.assertGreaterEqual(fila["consultas"]["p50"], 1)
+
+
+class MetricasAccesoTests(TestCase):
+    """Las métricas solo se entregan a staff o al recolector con el token."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("staff", "staff@municipalidad.local", "clave-segura-123", is_staff=True)
+        cls.usuario = User.objects.create_user("usuario", "usuario@municipalidad.local", "clave-segura-123")
+
+    def pedir(self, nombre="core:metricas_prometheus", **cabeceras):
+        return self.client.get(reverse(nombre), headers=cabeceras)
+
+    @override_settings(INSTRUMENTACION_TOKEN="secreto")
+    def test_token_correcto_accede_e_incorrecto_no(self):
+        self.assertEqual(self.pedir().status_code, 403)
+        self.assertEqual(self.pedir(Authorization="Bearer otro").status_code, 403)
+        self.assertEqual(self.pedir(Authorization="secreto").status_code, 403)
+        respuesta = self.pedir(Authorization="Bearer secreto")
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertEqual(self.pedir("core:metricas", Authorization="Bearer secreto").status_code, 200)
+
+    @override_settings(INSTRUMENTACION_TOKEN="")
+    def test_sin_token_configurado_no_acepta_bearer_vacio(self):
+        self.assertEqual(self.pedir(Authorization="Bearer ").status_code, 403)
+        self.assertEqual(self.pedir("core:metricas", Authorization="Bearer").status_code, 403)
+
+    def test_solo_staff_accede_con_su_sesion(self):
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.pedir("core:metricas").status_code, 403)
+        self.client.force_login(self.staff)
+        respuesta = self.pedir("core:metricas")
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn("vistas", respuesta.json())
@@ -11,4 +11,6 @@ urlpatterns = [
     path("usuarios/<int:pk>/", views.usuario_detalle, name="usuario_detalle"),
     path("usuarios/<int:pk>/editar/", views.usuario_editar, name="usuario_editar"),
     path("usuarios/<int:pk>/toggle/", views.usuario_toggle_activo, name="usuario_toggle_activo"),
+    path("metricas/", views.metricas, name="metricas"),
+    path("metricas/prometheus/", views.metricas_prometheus, name="metricas_prometheus"),
 ]
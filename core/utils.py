@@ -3,40 +3,77 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from functools import wraps
 
+ROLES_SESION = "_roles"
+
+
+def roles_de(u):
+    """
+    Devuelve el conjunto de nombres de grupo del usuario.
+    Se resuelve una vez por request y queda guardado en el objeto usuario.
+    En requests, RolesMiddleware lo deja listo desde la sesión (ver
+    roles_en_sesion), así que normalmente no consulta auth_group.
+    """
+    if not u.is_authenticated:
+        return frozenset()
+    roles = getattr(u, "_roles_cache", None)
+    if roles is None:
+        roles = frozenset(u.groups.values_list("name", flat=True))
+        u._roles_cache = roles
+    return roles
+
+
+def roles_en_sesion(sesion, u):
+    """
+    Guarda los roles en la sesión junto con Profile.version_roles, que
+    registration.signals incrementa cuando cambian los grupos del usuario.
+    Mientras la versión coincida los toma de ahí; como la versión está en la
+    base de datos, un cambio rige en el siguiente request de cualquier worker.
+    """
+    perfil = getattr(u, "profile", None)
+    if perfil is None:
+        return roles_de(u)
+    guardado = sesion.get(ROLES_SESION)
+    if guardado and guardado[0] == perfil.version_roles:
+        u._roles_cache = frozenset(guardado[1])
+    else:
+        sesion[ROLES_SESION] = [perfil.version_roles, sorted(roles_de(u))]
+    return u._roles_cache
+
+
 def es_admin(u):
     """Verifica si el usuario es Administrador o Superusuario"""
-    return u.is_authenticated and (u.is_superuser or u.groups.filter(name="Administrador").exists())
+    return u.is_authenticated and (u.is_superuser or "Administrador" in roles_de(u))
 
 def es_territorial(u):
     """Verifica si el usuario es Territorial"""
-    return u.is_authenticated and u.groups.filter(name="Territorial").exists()
+    return u.is_authenticated and "Territorial" in roles_de(u)
 
 def es_admin_o_territorial(u):
     """Verifica si el usuario es Admin o Territorial"""
     return u.is_authenticated and (
         u.is_superuser or 
-        u.groups.filter(name__in=["Administrador", "Territorial"]).exists()
+        bool(roles_de(u) & {"Administrador", "Territorial"})
     )
 
 def es_direccion(u):
     """Verifica si el usuario es Dirección"""
     return u.is_authenticated and (
         u.is_superuser or 
-        u.groups.filter(name="Dirección").exists()
+        "Dirección" in roles_de(u)
     )
 
 def es_departamento(u):
     """Verifica si el usuario es Departamento"""
     return u.is_authenticated and (
         u.is_superuser or 
-        u.groups.filter(name="Departamento").exists()
+        "Departamento" in roles_de(u)
     )
 
 def es_cuadrilla(u):
     """Verifica si el usuario es Jefe de Cuadrilla"""
     return u.is_authenticated and (
         u.is_superuser or 
-        u.groups.filter(name="Jefe de Cuadrilla").exists()
+        "Jefe de Cuadrilla" in roles_de(u)
     )
 
 
@@ -173,7 +210,7 @@ def admin_territorial_cuadrilla(function):
             messages.warning(request, "Debes iniciar sesión para acceder.")
             return redirect('/accounts/login/')
         
-        grupos = set(request.user.groups.values_list("name", flat=True))
+        grupos = roles_de(request.user)
         
         if request.user.is_superuser or grupos & {"Administrador", "Territorial", "Jefe de Cuadrilla"}:
             return function(request, *args, **kwargs)
@@ -182,3 +219,26 @@ def admin_territorial_cuadrilla(function):
         return redirect('personas:check_profile')
     
     return wrap
+
+
+def presupuesto_consultas(maximo):
+    """
+    Declara cuántas consultas SQL puede hacer un request a la vista (incluidas
+    sesión, usuario y roles). Sirve para funciones y para clases (ViewSet).
+    Queda en el atributo `presupuesto_consultas` (ver presupuesto_de); lo
+    verifican las pruebas de core y, con DEBUG, PresupuestoConsultasMiddleware
+    avisa en el log cuando se supera.
+    """
+    def decorador(vista):
+        vista.presupuesto_consultas = maximo
+        return vista
+    return decorador
+
+
+def presupuesto_de(vista):
+    """Presupuesto de la vista que resolvió la URL (función o as_view() de una clase), o None."""
+    maximo = getattr(vista, "presupuesto_consultas", None)
+    if maximo is None:
+        clase = getattr(vista, "cls", None) or getattr(vista, "view_class", None)
+        maximo = getattr(clase, "presupuesto_consultas", None)
+    return maximo
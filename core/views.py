@@ -1,24 +1,34 @@
+import codecs
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.utils.crypto import constant_time_compare
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.models import User, Group
 from django.contrib import messages
-from django.db.models import Q
+from . import instrumentacion
+from .busqueda import buscar_usuarios
 from django.views.decorators.http import require_POST
 from registration.models import Profile
 from .utils import solo_admin
-from core.models import Incidencia, Departamento, Direccion
+from core.models import Incidencia, Departamento, Direccion, ContadorIncidencias
 from .forms import UsuarioCrearForm
+from personas.importacion import MAX_FILAS_WEB, importar_usuarios
 from django.contrib.auth.decorators import login_required
 
+MAX_ERRORES_MENSAJE = 100
+
 
 @solo_admin
 def dashboard_admin(request):
-    ultimos_usuarios = Profile.objects.order_by('-id')[:5] 
-    ultimas_direcciones = Direccion.objects.order_by('-creadoEl')[:5]
-    ultimos_departamentos = Departamento.objects.order_by('-creadoEl')[:5]
-    ultimas_incidencias = Incidencia.objects.order_by('-creadoEl')[:5]
+    ultimos_usuarios = Profile.objects.select_related('user', 'group').order_by('-id')[:5] 
+    ultimas_direcciones = Direccion.objects.select_related('encargado__user').order_by('-creadoEl')[:5]
+    ultimos_departamentos = Departamento.objects.select_related('encargado__user').order_by('-creadoEl')[:5]
+    ultimas_incidencias = Incidencia.objects.select_related('departamento__direccion').order_by('-creadoEl')[:5]
     total_usuarios = Profile.objects.count()
-    total_incidencias_creadas = Incidencia.objects.count()
-    total_incidencias_finalizadas = Incidencia.objects.filter(estado='Completada').count()
+    totales = ContadorIncidencias.totales_por_estado()
+    total_incidencias_creadas = sum(totales.values())
+    total_incidencias_finalizadas = totales['Completada']
 
     contexto = {
         'ultimos_usuarios': ultimos_usuarios,
@@ -42,12 +52,7 @@ def usuarios_lista(request):
     qs = User.objects.all().order_by("id")
 
     if q:
-        qs = qs.filter(
-            Q(username__icontains=q) |
-            Q(first_name__icontains=q) |
-            Q(last_name__icontains=q) |
-            Q(email__icontains=q)
-        )
+        qs = buscar_usuarios(qs, q)
     
     if rol_seleccionado:
         qs = qs.filter(groups__name=rol_seleccionado).distinct()
@@ -73,57 +78,16 @@ def usuarios_lista(request):
 @login_required
 @solo_admin
 def usuario_crear(request):
-    ROL_VALIDOS = ["Administrador", "Dirección", "Departamento", "Jefe de Cuadrilla", "Territorial"]
-
     if request.method == "POST" and "crear_multiples" in request.POST:
-        bulk_data = request.POST.get("bulk_users", "").strip()
-        lines = bulk_data.split("\n")
-
-        creados = 0
-        errores = []
-
-        for linea in lines:
-            if not linea.strip():
-                continue
-            try:
-                nombre, apellido, correo, rol, telefono = [x.strip() for x in linea.split(",")]
-                if rol not in ROL_VALIDOS:
-                    errores.append(f"Línea '{linea}': Rol inválido '{rol}'")
-                    continue
-
-                form_data = {
-                    "username": correo.split("@")[0],
-                    "first_name": nombre,
-                    "last_name": apellido,
-                    "email": correo,
-                    "password1": "P@ssw0rd2025!",
-                    "password2": "P@ssw0rd2025!",
-                    "rol": rol,
-                    "cargo": rol,
-                }
-
-                form = UsuarioCrearForm(form_data)
-                if not form.is_valid():
-                    errores.append(f"Línea '{linea}': {form.errors.as_json()}")
-                    continue
-
-                user = form.save()
-
-                group, _ = Group.objects.get_or_create(name=rol)
-                user.groups.add(group)
-
-                profile = user.profile
-                profile.telefono = telefono
-                profile.save()
-
-                creados += 1
-
-            except Exception as e:
-                errores.append(f"Error en línea '{linea}': {e}")
-
-        messages.success(request, f"Usuarios creados correctamente: {creados}")
-        for err in errores:
+        archivo = request.FILES.get("archivo_usuarios")
+        origen = codecs.iterdecode(archivo, "utf-8-sig") if archivo else request.POST.get("bulk_users", "")
+        resultado = importar_usuarios(origen, procesos=1, max_filas=MAX_FILAS_WEB)
+
+        messages.success(request, f"Usuarios creados correctamente: {len(resultado.creados)}")
+        for err in resultado.errores[:MAX_ERRORES_MENSAJE]:
             messages.error(request, err)
+        if len(resultado.errores) > MAX_ERRORES_MENSAJE:
+            messages.error(request, f"... y {len(resultado.errores) - MAX_ERRORES_MENSAJE} líneas más con errores.")
 
         return redirect("personas:usuarios_lista")
 
@@ -139,7 +103,7 @@ def usuario_crear(request):
     return render(
         request, 
         "personas/usuario_form.html", 
-        {"form": form, "modo": "crear"}
+        {"form": form, "modo": "crear", "max_filas_web": MAX_FILAS_WEB}
     )
 
 @solo_admin
@@ -191,3 +155,28 @@ def usuario_toggle_activo(request, pk):
     messages.success(request, f"Usuario '{user.username}' {estado} correctamente.")
     
     return redirect("core:usuarios_lista")
+
+
+def _acceso_metricas(request):
+    """Staff autenticado, o `Authorization: Bearer <INSTRUMENTACION_TOKEN>` para el recolector."""
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    token = getattr(settings, "INSTRUMENTACION_TOKEN", "")
+    return bool(token) and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}")
+
+
+def metricas(request):
+    """Consultas y tiempos por vista (percentiles sobre las últimas mediciones) en JSON."""
+    if not _acceso_metricas(request):
+        return HttpResponseForbidden()
+    return JsonResponse({
+        "muestreo": getattr(settings, "INSTRUMENTACION_MUESTREO", 0),
+        "vistas": instrumentacion.registro.resumen(),
+    })
+
+
+def metricas_prometheus(request):
+    """Las mismas métricas en el formato de texto de Prometheus."""
+    if not _acceso_metricas(request):
+        return HttpResponseForbidden()
+    return HttpResponse(instrumentacion.registro.prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
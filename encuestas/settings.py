@@ -17,6 +17,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "core",
     "organizacion",
     "encuestas_app",
@@ -34,10 +35,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "core.middleware.InstrumentacionMiddleware",
+    "core.middleware.PresupuestoConsultasMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.middleware.RolesMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -94,6 +98,8 @@ STATICFILES_DIRS = [BASE_DIR / "static"] if (BASE_DIR / "static").exists() else
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+AUTHENTICATION_BACKENDS = ["registration.backends.PerfilBackend"]
+
 LOGIN_URL = "/accounts/login/"
 LOGIN_REDIRECT_URL = "/personas/check_profile/"
 LOGOUT_REDIRECT_URL = "/accounts/login/"
@@ -102,6 +108,8 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 MAX_UPLOAD_SIZE = 300 * 1024 * 1024                                         
+CARGA_TAMANIO_CHUNK = 8 * 1024 * 1024
+CARGA_HORAS_EXPIRACION = 24
 
 ALLOWED_IMAGE_TYPES = ['image/jpeg', 'image/png', 'image/gif', 'image/webp']
 ALLOWED_VIDEO_TYPES = ['video/mp4', 'video/mpeg', 'video/quicktime', 'video/x-msvideo']
@@ -113,6 +121,12 @@ ALLOWED_DOCUMENT_TYPES = [
 ]
 
 
+MAPA_CACHE_TIMEOUT = 300
+
+INSTRUMENTACION_MUESTREO = float(os.getenv("DJANGO_INSTRUMENTACION_MUESTREO", "0"))
+INSTRUMENTACION_VENTANA = 1000
+INSTRUMENTACION_TOKEN = os.getenv("DJANGO_INSTRUMENTACION_TOKEN", "")
+
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 DEFAULT_FROM_EMAIL = "Sistema Municipal <no-reply@municipalidad.local>"               
 
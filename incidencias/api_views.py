@@ -0,0 +1,211 @@
+import hashlib
+import math
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import Substr
+from django.utils.decorators import method_decorator
+from rest_framework import viewsets
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from core.busqueda import buscar
+from core import mapa
+from core.condicional import etag_por_actualizacion
+from core.duplicados import buscar_duplicados
+from core.utils import presupuesto_consultas
+from core.models import Incidencia, TipoIncidencia
+from .serializers import IncidenciaSerializer
+from .views import _alcance_visibilidad, _filtrar_por_rol
+
+
+class IncidenciaCursorPagination(CursorPagination):
+    ordering = ('-creadoEl', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+MAX_CERCANAS = 100
+
+
+def _numeros(request, nombre, cantidad):
+    """Lee un parámetro con `cantidad` números separados por coma, o None si no viene."""
+    crudo = request.GET.get(nombre)
+    if not crudo:
+        return None
+    try:
+        valores = [float(v) for v in crudo.split(",")]
+    except ValueError:
+        valores = []
+    if len(valores) != cantidad or not all(math.isfinite(v) for v in valores):
+        raise ValidationError({nombre: f"Se esperaban {cantidad} números separados por coma."})
+    return valores
+
+
+def _radio(request, nombre, por_defecto):
+    """Radio en km: `por_defecto` si no viene; debe ser mayor que cero."""
+    radio = (_numeros(request, nombre, 1) or [por_defecto])[0]
+    if radio <= 0:
+        raise ValidationError({nombre: "El radio debe ser mayor que cero."})
+    return radio
+
+
+def _marca_lista(request):
+    qs = IncidenciaViewSet.filtrar(request)
+    return qs.aggregate(ultimo=Max("actualizadoEl"), total=Count("id"))
+
+
+def _marca_detalle(request, pk):
+    return _filtrar_por_rol(Incidencia.objects.filter(pk=pk), request.user).values_list(
+        "actualizadoEl", flat=True
+    ).first()
+
+
+@presupuesto_consultas(5)
+@method_decorator(etag_por_actualizacion(_marca_lista), name="list")
+@method_decorator(etag_por_actualizacion(_marca_detalle), name="retrieve")
+class IncidenciaViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Incidencias visibles para el usuario, paginadas por cursor.
+    Filtros: estado, departamento, tipo_id, q (texto completo; anota
+    `relevancia`), bbox=oeste,sur,este,norte y cerca=lat,lon&radio=km
+    (anota `distancia_km`). Campos: ?fields=id,titulo,...
+    """
+    serializer_class = IncidenciaSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = IncidenciaCursorPagination
+
+    def get_queryset(self):
+        return self._limitar_columnas(self.filtrar(self.request))
+
+    @staticmethod
+    def filtrar(request):
+        qs = _filtrar_por_rol(Incidencia.objects.all(), request.user)
+
+        params = request.GET
+        q = (params.get("q") or "").strip()
+        if q:
+            qs = buscar(qs, q)
+        estado = params.get("estado")
+        if estado in dict(Incidencia.ESTADO_CHOICES):
+            qs = qs.filter(estado=estado)
+        if params.get("departamento", "").isdigit():
+            qs = qs.filter(departamento_id=params["departamento"])
+        if params.get("tipo_id", "").isdigit():
+            qs = qs.filter(tipo_incidencia_id=params["tipo_id"])
+
+        bbox = _numeros(request, "bbox", 4)
+        if bbox:
+            oeste, sur, este, norte = bbox
+            if oeste > este or sur > norte:
+                raise ValidationError({
+                    "bbox": "Se espera oeste,sur,este,norte con oeste <= este y sur <= norte "
+                            "(un área que cruza el antimeridiano se pide en dos partes)."
+                })
+            qs = qs.en_bbox(sur, oeste, norte, este)
+        cerca = _numeros(request, "cerca", 2)
+        if cerca:
+            qs = qs.en_radio(cerca[0], cerca[1], _radio(request, "radio", 1.0))
+        return qs
+
+    @action(detail=False)
+    def cercanas(self, request):
+        """Las k incidencias visibles más cercanas a ?lat=&lon= (k por defecto 10, máximo 100)."""
+        punto = [_numeros(request, "lat", 1), _numeros(request, "lon", 1)]
+        if None in punto:
+            raise ValidationError("Debes indicar lat y lon.")
+        k = min(int(request.GET["k"]) if request.GET.get("k", "").isdigit() else 10, MAX_CERCANAS)
+        radio_max = _radio(request, "radio_max", 50.0)
+        cercanas = self.get_queryset().mas_cercanas(punto[0][0], punto[1][0], k=k, radio_max_km=radio_max)
+        return Response(self.get_serializer(cercanas, many=True).data)
+
+    @action(detail=False)
+    def duplicados(self, request):
+        """
+        Posibles duplicados abiertos para ?titulo=&lat=&lon=[&tipo_id=],
+        pensado para avisar mientras se llena el formulario de creación.
+        """
+        punto = [_numeros(request, "lat", 1), _numeros(request, "lon", 1)]
+        titulo = (request.GET.get("titulo") or "").strip()
+        if None in punto or not titulo:
+            raise ValidationError("Debes indicar titulo, lat y lon.")
+        tipo = None
+        if request.GET.get("tipo_id", "").isdigit():
+            tipo = TipoIncidencia.objects.filter(pk=request.GET["tipo_id"]).first()
+        candidatos = buscar_duplicados(
+            titulo, punto[0][0], punto[1][0], tipo_incidencia=tipo,
+            qs=_filtrar_por_rol(Incidencia.objects.all(), request.user),
+        )
+        return Response(self.get_serializer(candidatos, many=True).data)
+
+    def _limitar_columnas(self, qs):
+        """
+        Hace JOIN solo con las relaciones cuyos nombres se piden y, si hay
+        ?fields=, lee únicamente las columnas necesarias para serializarlos.
+        """
+        relaciones = IncidenciaSerializer.RELACIONES
+        campos = IncidenciaSerializer.campos_solicitados(self.request)
+        if not campos:
+            return qs.select_related(*relaciones.values())
+
+        necesarias = sorted({relaciones[c] for c in campos if c in relaciones})
+        columnas = {"id", "creadoEl"}
+        concretos = {f.name for f in Incidencia._meta.concrete_fields}
+        columnas.update(c for c in campos if c in concretos)
+        for campo, relacion in relaciones.items():
+            if relacion in necesarias:
+                destino = IncidenciaSerializer._declared_fields[campo].source
+                columnas.add(relacion)
+                columnas.add(destino.replace(".", "__"))
+        return qs.select_related(*necesarias).only(*columnas)
+
+
+@presupuesto_consultas(4)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def mapa_clusters(request, z, x, y):
+    """
+    Incidencias visibles agrupadas por celda geohash dentro del tile z/x/y
+    (Web Mercator). Acepta los mismos filtros que el listado (estado,
+    departamento, tipo_id, q). Cada grupo trae su centroide y total; si
+    contiene una sola incidencia, también su id. La respuesta se guarda en
+    caché por tile hasta que una incidencia de ese tile se crea, mueve o cambia.
+    """
+    if not (0 <= z <= mapa.MAX_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        raise ValidationError("Tile fuera de rango.")
+
+    parametros = hashlib.sha1(
+        "&".join(sorted(f"{k}={v}" for k, v in request.GET.items())).encode()
+    ).hexdigest()
+    clave = (
+        f"mapa:tile:{mapa.version_tile(z, x, y)}:{_alcance_visibilidad(request.user)}:"
+        f"{z}:{x}:{y}:{parametros}"
+    )
+    datos = cache.get(clave)
+    if datos is None:
+        precision = mapa.precision_para_zoom(z)
+        grupos = (
+            IncidenciaViewSet.filtrar(request)
+            .en_bbox(*mapa.bbox_tile(z, x, y))
+            .annotate(celda=Substr("geohash", 1, precision))
+            .values("celda")
+            .annotate(total=Count("id"), lat=Avg("latitud"), lon=Avg("longitud"), primera=Min("id"))
+            .order_by()
+        )
+        clusters = []
+        for g in grupos:
+            cluster = {"geohash": g["celda"], "lat": g["lat"], "lon": g["lon"], "total": g["total"]}
+            if g["total"] == 1:
+                cluster["id"] = g["primera"]
+            clusters.append(cluster)
+        datos = {
+            "z": z, "x": x, "y": y,
+            "precision": precision,
+            "total": sum(c["total"] for c in clusters),
+            "clusters": clusters,
+        }
+        cache.set(clave, datos, mapa.MAPA_CACHE_TIMEOUT)
+    return Response(datos)
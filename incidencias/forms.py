@@ -92,8 +92,6 @@ class IncidenciaForm(forms.ModelForm):
         titulo = self.cleaned_data.get("titulo", "").strip()
         if not titulo:
             raise ValidationError("El título de la incidencia es obligatorio.")
-        if Incidencia.objects.filter(titulo__iexact=titulo).exclude(pk=self.instance.pk).exists():
-            raise ValidationError("Ya existe una incidencia con este título.")
         return titulo
 
                
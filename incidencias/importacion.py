@@ -0,0 +1,216 @@
+import csv
+import io
+import json
+import time
+from collections import Counter
+
+from django import forms
+from django.db import transaction
+
+from core import geo, mapa
+from core.busqueda import indexar_incidencias
+from core.models import Departamento, Encuesta, Incidencia, JefeCuadrilla, TipoIncidencia
+from core.signals import ajustar_contador
+
+from .forms import IncidenciaForm
+
+LOTE = 1000
+FORMATOS = ("csv", "jsonl")
+
+
+class Referencias:
+    """
+    Resuelve departamento, encuesta, tipo y cuadrilla por nombre (o id) con
+    un caché en memoria: cada nombre distinto cuesta una consulta por importación.
+    """
+    BUSQUEDAS = {
+        "departamento": (Departamento.objects.filter(estado=True), "nombre_departamento"),
+        "encuesta": (Encuesta.objects.filter(estado=True).select_related("tipo_incidencia"), "titulo"),
+        "tipo_incidencia": (TipoIncidencia.objects.all(), "nombre_problema"),
+        "cuadrilla": (JefeCuadrilla.objects.all(), "nombre_cuadrilla"),
+    }
+
+    def __init__(self):
+        self._cache = {campo: {} for campo in self.BUSQUEDAS}
+
+    def resolver(self, campo, valor):
+        clave = valor.strip().casefold()
+        cache = self._cache[campo]
+        if clave not in cache:
+            qs, nombre = self.BUSQUEDAS[campo]
+            filtro = {"pk": int(clave)} if clave.isdigit() else {f"{nombre}__iexact": valor.strip()}
+            cache[clave] = qs.filter(**filtro).order_by("pk").first()
+        return cache[clave]
+
+
+class IncidenciaImportacionForm(forms.Form):
+    """
+    Mismas reglas de campo que IncidenciaForm, pero las relaciones se leen
+    por nombre desde `Referencias`. Como en el formulario, un título repetido
+    no es un error.
+    """
+    titulo = IncidenciaForm.base_fields["titulo"]
+    descripcion = IncidenciaForm.base_fields["descripcion"]
+    prioridad = IncidenciaForm.base_fields["prioridad"]
+    fecha_cierre = IncidenciaForm.base_fields["fecha_cierre"]
+    latitud = IncidenciaForm.base_fields["latitud"]
+    longitud = IncidenciaForm.base_fields["longitud"]
+    nombre_vecino = IncidenciaForm.base_fields["nombre_vecino"]
+    correo_vecino = IncidenciaForm.base_fields["correo_vecino"]
+    telefono_vecino = IncidenciaForm.base_fields["telefono_vecino"]
+    departamento = forms.CharField()
+    encuesta = forms.CharField()
+    tipo_incidencia = forms.CharField(required=False)
+    cuadrilla = forms.CharField(required=False)
+
+    def __init__(self, *args, referencias, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.referencias = referencias
+
+    def validar(self, datos):
+        """Valida otra fila con el mismo formulario, sin volver a copiar los campos."""
+        self.data = datos
+        self._errors = None
+        return self.is_valid()
+
+    def _relacion(self, campo):
+        valor = self.cleaned_data.get(campo)
+        if not valor:
+            return None
+        objeto = self.referencias.resolver(campo, valor)
+        if objeto is None:
+            raise forms.ValidationError(f"No existe '{valor}' (o no está activo).")
+        return objeto
+
+    def clean_titulo(self):
+        titulo = self.cleaned_data.get("titulo", "").strip()
+        if not titulo:
+            raise forms.ValidationError("El título de la incidencia es obligatorio.")
+        return titulo
+
+    def clean_departamento(self):
+        return self._relacion("departamento")
+
+    def clean_encuesta(self):
+        return self._relacion("encuesta")
+
+    def clean_tipo_incidencia(self):
+        return self._relacion("tipo_incidencia")
+
+    def clean_cuadrilla(self):
+        return self._relacion("cuadrilla")
+
+    def incidencia(self):
+        datos = self.cleaned_data
+        encuesta = datos["encuesta"]
+        return Incidencia(
+            titulo=datos["titulo"],
+            descripcion=datos["descripcion"],
+            prioridad=datos["prioridad"],
+            fecha_cierre=datos["fecha_cierre"],
+            latitud=datos["latitud"],
+            longitud=datos["longitud"],
+            geohash=geo.geohash(datos["latitud"], datos["longitud"]),
+            nombre_vecino=datos["nombre_vecino"],
+            correo_vecino=datos["correo_vecino"],
+            telefono_vecino=datos["telefono_vecino"],
+            departamento=datos["departamento"],
+            encuesta=encuesta,
+            tipo_incidencia=datos["tipo_incidencia"] or encuesta.tipo_incidencia,
+            cuadrilla=datos["cuadrilla"],
+        )
+
+
+class ResultadoImportacion:
+    def __init__(self):
+        self.filas = 0
+        self.creadas = 0
+        self.errores = []
+        self.inicio = time.monotonic()
+
+    def error(self, numero, mensaje):
+        self.errores.append(f"Fila {numero}: {mensaje}")
+
+    @property
+    def filas_por_segundo(self):
+        return self.filas / max(time.monotonic() - self.inicio, 1e-9)
+
+
+def leer_registros(origen, formato):
+    """
+    Recorre el archivo de a una fila sin cargarlo entero: CSV con cabecera
+    o JSON Lines (un objeto por línea). Entrega (numero, dict) o
+    (numero, None) si la línea no se pudo leer.
+    """
+    if isinstance(origen, str):
+        origen = io.StringIO(origen)
+    if formato == "csv":
+        for numero, fila in enumerate(csv.DictReader(origen, skipinitialspace=True), start=2):
+            yield numero, fila
+        return
+    for numero, linea in enumerate(origen, start=1):
+        if not linea.strip():
+            continue
+        try:
+            registro = json.loads(linea)
+        except ValueError:
+            registro = None
+        yield numero, registro if isinstance(registro, dict) else None
+
+
+def _normalizar(registro):
+    datos = {clave.strip(): "" if valor is None else str(valor).strip() for clave, valor in registro.items() if clave}
+    datos["prioridad"] = datos.get("prioridad", "").lower() or "media"
+    return datos
+
+
+def _guardar_lote(lote, resultado):
+    """Inserta el lote; mantiene contadores e índice de búsqueda."""
+    nuevas = [incidencia for _, incidencia in lote]
+    with transaction.atomic():
+        Incidencia.objects.bulk_create(nuevas)
+        indexar_incidencias(pk__in=[incidencia.pk for incidencia in nuevas])
+        conteo = Counter((incidencia.departamento_id, incidencia.estado) for incidencia in nuevas)
+        for (departamento_id, estado), total in conteo.items():
+            ajustar_contador(departamento_id, estado, total)
+    resultado.creadas += len(nuevas)
+
+
+def importar_incidencias(origen, formato="csv", lote=LOTE, progreso=None):
+    """
+    Importa incidencias desde CSV o JSONL en modo streaming: valida cada
+    fila con las reglas de IncidenciaForm, resuelve las relaciones por nombre
+    con caché y guarda con bulk_create de a `lote` filas (una transacción por
+    lote). Las filas inválidas se informan y no detienen la importación.
+    `progreso(resultado)` se llama después de cada lote.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato}")
+    resultado = ResultadoImportacion()
+    form = IncidenciaImportacionForm({}, referencias=Referencias())
+    pendientes = []
+
+    for numero, registro in leer_registros(origen, formato):
+        resultado.filas += 1
+        if registro is None:
+            resultado.error(numero, "no es un objeto JSON válido.")
+            continue
+        if not form.validar(_normalizar(registro)):
+            resultado.error(numero, "; ".join(
+                f"{campo}: {' '.join(mensajes)}" for campo, mensajes in form.errors.items()
+            ))
+            continue
+        pendientes.append((numero, form.incidencia()))
+        if len(pendientes) >= lote:
+            _guardar_lote(pendientes, resultado)
+            pendientes = []
+            if progreso:
+                progreso(resultado)
+
+    if pendientes:
+        _guardar_lote(pendientes, resultado)
+    if resultado.creadas:
+        mapa.invalidar_todo()
+    if progreso:
+        progreso(resultado)
+    return resultado
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from incidencias.importacion import FORMATOS, LOTE, importar_incidencias
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa incidencias desde un CSV con cabecera o un archivo JSON Lines, "
+        "leyendo de a una fila y guardando con bulk_create por lotes. Departamento, "
+        "encuesta, tipo_incidencia y cuadrilla se indican por nombre o id."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo")
+        parser.add_argument("--formato", choices=FORMATOS, default=None,
+                            help="Por defecto se deduce de la extensión (.csv o .jsonl).")
+        parser.add_argument("--lote", type=int, default=LOTE)
+
+    def handle(self, *args, **opts):
+        formato = opts["formato"] or ("jsonl" if opts["archivo"].lower().endswith((".jsonl", ".json")) else "csv")
+
+        resultado = None
+
+        def progreso(avance):
+            nonlocal resultado
+            resultado = avance
+            self.stdout.write(
+                f"{avance.filas} filas, {avance.creadas} creadas, "
+                f"{len(avance.errores)} con errores ({avance.filas_por_segundo:.0f} filas/s)"
+            )
+
+        try:
+            with open(opts["archivo"], encoding="utf-8-sig", newline="") as archivo:
+                resultado = importar_incidencias(archivo, formato, lote=opts["lote"], progreso=progreso)
+        except OSError as e:
+            raise CommandError(f"No se pudo leer '{opts['archivo']}': {e}")
+        except UnicodeDecodeError:
+            for error in resultado.errores if resultado else ():
+                self.stderr.write(error)
+            raise CommandError(
+                f"'{opts['archivo']}' no está en UTF-8: la lectura falló después de la fila "
+                f"{resultado.filas if resultado else 0}. Incidencias ya creadas en lotes anteriores: "
+                f"{resultado.creadas if resultado else 0}. Guárdelo como «CSV UTF-8» y vuelva a importar solo "
+                "las filas restantes."
+            )
+
+        for error in resultado.errores:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            f"Incidencias creadas: {resultado.creadas} de {resultado.filas} filas."
+        ))
@@ -0,0 +1,75 @@
+from rest_framework import serializers
+from core.models import Incidencia
+
+
+class CamposDinamicosMixin:
+    """
+    Permite pedir solo algunos campos con ?fields=id,titulo,estado.
+    Los nombres desconocidos se ignoran; sin el parámetro se devuelven todos.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        campos = self.campos_solicitados(self.context.get("request"))
+        if campos:
+            for nombre in set(self.fields) - campos:
+                self.fields.pop(nombre)
+
+    @staticmethod
+    def campos_solicitados(request):
+        if request is None:
+            return set()
+        crudo = request.query_params.get("fields", "")
+        return {c.strip() for c in crudo.split(",") if c.strip()}
+
+
+class IncidenciaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    departamento_nombre = serializers.CharField(
+        source='departamento.nombre_departamento', read_only=True, default=None
+    )
+    cuadrilla_nombre = serializers.CharField(
+        source='cuadrilla.nombre_cuadrilla', read_only=True, default=None
+    )
+    tipo_incidencia_nombre = serializers.CharField(
+        source='tipo_incidencia.nombre_problema', read_only=True, default=None
+    )
+    encuesta_titulo = serializers.CharField(
+        source='encuesta.titulo', read_only=True, default=None
+    )
+    relevancia = serializers.FloatField(read_only=True, default=None)
+    distancia_km = serializers.FloatField(read_only=True, default=None)
+    similitud = serializers.FloatField(read_only=True, default=None)
+
+    RELACIONES = {
+        'departamento_nombre': 'departamento',
+        'cuadrilla_nombre': 'cuadrilla',
+        'tipo_incidencia_nombre': 'tipo_incidencia',
+        'encuesta_titulo': 'encuesta',
+    }
+
+    class Meta:
+        model = Incidencia
+        fields = (
+            'id',
+            'titulo',
+            'descripcion',
+            'estado',
+            'prioridad',
+            'creadoEl',
+            'actualizadoEl',
+            'fecha_cierre',
+            'latitud',
+            'longitud',
+            'nombre_vecino',
+            'departamento',
+            'departamento_nombre',
+            'cuadrilla',
+            'cuadrilla_nombre',
+            'tipo_incidencia',
+            'tipo_incidencia_nombre',
+            'encuesta',
+            'encuesta_titulo',
+            'relevancia',
+            'distancia_km',
+            'similitud',
+        )
@@ -1,3 +1,422 @@
-from django.test import TestCase
+import io
+import json
+import shutil
+import tempfile
+import zipfile
 
-                         
+from django.contrib.auth.models import Group, User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core import mapa
+from core.duplicados import buscar_duplicados
+from core.models import (
+    CargaEvidencia, ContadorIncidencias, CorreoPendiente, Departamento, Encuesta, Incidencia, JefeCuadrilla, Multimedia,
+    TipoIncidencia,
+)
+
+from .importacion import importar_incidencias
+
+
+def crear_usuario(nombre, *grupos):
+    usuario = User.objects.create_user(nombre, f"{nombre}@municipalidad.local", "clave-segura-123")
+    for grupo in grupos:
+        usuario.groups.add(Group.objects.get_or_create(name=grupo)[0])
+    return usuario
+
+
+def crear_incidencia(departamento, **campos):
+    datos = {
+        "titulo": "Bache en la calzada", "descripcion": "d", "prioridad": "media",
+        "latitud": -33.45, "longitud": -70.66, "nombre_vecino": "Vecino",
+        "correo_vecino": "vecino@correo.cl", "telefono_vecino": "+56911112222",
+        "departamento": departamento,
+    }
+    datos.update(campos)
+    return Incidencia.objects.create(**datos)
+
+
+class CargaEvidenciaPermisosTests(TestCase):
+    """La subida por partes aplica las mismas reglas que subir_evidencia."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jefe = crear_usuario("jefe", "Jefe de Cuadrilla")
+        cls.jefe_ajeno = crear_usuario("jefe_ajeno", "Jefe de Cuadrilla")
+        cls.territorial = crear_usuario("territorial", "Territorial")
+        departamento = Departamento.objects.create(nombre_departamento="Obras")
+        cls.cuadrilla = JefeCuadrilla.objects.create(
+            nombre_cuadrilla="Cuadrilla 1", usuario=cls.jefe.profile, departamento=departamento
+        )
+        cls.cuadrilla_ajena = JefeCuadrilla.objects.create(
+            nombre_cuadrilla="Cuadrilla 2", usuario=cls.jefe_ajeno.profile, departamento=departamento
+        )
+        cls.incidencia = crear_incidencia(departamento, cuadrilla=cls.cuadrilla, estado="En Progreso")
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajuste = override_settings(MEDIA_ROOT=self.media)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+
+    def iniciar(self, usuario, incidencia=None):
+        self.client.force_login(usuario)
+        datos = {"nombre_archivo": "foto.jpg", "tamanio": 4, "incidencia_id": (incidencia or self.incidencia).pk}
+        return self.client.post(reverse("incidencias:carga_iniciar"), json.dumps(datos), content_type="application/json")
+
+    def test_jefe_de_la_cuadrilla_puede_iniciar(self):
+        self.assertEqual(self.iniciar(self.jefe).status_code, 201)
+
+    def test_jefe_ajeno_recibe_403(self):
+        respuesta = self.iniciar(self.jefe_ajeno)
+        self.assertEqual(respuesta.status_code, 403)
+        self.assertFalse(CargaEvidencia.objects.exists())
+
+    def test_territorial_no_sube_evidencia_a_incidencias(self):
+        self.assertEqual(self.iniciar(self.territorial).status_code, 403)
+
+    def test_incidencia_que_no_esta_en_progreso_recibe_409(self):
+        Incidencia.objects.filter(pk=self.incidencia.pk).update(estado="Completada")
+        self.assertEqual(self.iniciar(self.jefe).status_code, 409)
+
+    def test_finalizar_revisa_permisos_otra_vez(self):
+        carga = CargaEvidencia.objects.create(
+            usuario=self.jefe, incidencia=self.incidencia, nombre="Foto",
+            nombre_archivo="foto.jpg", tamanio_total=4, recibidos=4,
+        )
+        Incidencia.objects.filter(pk=self.incidencia.pk).update(cuadrilla=self.cuadrilla_ajena)
+        self.client.force_login(self.jefe)
+        respuesta = self.client.post(reverse("incidencias:carga_finalizar", args=[carga.pk]))
+        self.assertEqual(respuesta.status_code, 403)
+        self.assertFalse(Multimedia.objects.exists())
+
+    def test_subir_evidencia_rechaza_jefe_ajeno(self):
+        self.client.force_login(self.jefe_ajeno)
+        respuesta = self.client.get(reverse("incidencias:subir_evidencia", args=[self.incidencia.pk]))
+        self.assertRedirects(respuesta, reverse("incidencias:incidencias_lista"), fetch_redirect_response=False)
+
+
+class ExportarIncidenciasTests(TestCase):
+    """incidencias_exportar entrega CSV y XLSX con los datos filtrados."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = crear_usuario("admin", "Administrador")
+        departamento = Departamento.objects.create(nombre_departamento="Obras")
+        crear_incidencia(departamento, titulo="=cmd|' /C calc'!A0", nombre_vecino="@vecino")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_csv_con_bom_y_sin_formulas(self):
+        respuesta = self.client.get(reverse("incidencias:incidencias_exportar"), {"formato": "csv"})
+        contenido = b"".join(respuesta.streaming_content).decode("utf-8")
+        self.assertTrue(contenido.startswith("\ufeffID,"))
+        fila = contenido.splitlines()[1]
+        self.assertIn("'=cmd|", fila)
+        self.assertIn(",'@vecino,", fila)
+
+    def test_xlsx_es_un_zip_valido(self):
+        respuesta = self.client.get(reverse("incidencias:incidencias_exportar"), {"formato": "xlsx"})
+        with zipfile.ZipFile(io.BytesIO(b"".join(respuesta.streaming_content))) as archivo:
+            self.assertIsNone(archivo.testzip())
+            self.assertIn(b"=cmd|", archivo.read("xl/worksheets/sheet1.xml"))
+
+
+CABECERA_IMPORTACION = "titulo,descripcion,prioridad,latitud,longitud,nombre_vecino,correo_vecino,telefono_vecino,departamento,encuesta\n"
+
+
+def fila_importacion(titulo, **campos):
+    datos = {
+        "titulo": titulo, "descripcion": "d", "prioridad": "alta", "latitud": "-33.45",
+        "longitud": "-70.66", "nombre_vecino": "Vecino", "correo_vecino": "vecino@correo.cl",
+        "telefono_vecino": "+56911112222", "departamento": "Obras", "encuesta": "Baches",
+    }
+    datos.update(campos)
+    return ",".join(datos[columna] for columna in CABECERA_IMPORTACION.strip().split(",")) + "\n"
+
+
+class ImportarIncidenciasTests(TestCase):
+    """importar_incidencias valida cada fila con las reglas del formulario y mantiene los contadores."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.departamento = Departamento.objects.create(nombre_departamento="Obras")
+        Encuesta.objects.create(
+            titulo="Baches", descripcion="d", ubicacion="u", prioridad="Alta", departamento=cls.departamento
+        )
+
+    def test_filas_invalidas_se_informan_con_su_numero(self):
+        resultado = importar_incidencias(
+            CABECERA_IMPORTACION
+            + fila_importacion("Bache uno")
+            + fila_importacion("Sin correo", correo_vecino="no-es-correo")
+            + fila_importacion("Otro depto", departamento="Inexistente")
+            + fila_importacion("Bache dos")
+        )
+        self.assertEqual((resultado.filas, resultado.creadas), (4, 2))
+        self.assertEqual([e.split(":")[0] for e in resultado.errores], ["Fila 3", "Fila 4"])
+        self.assertIn("correo_vecino", resultado.errores[0])
+        self.assertIn("'Inexistente'", resultado.errores[1])
+
+    def test_titulo_repetido_no_es_error_como_en_el_formulario(self):
+        crear_incidencia(self.departamento, titulo="Ya existe")
+        resultado = importar_incidencias(
+            CABECERA_IMPORTACION
+            + fila_importacion("Poste caído")
+            + fila_importacion("Poste caído")
+            + fila_importacion("ya existe"),
+            lote=2,
+        )
+        self.assertEqual((resultado.creadas, resultado.errores), (3, []))
+        self.assertEqual(Incidencia.objects.filter(titulo__startswith="P").count(), 2)
+
+    def test_jsonl_numera_por_linea_del_archivo(self):
+        resultado = importar_incidencias(
+            json.dumps({"titulo": "Bache", "descripcion": "d", "latitud": -33.45, "longitud": -70.66,
+                        "nombre_vecino": "V", "correo_vecino": "v@correo.cl", "telefono_vecino": "1",
+                        "departamento": "Obras", "encuesta": "Baches"})
+            + "\n\nno es json\n[1, 2]\n",
+            formato="jsonl",
+        )
+        self.assertEqual(resultado.creadas, 1)
+        self.assertEqual(resultado.errores, [
+            "Fila 3: no es un objeto JSON válido.",
+            "Fila 4: no es un objeto JSON válido.",
+        ])
+
+    def test_ajusta_contador_por_departamento_y_estado(self):
+        importar_incidencias(CABECERA_IMPORTACION + fila_importacion("Uno") + fila_importacion("Dos"), lote=1)
+        contador = ContadorIncidencias.objects.get(departamento=self.departamento, estado="Pendiente")
+        self.assertEqual(contador.total, 2)
+        self.assertEqual(contador.total, Incidencia.objects.filter(departamento=self.departamento).count())
+
+    def test_vista_rechaza_archivo_que_no_es_utf8(self):
+        self.client.force_login(crear_usuario("territorial", "Territorial"))
+        archivo = SimpleUploadedFile(
+            "incidencias.csv", (CABECERA_IMPORTACION + fila_importacion("Árbol caído")).encode("cp1252")
+        )
+        respuesta = self.client.post(reverse("incidencias:incidencias_importar"), {"archivo": archivo})
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertFalse(respuesta.json()["success"])
+        self.assertFalse(Incidencia.objects.exists())
+
+    def test_comando_informa_lo_importado_si_el_archivo_no_es_utf8_mas_adelante(self):
+        contenido = (
+            CABECERA_IMPORTACION + fila_importacion("Bache") * 300
+        ).encode() + fila_importacion("Árbol caído").encode("cp1252")
+        with tempfile.NamedTemporaryFile(suffix=".csv") as archivo:
+            archivo.write(contenido)
+            archivo.flush()
+            with self.assertRaises(CommandError) as error:
+                call_command("importar_incidencias", archivo.name, lote=100, stdout=io.StringIO())
+        creadas = Incidencia.objects.count()
+        self.assertGreater(creadas, 0)
+        self.assertIn("no está en UTF-8", str(error.exception))
+        self.assertIn(f"Incidencias ya creadas en lotes anteriores: {creadas}.", str(error.exception))
+
+    def test_vista_importa_archivo_utf8_con_bom(self):
+        self.client.force_login(crear_usuario("territorial", "Territorial"))
+        archivo = SimpleUploadedFile(
+            "incidencias.csv", (CABECERA_IMPORTACION + fila_importacion("Árbol caído")).encode("utf-8-sig")
+        )
+        respuesta = self.client.post(reverse("incidencias:incidencias_importar"), {"archivo": archivo})
+        self.assertEqual(respuesta.json()["creadas"], 1)
+
+
+class MapaClustersTests(TestCase):
+    """Los tiles en caché cambian cuando cambia lo que cada usuario ve en ellos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jefe = crear_usuario("jefe", "Jefe de Cuadrilla")
+        cls.otro_jefe = crear_usuario("otro_jefe", "Jefe de Cuadrilla")
+        departamento = Departamento.objects.create(nombre_departamento="Obras")
+        cls.cuadrilla = JefeCuadrilla.objects.create(
+            nombre_cuadrilla="Cuadrilla 1", usuario=cls.jefe.profile, departamento=departamento
+        )
+        cls.incidencia = crear_incidencia(departamento, cuadrilla=cls.cuadrilla)
+        cls.tile = mapa.tile_de(cls.incidencia.latitud, cls.incidencia.longitud, 12)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def total(self, usuario, **filtros):
+        self.client.force_login(usuario)
+        respuesta = self.client.get(reverse("incidencias:api_mapa_clusters", args=[12, *self.tile]), filtros)
+        return respuesta.json()["total"]
+
+    def test_editar_titulo_invalida_tiles_filtrados_por_texto(self):
+        self.assertEqual(self.total(self.jefe, q="bache"), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.incidencia.titulo = "Poste caído"
+            self.incidencia.save()
+        self.assertEqual(self.total(self.jefe, q="bache"), 0)
+
+    def test_reasignar_jefe_invalida_tiles(self):
+        self.assertEqual(self.total(self.jefe), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cuadrilla.usuario = self.otro_jefe.profile
+            self.cuadrilla.save()
+        self.assertEqual(self.total(self.jefe), 0)
+        self.assertEqual(self.total(self.otro_jefe), 1)
+
+    def test_ttl_corto_sin_cache_compartida(self):
+        with override_settings(MAPA_CACHE_TIMEOUT=300):
+            self.assertEqual(mapa._cache_timeout(), mapa.MAPA_CACHE_TIMEOUT_LOCAL)
+        compartida = {"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "cache"}}
+        with override_settings(MAPA_CACHE_TIMEOUT=300, CACHES=compartida):
+            self.assertEqual(mapa._cache_timeout(), 300)
+
+
+class ApiIncidenciasSinRolTests(TestCase):
+    """Un usuario sin grupo solo ve, por la API, las incidencias con su correo."""
+
+    @classmethod
+    def setUpTestData(cls):
+        departamento = Departamento.objects.create(nombre_departamento="Obras")
+        cls.propia = crear_incidencia(departamento, titulo="Propia", correo_vecino="vecino@municipalidad.local")
+        crear_incidencia(departamento, titulo="Ajena")
+        crear_incidencia(departamento, titulo="Sin correo", correo_vecino="")
+
+    def ids(self, usuario):
+        self.client.force_login(usuario)
+        respuesta = self.client.get(reverse("incidencias:api_incidencias-list"), {"fields": "id"})
+        self.assertEqual(respuesta.status_code, 200)
+        return [fila["id"] for fila in respuesta.json()["results"]]
+
+    def test_ve_solo_las_de_su_correo(self):
+        self.assertEqual(self.ids(crear_usuario("vecino")), [self.propia.pk])
+
+    def test_sin_correo_no_ve_ninguna(self):
+        self.assertEqual(self.ids(User.objects.create_user("anonimo", "", "clave-segura-123")), [])
+
+
+class ApiParametrosTests(TestCase):
+    """Los parámetros geográficos inválidos de la API responden 400 en vez de una lista vacía."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = crear_usuario("admin", "Administrador")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def estado(self, accion, **parametros):
+        return self.client.get(reverse(f"incidencias:api_incidencias-{accion}"), parametros).status_code
+
+    def test_bbox_invertido_o_que_cruza_el_antimeridiano(self):
+        self.assertEqual(self.estado("list", bbox="-70.5,-33.5,-70.7,-33.4"), 400)
+        self.assertEqual(self.estado("list", bbox="179,-10,-179,10"), 400)
+        self.assertEqual(self.estado("list", bbox="-70.7,-33.4,-70.5,-33.5"), 400)
+        self.assertEqual(self.estado("list", bbox="-70.7,-33.5,-70.5,-33.4"), 200)
+
+    def test_radio_debe_ser_positivo(self):
+        self.assertEqual(self.estado("list", cerca="-33.45,-70.66", radio="0"), 400)
+        self.assertEqual(self.estado("list", cerca="-33.45,-70.66", radio="-1"), 400)
+        self.assertEqual(self.estado("list", cerca="-33.45,-70.66", radio="nan"), 400)
+        self.assertEqual(self.estado("cercanas", lat="-33.45", lon="-70.66", radio_max="-5"), 400)
+        self.assertEqual(self.estado("cercanas", lat="-33.45", lon="-70.66", radio_max="2"), 200)
+
+
+class DuplicadosTests(TestCase):
+    """buscar_duplicados y el aviso de incidencia_crear, que reemplaza la regla de título único."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = crear_usuario("admin", "Administrador")
+        cls.departamento = Departamento.objects.create(nombre_departamento="Obras")
+        cls.baches = TipoIncidencia.objects.create(nombre_problema="Baches", descripcion="d", tipo_gravedad="M")
+        cls.luminarias = TipoIncidencia.objects.create(nombre_problema="Luminarias", descripcion="d", tipo_gravedad="B")
+        cls.encuesta = Encuesta.objects.create(
+            titulo="Baches", descripcion="d", ubicacion="u", prioridad="Alta",
+            departamento=cls.departamento, tipo_incidencia=cls.baches,
+        )
+        cls.cercana = crear_incidencia(
+            cls.departamento, titulo="Bache grande en la calzada", tipo_incidencia=cls.baches
+        )
+
+    def ids(self, titulo, latitud=-33.45, longitud=-70.66, **opciones):
+        return [i.pk for i in buscar_duplicados(titulo, latitud, longitud, **opciones)]
+
+    def test_titulo_parecido_dentro_del_radio(self):
+        self.assertEqual(self.ids("bache grande calzada"), [self.cercana.pk])
+        self.assertEqual(self.ids("bache grande calzada", latitud=-33.4510), [self.cercana.pk])
+
+    def test_fuera_del_radio(self):
+        self.assertEqual(self.ids("bache grande calzada", latitud=-33.46), [])
+
+    def test_solo_incidencias_abiertas(self):
+        Incidencia.objects.filter(pk=self.cercana.pk).update(estado="En Progreso")
+        self.assertEqual(self.ids("bache grande calzada"), [self.cercana.pk])
+        Incidencia.objects.filter(pk=self.cercana.pk).update(estado="Completada")
+        self.assertEqual(self.ids("bache grande calzada"), [])
+
+    def test_umbral_de_similitud_y_tipo(self):
+        self.assertEqual(self.ids("poste de luz caído"), [])
+        self.assertEqual(self.ids("bache grande calzada", tipo_incidencia=self.luminarias), [])
+        self.assertEqual(self.ids("bache grande calzada", tipo_incidencia=self.baches), [self.cercana.pk])
+
+    def datos_formulario(self, titulo, latitud):
+        return {
+            "titulo": titulo, "descripcion": "d", "prioridad": "media", "latitud": latitud,
+            "longitud": -70.66, "departamento": self.departamento.pk, "nombre_vecino": "Vecino",
+            "correo_vecino": "vecino@correo.cl", "telefono_vecino": "+56911112222", "encuesta": self.encuesta.pk,
+        }
+
+    def test_crear_avisa_y_confirmar_guarda(self):
+        self.client.force_login(self.admin)
+        url = reverse("incidencias:incidencia_crear")
+        datos = self.datos_formulario("Bache grande en calzada", -33.45)
+        respuesta = self.client.post(url, datos)
+        self.assertEqual([i.pk for i in respuesta.context["duplicados"]], [self.cercana.pk])
+        self.assertEqual(Incidencia.objects.count(), 1)
+        respuesta = self.client.post(url, {**datos, "confirmar_duplicado": "1"})
+        self.assertRedirects(respuesta, reverse("incidencias:incidencias_lista"), fetch_redirect_response=False)
+        self.assertEqual(Incidencia.objects.count(), 2)
+
+    def test_mismo_titulo_lejos_no_bloquea(self):
+        self.client.force_login(self.admin)
+        datos = self.datos_formulario(self.cercana.titulo, -33.60)
+        respuesta = self.client.post(reverse("incidencias:incidencia_crear"), datos)
+        self.assertRedirects(respuesta, reverse("incidencias:incidencias_lista"), fetch_redirect_response=False)
+        self.assertEqual(Incidencia.objects.filter(titulo=self.cercana.titulo).count(), 2)
+
+
+class NotificacionCambioEstadoTests(TestCase):
+    """incidencia_editar deja la notificación en la bandeja de salida en vez de enviarla."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = crear_usuario("admin", "Administrador")
+        cls.encargado = crear_usuario("encargado", "Departamento")
+        cls.departamento = Departamento.objects.create(nombre_departamento="Obras", encargado=cls.encargado.profile)
+        cls.encuesta = Encuesta.objects.create(
+            titulo="Encuesta", descripcion="d", ubicacion="u", prioridad="Media", departamento=cls.departamento
+        )
+        cls.incidencia = crear_incidencia(cls.departamento, encuesta=cls.encuesta)
+
+    def editar(self, estado):
+        self.client.force_login(self.admin)
+        datos = {
+            "titulo": self.incidencia.titulo, "descripcion": "d", "estado": estado, "prioridad": "media",
+            "latitud": "-33.45", "longitud": "-70.66", "departamento": self.departamento.pk,
+            "nombre_vecino": "Vecino", "correo_vecino": "vecino@correo.cl", "telefono_vecino": "+56911112222",
+            "encuesta": self.encuesta.pk,
+        }
+        return self.client.post(reverse("incidencias:incidencia_editar", args=[self.incidencia.pk]), datos)
+
+    def test_cambio_de_estado_encola_el_correo_sin_enviarlo(self):
+        respuesta = self.editar("En Progreso")
+        self.assertRedirects(respuesta, reverse("incidencias:incidencias_lista"), fetch_redirect_response=False)
+        self.assertEqual(mail.outbox, [])
+        correo = CorreoPendiente.objects.get()
+        self.assertEqual((correo.estado, correo.destinatarios), ("pendiente", ["encargado@municipalidad.local"]))
+        self.assertEqual(correo.remitente, "admin@municipalidad.local")
+        self.assertIn("Nuevo estado: En Progreso", correo.cuerpo)
@@ -1,8 +1,12 @@
 from django.urls import path
-from . import views, views_clasificacion
+from rest_framework.routers import SimpleRouter
+from . import views, views_clasificacion, views_carga, views_importacion, api_views
 
 app_name = "incidencias"
 
+router = SimpleRouter()
+router.register("api/incidencias", api_views.IncidenciaViewSet, basename="api_incidencias")
+
 urlpatterns = [
 
                    
@@ -27,10 +31,20 @@ urlpatterns = [
 
                                                      
     path("incidencias/", views.incidencias_lista, name="incidencias_lista"),
+    path("incidencias/exportar/", views.incidencias_exportar, name="incidencias_exportar"),
     path("incidencias/nuevo/", views.incidencia_crear, name="incidencia_crear"),
     path("incidencias/<int:pk>/", views.incidencia_editar, name="incidencia_editar"),
     path("incidencias/<int:pk>/detalle/", views.incidencia_detalle, name="incidencia_detalle"),
     path("incidencias/<int:pk>/eliminar/", views.incidencia_eliminar, name="incidencia_eliminar"),
     path("incidencias/<int:pk>/subir-evidencia/", views.subir_evidencia, name="subir_evidencia"),
     path("incidencias/<int:pk>/finalizar/", views.finalizar_incidencia, name="finalizar_incidencia"),
+    path("incidencias/importar/", views_importacion.incidencias_importar, name="incidencias_importar"),
+
+    path("evidencias/cargas/", views_carga.carga_iniciar, name="carga_iniciar"),
+    path("evidencias/cargas/<uuid:carga_id>/", views_carga.carga_chunk, name="carga_chunk"),
+    path("evidencias/cargas/<uuid:carga_id>/finalizar/", views_carga.carga_finalizar, name="carga_finalizar"),
+
+    path("api/mapa/<int:z>/<int:x>/<int:y>/", api_views.mapa_clusters, name="api_mapa_clusters"),
 ]
+
+urlpatterns += router.urls
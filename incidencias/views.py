@@ -1,13 +1,21 @@
-from core.models import Incidencia, Departamento, JefeCuadrilla, Multimedia, TipoIncidencia               
+from core.models import Incidencia, Departamento, JefeCuadrilla, Multimedia, TipoIncidencia, RespuestaEncuesta               
 from django.shortcuts import render, redirect, get_object_or_404
 from .forms import IncidenciaForm, SubirEvidenciaForm                
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from core.utils import solo_admin
+from core.utils import solo_admin, roles_de, presupuesto_consultas
+from core.paginacion import paginar_por_cursor
+from core.condicional import etag_por_actualizacion
+from core.correos import encolar_correo
+from core.busqueda import buscar
+from core.duplicados import buscar_duplicados
+from core.exportacion import filas_csv, filas_xlsx
 
                
-from django.http import JsonResponse 
-from django.core.mail import send_mail
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db.models import Prefetch
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.conf import settings
 from django.core.files.storage import default_storage
 import os
@@ -15,6 +23,7 @@ from datetime import datetime
 
 
                                                                                             
+@presupuesto_consultas(3)
 @login_required
 def cuadrillas_por_departamento(request, departamento_id):
     """Vista AJAX para cargar las cuadrillas de un departamento."""
@@ -39,7 +48,19 @@ def cargar_tipos(request):
                                         
                                                                    
 def _roles_usuario(user):
-    return set(user.groups.values_list("name", flat=True))
+    return roles_de(user)
+
+def _alcance_visibilidad(user):
+    """
+    Identifica qué incidencias ve el usuario según _filtrar_por_rol: usuarios
+    con el mismo alcance ven lo mismo y pueden compartir respuestas en caché.
+    """
+    roles = _roles_usuario(user)
+    if user.is_superuser or roles & {"Administrador", "Dirección", "Departamento", "Territorial"}:
+        return "todo"
+    if "Jefe de Cuadrilla" in roles:
+        return f"jefe:{user.pk}"
+    return f"vecino:{user.pk}:{user.email}"
 
 def _filtrar_por_rol(qs, user):
     """
@@ -49,7 +70,7 @@ def _filtrar_por_rol(qs, user):
       - 'Departamento' ve todo.
       - 'Jefe de Cuadrilla' -> solo pendiente y en_progreso.
       - 'Territorial' -> solo pendiente.
-      - Sin grupo -> solo incidencias asociadas a su email.
+      - Sin grupo -> solo incidencias asociadas a su email (ninguna si no tiene email).
     """
     roles = _roles_usuario(user)
 
@@ -64,39 +85,60 @@ def _filtrar_por_rol(qs, user):
                                                                                                  
         from core.models import JefeCuadrilla
         from django.db.models import Q
-        try:
-            profile = user.profile
-            cuadrillas = JefeCuadrilla.objects.filter(
-                Q(usuario=profile) | Q(encargado=profile)
-            )
-            return qs.filter(
-                cuadrilla__in=cuadrillas
-            )
-        except:
-            return qs.none()
+        cuadrillas = JefeCuadrilla.objects.filter(
+            Q(usuario__user_id=user.pk) | Q(encargado__user_id=user.pk)
+        ).values("pk")
+        return qs.filter(
+            cuadrilla__in=cuadrillas
+        )
                                                                   
 
     if "Territorial" in roles:
         return qs
                                                                                                     
                                             
-    return qs.filter(email_usuario=user.email)
+    if not user.email:
+        return qs.none()
+    return qs.filter(correo_vecino=user.email)
 
 
-                                                                                    
-@login_required
-def incidencias_lista(request):
+INCIDENCIAS_POR_PAGINA = 25
+
+def motivo_rechazo_evidencia(user, incidencia):
+    """
+    (mensaje, status) si `user` no puede subir evidencia a la incidencia, o
+    (None, None) si puede. Solo administradores o la cuadrilla asignada (403),
+    y solo con la incidencia En Progreso (409).
+    """
+    roles = roles_de(user)
+    es_admin = user.is_superuser or "Administrador" in roles
+    if not (es_admin or roles & {"Jefe de Cuadrilla", "Cuadrilla"}):
+        return "No tienes permisos para subir evidencia.", 403
+    if not es_admin:
+        cuadrilla = incidencia.cuadrilla
+        if cuadrilla is None:
+            return "Esta incidencia no tiene cuadrilla asignada.", 403
+        perfil = getattr(user, "profile", None)
+        if perfil is None or perfil.pk not in (cuadrilla.usuario_id, cuadrilla.encargado_id):
+            return f"Solo la cuadrilla '{cuadrilla.nombre_cuadrilla}' puede subir evidencia.", 403
+    if incidencia.estado != "En Progreso":
+        return (
+            f"Solo se puede subir evidencia cuando la incidencia está 'En Progreso'. Estado actual: {incidencia.estado}",
+            409,
+        )
+    return None, None
+
+
+def _filtrar_lista(request, qs):
+    """Aplica los filtros de incidencias_lista (q, estado, departamento, tipo_id) y la visibilidad por rol."""
     q = (request.GET.get("q") or "").strip()
     estado = request.GET.get("estado")                                                   
     departamento_id = request.GET.get("departamento")              
     tipo_id = request.GET.get("tipo_id")      
-    tipos = TipoIncidencia.objects.all()      
-
-    qs = Incidencia.objects.all().order_by("-creadoEl")
 
                       
     if q:
-        qs = qs.filter(titulo__icontains=q)
+        qs = buscar(qs, q)
 
                     
     qs = _filtrar_por_rol(qs, request.user)
@@ -113,6 +155,21 @@ def incidencias_lista(request):
                                    
     if tipo_id:
         qs = qs.filter(tipo_incidencia_id=tipo_id)
+    return qs
+
+
+@presupuesto_consultas(6)
+@login_required
+def incidencias_lista(request):
+    q = (request.GET.get("q") or "").strip()
+    estado = request.GET.get("estado")                                                   
+    departamento_id = request.GET.get("departamento")              
+    tipo_id = request.GET.get("tipo_id")      
+    tipos = TipoIncidencia.objects.all()      
+
+    qs = _filtrar_lista(request, Incidencia.objects.select_related(
+        "departamento", "cuadrilla", "encuesta__tipo_incidencia"
+    ))
 
                                           
     ESTADOS_COLORES = {
@@ -124,7 +181,7 @@ def incidencias_lista(request):
 }
                                     
     user = request.user
-    grupos = list(user.groups.values_list("name", flat=True))
+    grupos = roles_de(user)
 
     is_territorial = "Territorial" in grupos
     is_departamento = "Departamento" in grupos
@@ -138,8 +195,16 @@ def incidencias_lista(request):
         except Departamento.DoesNotExist:
             departamento_nombre = ""
 
+    if q:
+        pagina = paginar_por_cursor(
+            qs, request.GET.get("cursor"), por_pagina=INCIDENCIAS_POR_PAGINA, campo="relevancia", convertir=float
+        )
+    else:
+        pagina = paginar_por_cursor(qs, request.GET.get("cursor"), por_pagina=INCIDENCIAS_POR_PAGINA)
+
     ctx = {
-        "incidencias": qs,
+        "incidencias": pagina,
+        "pagina": pagina,
         "q": q,
         "estado_seleccionado": estado,
         "departamentos": Departamento.objects.all(),
@@ -156,8 +221,65 @@ def incidencias_lista(request):
     }
 
     return render(request, "incidencias/incidencias_lista.html", ctx)
+
+
+COLUMNAS_EXPORTACION = (
+    ("ID", "id"),
+    ("Título", "titulo"),
+    ("Estado", "estado"),
+    ("Prioridad", "prioridad"),
+    ("Departamento", "departamento__nombre_departamento"),
+    ("Tipo de Incidencia", "tipo"),
+    ("Cuadrilla", "cuadrilla__nombre_cuadrilla"),
+    ("Vecino", "nombre_vecino"),
+    ("Correo vecino", "correo_vecino"),
+    ("Teléfono vecino", "telefono_vecino"),
+    ("Latitud", "latitud"),
+    ("Longitud", "longitud"),
+    ("Creada", "creadoEl"),
+    ("Fecha de cierre", "fecha_cierre"),
+)
+FILAS_POR_LECTURA = 2000
+
+@presupuesto_consultas(4)
+@login_required
+def incidencias_exportar(request):
+    """
+    Descarga las incidencias de incidencias_lista (mismos filtros) como CSV
+    o, con ?formato=xlsx, como planilla Excel. Se leen con un cursor del
+    servidor y se envían en streaming, sin cargar todas las filas en memoria.
+    """
+    formato = request.GET.get("formato", "csv")
+    if formato not in ("csv", "xlsx"):
+        formato = "csv"
+
+    qs = _filtrar_lista(request, Incidencia.objects.all()).annotate(
+        tipo=Coalesce("encuesta__tipo_incidencia__nombre_problema", "tipo_incidencia__nombre_problema")
+    )
+    filas = qs.order_by("-creadoEl", "-id").values_list(
+        *(campo for _, campo in COLUMNAS_EXPORTACION)
+    ).iterator(chunk_size=FILAS_POR_LECTURA)
+    encabezados = [titulo for titulo, _ in COLUMNAS_EXPORTACION]
+
+    nombre = f"incidencias_{timezone.localdate():%Y%m%d}.{formato}"
+    if formato == "xlsx":
+        respuesta = StreamingHttpResponse(
+            filas_xlsx(encabezados, filas, hoja="Incidencias"),
+            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+    else:
+        respuesta = StreamingHttpResponse(filas_csv(encabezados, filas), content_type="text/csv; charset=utf-8")
+    respuesta["Content-Disposition"] = f'attachment; filename="{nombre}"'
+    return respuesta
     
+def _marca_incidencia(request, pk):
+    return _filtrar_por_rol(Incidencia.objects.filter(pk=pk), request.user).values_list(
+        "actualizadoEl", "encuesta__actualizadoEl"
+    ).first()
+
+@presupuesto_consultas(13)
 @login_required
+@etag_por_actualizacion(_marca_incidencia)
 def incidencia_detalle(request, pk):
     incidencia = get_object_or_404(Incidencia, pk=pk)
 
@@ -170,9 +292,11 @@ def incidencia_detalle(request, pk):
     preguntas_con_respuestas = []
 
     if encuesta:
-        preguntas = encuesta.preguntaencuesta_set.all().prefetch_related("respuestas")
+        preguntas = encuesta.preguntaencuesta_set.all().prefetch_related(
+            Prefetch("respuestas", queryset=RespuestaEncuesta.objects.order_by("pk"))
+        )
         for p in preguntas:
-            respuesta = p.respuestas.first()
+            respuesta = next(iter(p.respuestas.all()), None)
             preguntas_con_respuestas.append({
                 "texto_pregunta": p.texto_pregunta,
                 "respuesta": respuesta.texto_respuesta if respuesta else "No respondida"
@@ -187,6 +311,7 @@ def incidencia_detalle(request, pk):
     return render(request, "incidencias/incidencia_detalle.html", contexto)
 
                                                                
+@presupuesto_consultas(6)
 @login_required
 def incidencia_crear(request):
                                            
@@ -196,22 +321,32 @@ def incidencia_crear(request):
         return redirect("incidencias:incidencias_lista")                       
 
                                          
+    duplicados = []
     if request.method == "POST":
         form = IncidenciaForm(request.POST)
         if form.is_valid():
-            form.save()
-            messages.success(request, "Incidencia creada correctamente.")
-            return redirect("incidencias:incidencias_lista")
+            datos = form.cleaned_data
+            encuesta = datos.get("encuesta")
+            if not request.POST.get("confirmar_duplicado"):
+                duplicados = buscar_duplicados(
+                    datos["titulo"], datos["latitud"], datos["longitud"],
+                    tipo_incidencia=encuesta.tipo_incidencia if encuesta else None,
+                    qs=_filtrar_por_rol(Incidencia.objects.all(), request.user),
+                )
+            if not duplicados:
+                form.save()
+                messages.success(request, "Incidencia creada correctamente.")
+                return redirect("incidencias:incidencias_lista")
     else:
         form = IncidenciaForm()
-    return render(request, "incidencias/incidencia_form.html", {"form": form})
+    return render(request, "incidencias/incidencia_form.html", {"form": form, "duplicados": duplicados})
 
 @login_required
 def incidencia_editar(request, pk):
     incidencia = get_object_or_404(Incidencia, pk=pk)
     estado_anterior = incidencia.estado
     motivo_rechazo = request.POST.get('motivo_rechazo')
-    roles = set(request.user.groups.values_list("name", flat=True))
+    roles = roles_de(request.user)
 
     if request.method == "POST":
         form = IncidenciaForm(request.POST, instance=incidencia)
@@ -286,10 +421,7 @@ def incidencia_editar(request, pk):
                 asunto = f"[Notificación] Estado actualizado: {nueva_incidencia.titulo}"
                 cuerpo = f"El estado cambió de {estado_anterior} a {nueva_incidencia.estado}."
 
-                try:
-                    send_mail(asunto, cuerpo, remitente, [destinatario], fail_silently=True)
-                except:
-                    pass 
+                encolar_correo(asunto, cuerpo, [destinatario], remitente)
 
                 messages.success(request, f"Incidencia actualizada a '{nueva_incidencia.estado}'.")
             else:
@@ -301,12 +433,13 @@ def incidencia_editar(request, pk):
 
     return render(request, "incidencias/incidencia_form.html", {"form": form})
                                                    
+@presupuesto_consultas(10)
 @login_required
 def incidencia_editar(request, pk):
     incidencia = get_object_or_404(Incidencia, pk=pk)
     estado_anterior = incidencia.estado
     motivo_rechazo = request.POST.get('motivo_rechazo')
-    roles = set(request.user.groups.values_list("name", flat=True))
+    roles = roles_de(request.user)
 
     if request.method == "POST":
         form = IncidenciaForm(request.POST, instance=incidencia)
@@ -345,8 +478,9 @@ def incidencia_editar(request, pk):
 
             if incidencia.estado != estado_anterior:
                 departamento = incidencia.departamento
-                if departamento and departamento.encargado and departamento.encargado.user.email:
-                    destinatario = departamento.encargado.user.email
+                encargado = departamento.encargado if departamento else None
+                if encargado and encargado.user.email:
+                    destinatario = encargado.user.email
                 else:
                     destinatario = "soporte@municipalidad.local"
 
@@ -358,7 +492,7 @@ def incidencia_editar(request, pk):
 
                 asunto = f"[Notificación] Estado actualizado de incidencia: {incidencia.titulo}"
                 cuerpo = (
-                    f"Estimado/a {departamento.encargado},\n\n"
+                    f"Estimado/a {encargado or 'equipo de soporte'},\n\n"
                     f"El usuario {request.user.get_full_name() or request.user.username} "
                     f"ha cambiado el estado de la incidencia '{incidencia.titulo}'.\n\n"
                     f"Estado anterior: {estado_anterior}\n"
@@ -370,17 +504,11 @@ def incidencia_editar(request, pk):
                     "Sistema Municipal de Incidencias"
                 )
 
-                send_mail(
-                    asunto,
-                    cuerpo,
-                    remitente,
-                    [destinatario],
-                    fail_silently=False,
-                )
+                encolar_correo(asunto, cuerpo, [destinatario], remitente)
 
                 messages.success(
                     request,
-                    f"Incidencia actualizada. Se notificó a {departamento.encargado} ({destinatario})."
+                    f"Incidencia actualizada. Se notificará a {encargado or 'soporte'} ({destinatario})."
                 )
             else:
                 messages.success(request, "Incidencia actualizada correctamente.")
@@ -392,6 +520,7 @@ def incidencia_editar(request, pk):
     return render(request, "incidencias/incidencia_form.html", {"form": form})
                                                             
 
+@presupuesto_consultas(4)
 @login_required
 @solo_admin
 def incidencia_eliminar(request, pk):
@@ -405,50 +534,22 @@ def incidencia_eliminar(request, pk):
 
                             
                                                        
+@presupuesto_consultas(7)
 @login_required
 def subir_evidencia(request, pk):
     """
     Vista para que el Jefe de Cuadrilla asignado suba evidencia y finalice la incidencia.
     Solo la cuadrilla asignada puede acceder.
     """
-    incidencia = get_object_or_404(Incidencia, pk=pk)
-    roles = set(request.user.groups.values_list("name", flat=True))
-    
-                                                                                                           
-    if not (request.user.is_superuser or "Jefe de Cuadrilla" in roles or "Cuadrilla" in roles or "Administrador" in roles):
-        messages.error(request, f"No tienes permisos para subir evidencia. Tus grupos son: {list(roles)}")
+    incidencia = get_object_or_404(Incidencia.objects.select_related("cuadrilla"), pk=pk)
+    motivo, status = motivo_rechazo_evidencia(request.user, incidencia)
+    if motivo:
+        if status == 409:
+            messages.warning(request, motivo)
+            return redirect("incidencias:incidencia_detalle", pk=pk)
+        messages.error(request, motivo)
         return redirect("incidencias:incidencias_lista")
     
-                                                                    
-    if not request.user.is_superuser and "Administrador" not in roles:
-        if not incidencia.cuadrilla:
-            messages.error(request, "Esta incidencia no tiene cuadrilla asignada.")
-            return redirect("incidencias:incidencias_lista")
-        
-        try:
-            usuario_es_de_cuadrilla = (
-                incidencia.cuadrilla.usuario == request.user.profile or
-                incidencia.cuadrilla.encargado == request.user.profile
-            )
-        except Exception as e:
-            messages.error(request, f"Error al verificar perfil: {e}. Contacta al administrador.")
-            return redirect("incidencias:incidencias_lista")
-            
-        if not usuario_es_de_cuadrilla:
-            messages.error(
-                request,
-                f"Solo la cuadrilla '{incidencia.cuadrilla.nombre_cuadrilla}' puede subir evidencia."
-            )
-            return redirect("incidencias:incidencias_lista")
-    
-                                                                                 
-    if incidencia.estado != "En Progreso":
-        messages.warning(
-            request,
-            f"Solo se puede subir evidencia cuando la incidencia está 'En Progreso'. Estado actual: {incidencia.estado}"
-        )
-        return redirect("incidencias:incidencia_detalle", pk=pk)
-    
     if request.method == "POST":
         form = SubirEvidenciaForm(request.POST, request.FILES)
         if form.is_valid():
@@ -499,13 +600,14 @@ def subir_evidencia(request, pk):
 
 
                                                                                                 
+@presupuesto_consultas(7)
 @login_required
 def finalizar_incidencia(request, pk):
     """
     Vista para que la cuadrilla marque una incidencia como Completada después de subir evidencias.
     """
-    incidencia = get_object_or_404(Incidencia, pk=pk)
-    roles = set(request.user.groups.values_list("name", flat=True))
+    incidencia = get_object_or_404(Incidencia.objects.select_related("cuadrilla"), pk=pk)
+    roles = roles_de(request.user)
     
                                            
     if not (request.user.is_superuser or "Jefe de Cuadrilla" in roles or "Cuadrilla" in roles or "Administrador" in roles):
@@ -520,8 +622,8 @@ def finalizar_incidencia(request, pk):
         
         try:
             usuario_es_de_cuadrilla = (
-                incidencia.cuadrilla.usuario == request.user.profile or
-                incidencia.cuadrilla.encargado == request.user.profile
+                incidencia.cuadrilla.usuario_id == request.user.profile.pk or
+                incidencia.cuadrilla.encargado_id == request.user.profile.pk
             )
         except Exception as e:
             messages.error(request, f"Error al verificar perfil: {e}")
@@ -0,0 +1,221 @@
+import json
+import os
+import re
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.files import File
+from django.db import transaction
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods, require_POST
+
+from core.models import CargaEvidencia, Encuesta, Incidencia, Multimedia
+from core.utils import admin_territorial_cuadrilla, es_admin_o_territorial, presupuesto_consultas
+from .views import motivo_rechazo_evidencia
+
+TAMANIO_BLOQUE_LECTURA = 64 * 1024
+TAMANIO_CHUNK = getattr(settings, "CARGA_TAMANIO_CHUNK", 8 * 1024 * 1024)
+EXTENSIONES_PERMITIDAS = {ext for exts in Multimedia.EXTENSIONES_POR_TIPO.values() for ext in exts}
+CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+class ArchivoParcial(File):
+    """
+    Archivo ya escrito en disco. Al exponer temporary_file_path(),
+    FileSystemStorage lo mueve a su destino en vez de copiarlo.
+    """
+
+    def temporary_file_path(self):
+        return self.name
+
+
+def _estado(carga):
+    return {
+        "id": str(carga.pk),
+        "recibidos": carga.recibidos,
+        "tamanio_total": carga.tamanio_total,
+        "tamanio_chunk": TAMANIO_CHUNK,
+        "url": reverse("incidencias:carga_chunk", args=[carga.pk]),
+        "url_finalizar": reverse("incidencias:carga_finalizar", args=[carga.pk]),
+    }
+
+
+def _error(mensaje, status=400, **extra):
+    return JsonResponse({"success": False, "error": mensaje, **extra}, status=status)
+
+
+def _motivo_rechazo(user, incidencia, encuesta):
+    """
+    Mismas reglas que subir_evidencia para la incidencia. Una encuesta
+    solo la pueden usar Admin y Territorial, salvo que sea la de la incidencia.
+    """
+    if incidencia is not None:
+        motivo, status = motivo_rechazo_evidencia(user, incidencia)
+        if motivo:
+            return motivo, status
+    if encuesta is not None and not (
+        (incidencia is not None and incidencia.encuesta_id == encuesta.pk) or es_admin_o_territorial(user)
+    ):
+        return "No tienes permisos para subir evidencia a esta encuesta.", 403
+    return None, None
+
+
+@presupuesto_consultas(4)
+@login_required
+@admin_territorial_cuadrilla
+@require_POST
+def carga_iniciar(request):
+    """
+    Inicia una subida por partes.
+    Recibe (form o JSON): nombre_archivo, tamanio, nombre y
+    incidencia_id y/o encuesta_id. Devuelve el id y las URLs de la carga.
+    """
+    datos = request.POST
+    if request.content_type == "application/json":
+        try:
+            datos = json.loads(request.body or b"{}")
+        except ValueError:
+            return _error("JSON inválido.")
+
+    nombre_archivo = os.path.basename(str(datos.get("nombre_archivo", "")).strip())
+    extension = nombre_archivo.rsplit(".", 1)[-1].lower() if "." in nombre_archivo else ""
+    if extension not in EXTENSIONES_PERMITIDAS:
+        return _error("Tipo de archivo no permitido.")
+
+    try:
+        tamanio = int(datos.get("tamanio", 0))
+    except (TypeError, ValueError):
+        tamanio = 0
+    if tamanio <= 0:
+        return _error("Debes indicar el tamaño del archivo.")
+    if tamanio > settings.MAX_UPLOAD_SIZE:
+        limite = settings.MAX_UPLOAD_SIZE / (1024 * 1024)
+        return _error(f"El archivo es demasiado grande. Tamaño máximo: {limite:.0f}MB", status=413)
+
+    incidencia = encuesta = None
+    if datos.get("incidencia_id"):
+        incidencia = get_object_or_404(Incidencia.objects.select_related("cuadrilla"), pk=datos.get("incidencia_id"))
+    if datos.get("encuesta_id"):
+        encuesta = get_object_or_404(Encuesta, pk=datos.get("encuesta_id"))
+    if incidencia is None and encuesta is None:
+        return _error("La evidencia debe asociarse a una incidencia o encuesta.")
+    motivo, status = _motivo_rechazo(request.user, incidencia, encuesta)
+    if motivo:
+        return _error(motivo, status=status)
+
+    carga = CargaEvidencia.objects.create(
+        usuario=request.user,
+        incidencia=incidencia,
+        encuesta=encuesta,
+        nombre=(str(datos.get("nombre") or "").strip() or nombre_archivo)[:100],
+        nombre_archivo=nombre_archivo,
+        tamanio_total=tamanio,
+    )
+    os.makedirs(os.path.dirname(carga.ruta_parcial()), exist_ok=True)
+    open(carga.ruta_parcial(), "wb").close()
+    return JsonResponse({"success": True, **_estado(carga)}, status=201)
+
+
+@presupuesto_consultas(3)
+@login_required
+@require_http_methods(["GET", "PUT"])
+def carga_chunk(request, carga_id):
+    """
+    GET: devuelve cuántos bytes se han recibido (para reanudar).
+    PUT: agrega un trozo. El cuerpo es binario y la cabecera
+    Content-Range: bytes <inicio>-<fin>/<total> indica su posición; <inicio>
+    debe coincidir con los bytes ya recibidos o se responde 409 con el valor
+    correcto. El cuerpo se escribe en disco por bloques, sin cargarlo en memoria.
+    """
+    carga = get_object_or_404(CargaEvidencia, pk=carga_id, usuario=request.user, multimedia__isnull=True)
+    if request.method == "GET":
+        return JsonResponse({"success": True, **_estado(carga)})
+
+    rango = CONTENT_RANGE.match(request.headers.get("Content-Range", ""))
+    if not rango:
+        return _error("Falta la cabecera Content-Range.")
+    inicio, fin, total = (int(x) for x in rango.groups())
+    largo = fin - inicio + 1
+    if total != carga.tamanio_total or largo <= 0 or fin >= total:
+        return _error("Content-Range no coincide con la carga.")
+    if largo > TAMANIO_CHUNK:
+        return _error("El trozo supera el tamaño máximo permitido.", status=413)
+
+    with transaction.atomic():
+        carga = CargaEvidencia.objects.select_for_update().get(pk=carga.pk)
+        if inicio != carga.recibidos:
+            return _error("Posición incorrecta.", status=409, recibidos=carga.recibidos)
+
+        escritos = 0
+        ruta = carga.ruta_parcial()
+        with open(ruta, "r+b" if os.path.exists(ruta) else "w+b") as destino:
+            destino.seek(inicio)
+            while escritos < largo:
+                bloque = request.read(min(TAMANIO_BLOQUE_LECTURA, largo - escritos))
+                if not bloque:
+                    break
+                destino.write(bloque)
+                escritos += len(bloque)
+            destino.truncate()
+
+        carga.recibidos = inicio + escritos
+        carga.save(update_fields=["recibidos", "actualizadoEl"])
+
+    if escritos < largo:
+        return _error("Trozo incompleto.", status=409, recibidos=carga.recibidos)
+    return JsonResponse({"success": True, **_estado(carga)})
+
+
+@presupuesto_consultas(16)
+@login_required
+@require_POST
+def carga_finalizar(request, carga_id):
+    """
+    Mueve el archivo completo a evidencias/ y crea el registro Multimedia.
+    Los permisos se revisan de nuevo: la incidencia pudo cambiar de cuadrilla
+    o de estado durante la subida.
+    """
+    with transaction.atomic():
+        carga = get_object_or_404(
+            CargaEvidencia.objects.select_for_update(of=("self",)).select_related("incidencia__cuadrilla", "encuesta"),
+            pk=carga_id, usuario=request.user, multimedia__isnull=True,
+        )
+        if not carga.completa:
+            return _error("La carga aún no está completa.", status=409, recibidos=carga.recibidos)
+        motivo, status = _motivo_rechazo(request.user, carga.incidencia, carga.encuesta)
+        if motivo:
+            return _error(motivo, status=status)
+
+        formato = carga.nombre_archivo.rsplit(".", 1)[-1].lower()
+        evidencia = Multimedia(
+            nombre=carga.nombre,
+            tipo=Multimedia.detectar_tipo(carga.nombre_archivo),
+            formato=formato,
+            tamanio=carga.tamanio_total,
+            incidencia=carga.incidencia,
+            encuesta=carga.encuesta,
+        )
+        ruta = carga.ruta_parcial()
+        with open(ruta, "rb") as fh:
+            evidencia.archivo.save(carga.nombre_archivo, ArchivoParcial(fh, name=ruta), save=False)
+        evidencia.save()
+        carga.multimedia = evidencia
+        carga.save(update_fields=["multimedia", "actualizadoEl"])
+
+    if os.path.exists(ruta):
+        os.remove(ruta)
+
+    return JsonResponse({
+        "success": True,
+        "evidencia": {
+            "id": evidencia.id,
+            "nombre": evidencia.nombre,
+            "tipo": evidencia.tipo,
+            "formato": evidencia.formato,
+            "url": evidencia.archivo.url,
+            "icono": evidencia.get_icono(),
+            "tamanio": evidencia.tamanio,
+        },
+    })
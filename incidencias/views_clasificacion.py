@@ -1,17 +1,20 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from core.utils import solo_admin
+from django.db.models import Count
+from core.utils import solo_admin, presupuesto_consultas
 from core.models import TipoIncidencia, PreguntaBase
 from .forms_clasificacion import TipoIncidenciaForm, PreguntaBaseForm
 
                                                               
+@presupuesto_consultas(4)
 @login_required
 @solo_admin
 def tipo_lista(request):
-    tipos = TipoIncidencia.objects.all()
+    tipos = TipoIncidencia.objects.annotate(total_preguntas=Count('preguntas_base'))
     return render(request, 'tipo/tipo_lista.html', {'tipos': tipos})
 
+@presupuesto_consultas(3)
 @login_required
 @solo_admin
 def tipo_crear(request):
@@ -25,6 +28,7 @@ def tipo_crear(request):
         form = TipoIncidenciaForm()
     return render(request, 'tipo/tipo_form.html', {'form': form})
 
+@presupuesto_consultas(4)
 @login_required
 @solo_admin
 def tipo_editar(request, pk):
@@ -39,6 +43,7 @@ def tipo_editar(request, pk):
         form = TipoIncidenciaForm(instance=tipo)
     return render(request, 'tipo/tipo_form.html', {'form': form})
 
+@presupuesto_consultas(4)
 @login_required
 @solo_admin
 def tipo_eliminar(request, pk):
@@ -50,6 +55,7 @@ def tipo_eliminar(request, pk):
     return render(request, 'tipo/tipo_eliminar.html', {'obj': tipo})
 
                                                          
+@presupuesto_consultas(5)
 @login_required
 @solo_admin
 def preguntas_base_lista(request, tipo_id):
@@ -60,6 +66,7 @@ def preguntas_base_lista(request, tipo_id):
         'preguntas': preguntas
     })
 
+@presupuesto_consultas(4)
 @login_required
 @solo_admin
 def pregunta_base_crear(request, tipo_id):
@@ -76,6 +83,7 @@ def pregunta_base_crear(request, tipo_id):
         form = PreguntaBaseForm()
     return render(request, 'tipo/pregunta_base_form.html', {'form': form, 'tipo': tipo})
 
+@presupuesto_consultas(5)
 @login_required
 @solo_admin
 def pregunta_base_editar(request, pk):
@@ -90,6 +98,7 @@ def pregunta_base_editar(request, pk):
         form = PreguntaBaseForm(instance=pregunta)
     return render(request, 'tipo/pregunta_base_form.html', {'form': form, 'tipo': pregunta.tipo_incidencia})
 
+@presupuesto_consultas(5)
 @login_required
 @solo_admin
 def pregunta_base_eliminar(request, pk):
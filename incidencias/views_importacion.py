@@ -0,0 +1,58 @@
+import codecs
+
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+
+from core.utils import admin_o_territorial, presupuesto_consultas
+
+from .importacion import FORMATOS, importar_incidencias
+
+MAX_ERRORES_RESPUESTA = 1000
+
+
+def _es_utf8(archivo):
+    """Recorre el archivo por trozos con un decodificador incremental y lo rebobina."""
+    decodificador = codecs.getincrementaldecoder("utf-8-sig")()
+    try:
+        for trozo in archivo.chunks():
+            decodificador.decode(trozo)
+        decodificador.decode(b"", final=True)
+        return True
+    except UnicodeDecodeError:
+        return False
+    finally:
+        archivo.seek(0)
+
+
+@presupuesto_consultas(9)
+@login_required
+@admin_o_territorial
+@require_POST
+def incidencias_importar(request):
+    """
+    Importa incidencias desde el archivo subido en `archivo` (CSV o JSONL,
+    según `formato` o la extensión). Devuelve el resumen y los errores por fila.
+    """
+    archivo = request.FILES.get("archivo")
+    if archivo is None:
+        return JsonResponse({"success": False, "error": "Debes adjuntar un archivo."}, status=400)
+    formato = request.POST.get("formato") or (
+        "jsonl" if archivo.name.lower().endswith((".jsonl", ".json")) else "csv"
+    )
+    if formato not in FORMATOS:
+        return JsonResponse({"success": False, "error": f"Formato no soportado: {formato}"}, status=400)
+    if not _es_utf8(archivo):
+        return JsonResponse({
+            "success": False,
+            "error": "El archivo no está en UTF-8; guárdalo como «CSV UTF-8» e inténtalo de nuevo.",
+        }, status=400)
+
+    resultado = importar_incidencias(codecs.iterdecode(archivo, "utf-8-sig"), formato)
+    return JsonResponse({
+        "success": True,
+        "filas": resultado.filas,
+        "creadas": resultado.creadas,
+        "total_errores": len(resultado.errores),
+        "errores": resultado.errores[:MAX_ERRORES_RESPUESTA],
+    })
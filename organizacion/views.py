@@ -1,21 +1,34 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from core.utils import solo_admin
+from core.utils import solo_admin, roles_de, presupuesto_consultas
 from core.models import Direccion, Departamento, JefeCuadrilla, Incidencia
 from .forms import DireccionForm, DepartamentoForm
 from django.views.decorators.http import require_POST
+from django.db.models import Count, Max
+from core.condicional import etag_por_actualizacion
 
-@login_required
-@solo_admin
-def direcciones_lista(request):
+def _direcciones_filtradas(request):
     q = (request.GET.get("q") or "").strip()
-    estado = (request.GET.get("estado") or "").strip() 
-    qs = Direccion.objects.all().order_by("nombre_direccion")
+    qs = Direccion.objects.all()
     if q:
         qs = qs.filter(nombre_direccion__icontains=q)
+    return qs, q
+
+def _marca_direcciones(request):
+    qs, _ = _direcciones_filtradas(request)
+    return qs.aggregate(ultimo=Max("actualizadoEl"), total=Count("id"))
+
+@presupuesto_consultas(6)
+@login_required
+@solo_admin
+@etag_por_actualizacion(_marca_direcciones)
+def direcciones_lista(request):
+    qs, q = _direcciones_filtradas(request)
+    qs = qs.order_by("nombre_direccion")
     return render(request, "organizacion/direcciones_lista.html", {"direcciones": qs, "q": q})
 
+@presupuesto_consultas(5)
 @login_required
 @solo_admin
 def direccion_crear(request):
@@ -28,6 +41,7 @@ def direccion_crear(request):
         form = DireccionForm()
     return render(request, "organizacion/direccion_form.html", {"form": form})
 
+@presupuesto_consultas(6)
 @login_required
 @solo_admin
 def direccion_editar(request, pk):
@@ -41,6 +55,7 @@ def direccion_editar(request, pk):
         form = DireccionForm(instance=direccion)
     return render(request, "organizacion/direccion_form.html", {"form": form})
 
+@presupuesto_consultas(7)
 @login_required
 @solo_admin
 def direccion_detalle(request, pk):
@@ -50,6 +65,7 @@ def direccion_detalle(request, pk):
         grupo = direccion.encargado.group.name
     return render(request, "organizacion/direccion_detalle.html", {"obj": direccion,"grupo": grupo,})
 
+@presupuesto_consultas(4)
 @login_required
 @solo_admin
 def direccion_eliminar(request, pk):
@@ -60,6 +76,7 @@ def direccion_eliminar(request, pk):
         return redirect("organizacion:direcciones_lista")
     return render(request, "organizacion/direccion_eliminar.html", {"obj": obj})
 
+@presupuesto_consultas(5)
 @login_required
 @solo_admin
 @require_POST
@@ -71,15 +88,29 @@ def direccion_toggle_estado(request, pk):
     messages.success(request, f"Dirección '{obj.nombre_direccion}' {estado_texto}.")
     return redirect("organizacion:direcciones_lista")
 
-@login_required
-@solo_admin
-def departamentos_lista(request):
+def _departamentos_filtrados(request):
     q = request.GET.get("q", "").strip()
-    qs = Departamento.objects.all().order_by("nombre_departamento")
+    qs = Departamento.objects.all()
     if q:
         qs = qs.filter(nombre_departamento__icontains=q)
+    return qs, q
+
+def _marca_departamentos(request):
+    qs, _ = _departamentos_filtrados(request)
+    return qs.aggregate(
+        ultimo=Max("actualizadoEl"), direccion=Max("direccion__actualizadoEl"), total=Count("id")
+    )
+
+@presupuesto_consultas(4)
+@login_required
+@solo_admin
+@etag_por_actualizacion(_marca_departamentos)
+def departamentos_lista(request):
+    qs, q = _departamentos_filtrados(request)
+    qs = qs.select_related("direccion", "encargado__user").order_by("nombre_departamento")
     return render(request, "organizacion/departamentos_lista.html", {"departamentos": qs, "q": q})
 
+@presupuesto_consultas(11)
 @login_required
 @solo_admin
 def departamento_crear(request):
@@ -92,6 +123,7 @@ def departamento_crear(request):
         form = DepartamentoForm()
     return render(request, "organizacion/departamento_form.html", {"form": form})
 
+@presupuesto_consultas(12)
 @login_required
 @solo_admin
 def departamento_editar(request, pk):
@@ -105,6 +137,7 @@ def departamento_editar(request, pk):
         form = DepartamentoForm(instance=departamento)
     return render(request, "organizacion/departamento_form.html", {"form": form})
 
+@presupuesto_consultas(8)
 @login_required
 @solo_admin
 def departamento_detalle(request, pk):
@@ -114,6 +147,7 @@ def departamento_detalle(request, pk):
         grupo = departamento.encargado.group.name
     return render(request, "organizacion/departamento_detalle.html", {"obj": departamento, "grupo": grupo})
 
+@presupuesto_consultas(4)
 @login_required
 @solo_admin
 def departamento_eliminar(request, pk):
@@ -125,6 +159,7 @@ def departamento_eliminar(request, pk):
     return render(request, "organizacion/departamento_eliminar.html", {"obj": obj})
 
 
+@presupuesto_consultas(6)
 @login_required
 @solo_admin
 @require_POST
@@ -136,10 +171,11 @@ def departamento_toggle_estado(request, pk):
     messages.success(request, f"Departamento '{obj.nombre_departamento}' {estado_texto}.")
     return redirect("organizacion:departamentos_lista")
 
+@presupuesto_consultas(5)
 @login_required
 def asignar_cuadrilla_view(request, pk):
     incidencia = get_object_or_404(Incidencia, pk=pk)
-    roles = set(request.user.groups.values_list("name", flat=True))
+    roles = roles_de(request.user)
     
     if not ("Departamento" in roles or request.user.is_superuser or "Administrador" in roles):
         messages.error(request, "No tienes permisos para asignar cuadrillas")
@@ -178,6 +214,7 @@ def asignar_cuadrilla_view(request, pk):
         cuadrillas = JefeCuadrilla.objects.filter(departamento=incidencia.departamento)
     else:
         cuadrillas = JefeCuadrilla.objects.all()
+    cuadrillas = cuadrillas.select_related("usuario__user", "encargado__user")
     
     ctx = {
         'incidencia': incidencia,
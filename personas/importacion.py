@@ -0,0 +1,209 @@
+import csv
+import io
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Upper
+
+from registration.models import Profile
+
+from .forms import ROL_CHOICES
+
+ROLES_VALIDOS = tuple(valor for valor, _ in ROL_CHOICES)
+COLUMNAS = ("nombre", "apellido", "correo", "rol", "telefono")
+CONTRASENA_INICIAL = "P@ssw0rd2025!"
+LOTE = 500
+MIN_PARA_PROCESOS = 8
+MAX_FILAS_WEB = 100
+
+
+class ResultadoImportacion:
+    def __init__(self):
+        self.creados = []
+        self._errores = []
+
+    def error(self, numero, linea, mensaje):
+        self._errores.append((numero, f"Línea {numero} '{linea}': {mensaje}"))
+
+    def error_archivo(self, numero, mensaje):
+        self._errores.append((numero, f"Línea {numero}: {mensaje}"))
+
+    def error_general(self, mensaje):
+        self._errores.append((0, mensaje))
+
+    @property
+    def errores(self):
+        return [mensaje for _, mensaje in sorted(self._errores, key=lambda e: e[0])]
+
+
+def leer_filas(origen, resultado):
+    """
+    Recorre un CSV (texto o archivo) con columnas nombre, apellido, correo,
+    rol, telefono. Ignora líneas vacías y una cabecera opcional.
+    Entrega (numero_de_linea, linea_original, columnas). Si el archivo no
+    está en UTF-8 informa la línea donde falla la decodificación y se detiene.
+    """
+    if isinstance(origen, str):
+        origen = io.StringIO(origen)
+    lector = csv.reader(origen, skipinitialspace=True)
+    numero = 0
+    while True:
+        try:
+            columnas = next(lector)
+        except StopIteration:
+            return
+        except UnicodeDecodeError:
+            resultado.error_archivo(lector.line_num + 1, "el archivo no está en UTF-8; guárdelo como «CSV UTF-8» e inténtelo de nuevo.")
+            return
+        numero += 1
+        columnas = [c.strip() for c in columnas]
+        if not any(columnas):
+            continue
+        if numero == 1 and [c.lower() for c in columnas] == list(COLUMNAS):
+            continue
+        yield numero, ",".join(columnas), columnas
+
+
+def _validar(filas, resultado):
+    """Valida formato de cada línea y duplicados dentro del archivo; devuelve las filas válidas."""
+    validar_username = UnicodeUsernameValidator()
+    validas = []
+    correos, usernames = {}, {}
+    for numero, linea, columnas in filas:
+        if len(columnas) != len(COLUMNAS):
+            resultado.error(numero, linea, f"se esperaban {len(COLUMNAS)} columnas ({', '.join(COLUMNAS)}).")
+            continue
+        datos = dict(zip(COLUMNAS, columnas))
+        if datos["rol"] not in ROLES_VALIDOS:
+            resultado.error(numero, linea, f"Rol inválido '{datos['rol']}'.")
+            continue
+        try:
+            validate_email(datos["correo"])
+            datos["username"] = datos["correo"].split("@")[0]
+            validar_username(datos["username"])
+        except ValidationError as e:
+            resultado.error(numero, linea, " ".join(e.messages))
+            continue
+        if len(datos["username"]) > 150 or len(datos["nombre"]) > 150 or len(datos["apellido"]) > 150:
+            resultado.error(numero, linea, "Nombre, apellido o usuario demasiado largo.")
+            continue
+        if len(datos["telefono"]) > 20:
+            resultado.error(numero, linea, "Teléfono demasiado largo.")
+            continue
+        correo = datos["correo"].upper()
+        if correo in correos:
+            resultado.error(numero, linea, f"Correo repetido en la línea {correos[correo]}.")
+            continue
+        if datos["username"] in usernames:
+            resultado.error(numero, linea, f"Usuario '{datos['username']}' repetido en la línea {usernames[datos['username']]}.")
+            continue
+        correos[correo] = usernames[datos["username"]] = numero
+        validas.append((numero, linea, datos))
+    return validas
+
+
+def _descartar_existentes(validas, resultado):
+    """Quita las filas cuyo correo (sin distinguir mayúsculas) o usuario ya existen, con dos consultas."""
+    if not validas:
+        return validas
+    correos = set(
+        User.objects.annotate(correo=Upper("email"))
+        .filter(correo__in=[d["correo"].upper() for _, _, d in validas])
+        .values_list("correo", flat=True)
+    )
+    usernames = set(
+        User.objects.filter(username__in=[d["username"] for _, _, d in validas])
+        .values_list("username", flat=True)
+    )
+    nuevas = []
+    for numero, linea, datos in validas:
+        if datos["correo"].upper() in correos:
+            resultado.error(numero, linea, "Ya existe un usuario con este correo.")
+        elif datos["username"] in usernames:
+            resultado.error(numero, linea, f"Ya existe el usuario '{datos['username']}'.")
+        else:
+            nuevas.append((numero, linea, datos))
+    return nuevas
+
+
+def cifrar_contrasenas(contrasenas, procesos=1):
+    """
+    Aplica el hasher configurado a cada contraseña (cada una con su sal).
+    Con `procesos` > 1 reparte el trabajo en un pool de procesos, ya que
+    PBKDF2 es CPU puro y no escala con hilos. Solo el comando
+    importar_usuarios usa el pool (`procesos=None` = uno por CPU); las
+    vistas cifran en el mismo proceso para no bifurcar el servidor web.
+    """
+    procesos = procesos or os.cpu_count() or 1
+    if procesos == 1 or len(contrasenas) < MIN_PARA_PROCESOS:
+        return [make_password(c) for c in contrasenas]
+    with ProcessPoolExecutor(max_workers=procesos, initializer=django.setup) as pool:
+        return list(pool.map(make_password, contrasenas, chunksize=max(len(contrasenas) // (procesos * 4), 1)))
+
+
+def importar_usuarios(origen, procesos=1, simular=False, todo_o_nada=False, max_filas=None):
+    """
+    Crea usuarios en bloque desde un CSV. Valida todas las líneas primero,
+    cifra las contraseñas (en paralelo si `procesos` > 1) y guarda usuarios, perfiles y grupos
+    con bulk_create dentro de una sola transacción. Las líneas con error se
+    informan en `resultado.errores`; con `todo_o_nada` no se crea ninguno si
+    hay errores. Con `max_filas` rechaza sin crear nada los archivos más
+    largos, pensado para las vistas, que cifran dentro del request.
+    """
+    resultado = ResultadoImportacion()
+    filas = leer_filas(origen, resultado)
+    if max_filas is not None:
+        filas = list(itertools.islice(filas, max_filas + 1))
+        if len(filas) > max_filas:
+            resultado.error_general(
+                f"El archivo tiene más de {max_filas} usuarios. Para cargas grandes use el comando "
+                "«python manage.py importar_usuarios», que cifra las contraseñas en paralelo."
+            )
+            return resultado
+    validas = _descartar_existentes(_validar(filas, resultado), resultado)
+    if simular or not validas or (todo_o_nada and resultado.errores):
+        return resultado
+
+    hashes = cifrar_contrasenas([CONTRASENA_INICIAL] * len(validas), procesos)
+    usuarios = [
+        User(
+            username=datos["username"],
+            first_name=datos["nombre"],
+            last_name=datos["apellido"],
+            email=datos["correo"],
+            password=hash_,
+            is_active=True,
+        )
+        for (_, _, datos), hash_ in zip(validas, hashes)
+    ]
+
+    with transaction.atomic():
+        grupos = {
+            rol: Group.objects.get_or_create(name=rol)[0]
+            for rol in sorted({datos["rol"] for _, _, datos in validas})
+        }
+        User.objects.bulk_create(usuarios, batch_size=LOTE)
+        Profile.objects.bulk_create(
+            [
+                Profile(user=usuario, group=grupos[datos["rol"]], cargo=datos["rol"], telefono=datos["telefono"])
+                for usuario, (_, _, datos) in zip(usuarios, validas)
+            ],
+            batch_size=LOTE,
+        )
+        User.groups.through.objects.bulk_create(
+            [
+                User.groups.through(user_id=usuario.pk, group_id=grupos[datos["rol"]].pk)
+                for usuario, (_, _, datos) in zip(usuarios, validas)
+            ],
+            batch_size=LOTE,
+        )
+    resultado.creados = usuarios
+    return resultado
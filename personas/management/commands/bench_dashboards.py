@@ -0,0 +1,86 @@
+import io
+import statistics
+import time
+
+from django.contrib.auth.models import Group, User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.models import Departamento, Incidencia, JefeCuadrilla
+
+ESTADOS = ["Pendiente", "En Progreso", "Completada", "Validada", "Rechazada"]
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide consultas y latencia de dashboard_departamento y dashboard_jefe "
+        "con N incidencias por departamento. Los datos se crean dentro de una "
+        "transacción que se revierte al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--incidencias", type=int, nargs="+", default=[10_000, 100_000])
+        parser.add_argument("--repeticiones", type=int, default=5)
+        parser.add_argument("--lote", type=int, default=5_000)
+
+    def handle(self, *args, **opts):
+        for n in opts["incidencias"]:
+            try:
+                with transaction.atomic():
+                    self._medir(n, opts["repeticiones"], opts["lote"])
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+    def _medir(self, n, repeticiones, lote):
+        usuario = User.objects.create_user(f"bench_{n}", f"bench_{n}@municipalidad.local", "bench")
+        for nombre in ("Departamento", "Jefe de Cuadrilla"):
+            usuario.groups.add(Group.objects.get_or_create(name=nombre)[0])
+        profile = usuario.profile
+        departamento = Departamento.objects.create(nombre_departamento=f"Bench {n}", encargado=profile)
+        cuadrilla = JefeCuadrilla.objects.create(
+            nombre_cuadrilla=f"Cuadrilla bench {n}", usuario=profile, departamento=departamento
+        )
+
+        for inicio in range(0, n, lote):
+            Incidencia.objects.bulk_create([
+                Incidencia(
+                    titulo=f"Bench {i}",
+                    descripcion="Incidencia generada para benchmark",
+                    estado=ESTADOS[i % len(ESTADOS)],
+                    prioridad="media",
+                    latitud=-33.45,
+                    longitud=-70.66,
+                    nombre_vecino="Vecino",
+                    correo_vecino="vecino@example.com",
+                    telefono_vecino="+56900000000",
+                    departamento=departamento,
+                    cuadrilla=cuadrilla,
+                )
+                for i in range(inicio, min(inicio + lote, n))
+            ])
+        call_command("recalcular_contadores", stdout=io.StringIO())
+
+        client = Client(SERVER_NAME="localhost")
+        client.force_login(usuario)
+        for nombre in ("personas:dashboard_departamento", "personas:dashboard_jefeCuadrilla"):
+            url = reverse(nombre)
+            client.get(url)
+            tiempos = []
+            for _ in range(repeticiones):
+                with CaptureQueriesContext(connection) as consultas:
+                    t0 = time.perf_counter()
+                    client.get(url)
+                    tiempos.append((time.perf_counter() - t0) * 1000)
+            self.stdout.write(
+                f"{nombre:40} n={n:>7} consultas={len(consultas.captured_queries):>3} "
+                f"mediana={statistics.median(tiempos):8.1f} ms max={max(tiempos):8.1f} ms"
+            )
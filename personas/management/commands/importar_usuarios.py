@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from personas.importacion import importar_usuarios
+
+
+class Command(BaseCommand):
+    help = (
+        "Crea usuarios en bloque desde un CSV (nombre,apellido,correo,rol,telefono). "
+        "Valida todo el archivo, cifra las contraseñas en paralelo e inserta con "
+        "bulk_create en una sola transacción; informa los errores por línea."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo")
+        parser.add_argument("--procesos", type=int, default=None,
+                            help="Procesos para cifrar contraseñas (por defecto, uno por CPU).")
+        parser.add_argument("--simular", action="store_true",
+                            help="Solo valida y muestra los errores; no crea usuarios.")
+        parser.add_argument("--todo-o-nada", action="store_true",
+                            help="No crea ningún usuario si alguna línea tiene errores.")
+
+    def handle(self, *args, **opts):
+        try:
+            with open(opts["archivo"], encoding="utf-8-sig", newline="") as archivo:
+                resultado = importar_usuarios(
+                    archivo,
+                    procesos=opts["procesos"],
+                    simular=opts["simular"],
+                    todo_o_nada=opts["todo_o_nada"],
+                )
+        except OSError as e:
+            raise CommandError(f"No se pudo leer '{opts['archivo']}': {e}")
+
+        for error in resultado.errores:
+            self.stderr.write(error)
+        if opts["simular"]:
+            self.stdout.write(f"Simulación: {len(resultado.errores)} líneas con errores.")
+        elif opts["todo_o_nada"] and resultado.errores:
+            raise CommandError(f"{len(resultado.errores)} líneas con errores; no se creó ningún usuario.")
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Usuarios creados: {len(resultado.creados)}. Líneas con errores: {len(resultado.errores)}."
+            ))
@@ -1,3 +1,160 @@
+import codecs
+import io
+from datetime import timedelta
+
+from django.contrib.auth.models import Group, User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import Departamento, Incidencia, JefeCuadrilla
+
+from .importacion import MAX_FILAS_WEB, importar_usuarios
+
+
+class ImportarUsuariosTests(TestCase):
+    """importar_usuarios valida línea por línea y crea usuario, perfil y grupo."""
+
+    def test_crea_usuarios_con_perfil_y_grupo(self):
+        resultado = importar_usuarios(
+            "nombre,apellido,correo,rol,telefono\n"
+            "Ana,Pérez,ana@municipalidad.local,Territorial,+56911112222\n"
+        )
+        self.assertEqual(resultado.errores, [])
+        usuario = User.objects.get(username="ana")
+        self.assertTrue(usuario.check_password("P@ssw0rd2025!"))
+        self.assertEqual(usuario.profile.group.name, "Territorial")
+        self.assertEqual(list(usuario.groups.values_list("name", flat=True)), ["Territorial"])
+
+    def test_informa_errores_con_su_numero_de_linea(self):
+        User.objects.create_user("existe", "existe@municipalidad.local")
+        resultado = importar_usuarios(
+            "Ana,Pérez,ana@municipalidad.local,Territorial,1\n"
+            "Beto,Soto,beto@municipalidad.local,Alcalde,2\n"
+            "Carla,Díaz,no-es-correo,Territorial,3\n"
+            "Ana,Otra,ANA@municipalidad.local,Territorial,4\n"
+            "Eva,Rojas,existe@municipalidad.local,Territorial,5\n"
+            "solo,tres,columnas\n",
+            simular=True,
+        )
+        self.assertEqual([e.split("'")[0] for e in resultado.errores],
+                         ["Línea 2 ", "Línea 3 ", "Línea 4 ", "Línea 5 ", "Línea 6 "])
+        self.assertIn("Rol inválido", resultado.errores[0])
+        self.assertIn("repetido en la línea 1", resultado.errores[2])
+        self.assertIn("Ya existe", resultado.errores[3])
+        self.assertFalse(User.objects.filter(username="ana").exists())
+
+    def test_todo_o_nada_no_crea_si_hay_errores(self):
+        resultado = importar_usuarios(
+            "Ana,Pérez,ana@municipalidad.local,Territorial,1\n"
+            "Beto,Soto,beto@municipalidad.local,Alcalde,2\n",
+            todo_o_nada=True,
+        )
+        self.assertEqual(len(resultado.errores), 1)
+        self.assertEqual(resultado.creados, [])
+        self.assertFalse(User.objects.filter(username="ana").exists())
+
+    def test_archivo_latin1_informa_error_de_linea(self):
+        contenido = "Ana,Pérez,ana@municipalidad.local,Territorial,1\n".encode("latin-1")
+        resultado = importar_usuarios(codecs.iterdecode(io.BytesIO(contenido), "utf-8-sig"))
+        self.assertEqual(len(resultado.errores), 1)
+        self.assertTrue(resultado.errores[0].startswith("Línea 1:"))
+        self.assertIn("UTF-8", resultado.errores[0])
+
+    def test_vista_no_falla_con_archivo_latin1(self):
+        admin = User.objects.create_user("admin", "admin@municipalidad.local", "clave-segura-123")
+        admin.groups.add(Group.objects.get_or_create(name="Administrador")[0])
+        self.client.force_login(admin)
+        archivo = SimpleUploadedFile(
+            "usuarios.csv", "Ana,Pérez,ana@municipalidad.local,Territorial,1\n".encode("cp1252")
+        )
+        respuesta = self.client.post(
+            reverse("personas:usuario_crear"), {"crear_multiples": "1", "archivo_usuarios": archivo}
+        )
+        self.assertRedirects(respuesta, reverse("personas:usuarios_lista"), fetch_redirect_response=False)
+        self.assertFalse(User.objects.filter(username="ana").exists())
+
+    def test_vista_rechaza_archivos_sobre_el_limite_web(self):
+        admin = User.objects.create_user("admin", "admin@municipalidad.local", "clave-segura-123")
+        admin.groups.add(Group.objects.get_or_create(name="Administrador")[0])
+        self.client.force_login(admin)
+        lineas = "".join(
+            f"Usuario,{i},usuario{i}@municipalidad.local,Territorial,{i}\n" for i in range(MAX_FILAS_WEB + 1)
+        )
+        respuesta = self.client.post(
+            reverse("personas:usuario_crear"), {"crear_multiples": "1", "bulk_users": lineas}, follow=True
+        )
+        mensajes = [str(m) for m in respuesta.context["messages"]]
+        self.assertTrue(any("manage.py importar_usuarios" in m for m in mensajes), mensajes)
+        self.assertFalse(User.objects.filter(username__startswith="usuario").exists())
+
+    def test_sin_limite_el_comando_importa_todo(self):
+        lineas = "".join(f"Usuario,{i},usuario{i}@municipalidad.local,Territorial,{i}\n" for i in range(3))
+        self.assertEqual(len(importar_usuarios(lineas, max_filas=2).errores), 1)
+        self.assertEqual(len(importar_usuarios(lineas).creados), 3)
+
+
+class DashboardsTests(TestCase):
+    """Los dashboards de jefe y departamento limitan, ordenan y totalizan cada sección."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jefe = User.objects.create_user("jefe", "jefe@municipalidad.local", "clave-segura-123")
+        cls.jefe.groups.add(Group.objects.get_or_create(name="Jefe de Cuadrilla")[0])
+        cls.encargado = User.objects.create_user("depto", "depto@municipalidad.local", "clave-segura-123")
+        cls.encargado.groups.add(Group.objects.get_or_create(name="Departamento")[0])
+        departamento = Departamento.objects.create(nombre_departamento="Obras", encargado=cls.encargado.profile)
+        cuadrilla = JefeCuadrilla.objects.create(
+            nombre_cuadrilla="Cuadrilla 1", usuario=cls.jefe.profile, departamento=departamento
+        )
+        otro = Departamento.objects.create(nombre_departamento="Aseo")
+        datos = {
+            "descripcion": "d", "latitud": -33.45, "longitud": -70.66, "nombre_vecino": "V",
+            "correo_vecino": "v@correo.cl", "telefono_vecino": "1", "departamento": departamento,
+            "cuadrilla": cuadrilla,
+        }
+        Incidencia.objects.bulk_create(
+            [Incidencia(titulo=f"Pendiente {i}", estado="Pendiente", **datos) for i in range(55)]
+            + [Incidencia(titulo=f"En curso {i}", estado="En Progreso", **datos) for i in range(3)]
+            + [Incidencia(titulo=f"Validada {i}", estado="Validada", **datos) for i in range(12)]
+            + [Incidencia(titulo="Ajena", estado="Pendiente", **{**datos, "departamento": otro, "cuadrilla": None})]
+        )
+        ahora = timezone.now()
+        Incidencia.objects.filter(estado="Validada").update(actualizadoEl=ahora - timedelta(days=10))
+        cls.antigua, cls.reciente = Incidencia.objects.bulk_create([
+            Incidencia(titulo="Creada antes, cerrada después", estado="Completada", **datos),
+            Incidencia(titulo="Creada después, cerrada antes", estado="Completada", **datos),
+        ])
+        Incidencia.objects.filter(pk=cls.antigua.pk).update(creadoEl=ahora - timedelta(days=2), actualizadoEl=ahora)
+        Incidencia.objects.filter(pk=cls.reciente.pk).update(
+            creadoEl=ahora - timedelta(days=1), actualizadoEl=ahora - timedelta(hours=1)
+        )
+        call_command("recalcular_contadores", stdout=io.StringIO())
+        cls.pendientes = list(
+            Incidencia.objects.filter(estado="Pendiente", departamento=departamento)
+            .order_by("-creadoEl", "-id").values_list("pk", flat=True)
+        )
+
+    def test_dashboard_jefe(self):
+        self.client.force_login(User.objects.get(pk=self.jefe.pk))
+        with self.assertNumQueries(5):
+            contexto = self.client.get(reverse("personas:dashboard_jefeCuadrilla")).context
+        self.assertEqual([i.pk for i in contexto["incidencias_pendientes"]], self.pendientes[:50])
+        self.assertEqual(len(contexto["incidencias_en_progreso"]), 3)
+        cerradas = contexto["incidencias_Completadas"]
+        self.assertEqual(len(cerradas), 10)
+        self.assertEqual([i.pk for i in cerradas[:2]], [self.antigua.pk, self.reciente.pk])
+        self.assertEqual((contexto["total_pendientes"], contexto["total_en_progreso"]), (55, 3))
 
-                         
+    def test_dashboard_departamento(self):
+        self.client.force_login(User.objects.get(pk=self.encargado.pk))
+        with self.assertNumQueries(5):
+            contexto = self.client.get(reverse("personas:dashboard_departamento")).context
+        self.assertEqual([i.pk for i in contexto["incidencias_pendientes"]], self.pendientes[:50])
+        self.assertEqual(len(contexto["incidencias_en_progreso"]), 3)
+        self.assertEqual([i.pk for i in contexto["incidencias_Completadas"]], [self.reciente.pk, self.antigua.pk])
+        self.assertEqual(
+            (contexto["total_pendientes"], contexto["total_en_progreso"], contexto["total_Completadas"]), (55, 3, 2)
+        )
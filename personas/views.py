@@ -1,5 +1,7 @@
+import codecs
+
 from django.shortcuts import render, get_object_or_404, redirect
-from django.contrib.auth.models import User, Group
+from django.contrib.auth.models import User
 from django.contrib.auth import logout
 from registration.models import Profile
 from django.contrib import messages
@@ -7,22 +9,70 @@ from django.contrib.auth.decorators import login_required
 from django.db.models import Q
 from django.views.decorators.http import require_POST
 from .forms import UsuarioCrearForm, UsuarioEditarForm
+from .importacion import MAX_FILAS_WEB, importar_usuarios
 from .utils import solo_admin
-from core.utils import solo_direccion, solo_cuadrilla, solo_territorial
-from core.models import Incidencia, Departamento, Direccion, JefeCuadrilla
+from core.utils import solo_direccion, solo_cuadrilla, solo_territorial, roles_de, presupuesto_consultas
+from core.models import Incidencia, Departamento, Direccion, JefeCuadrilla, ContadorIncidencias
+from core.busqueda import buscar_usuarios
 from registration.models import Profile
 from core.models import Incidencia, JefeCuadrilla, Departamento
 from django.db.models import Q, Count
+from django.db.models import Case, F, Value, When, Window
+from django.db.models.functions import RowNumber
+
+FILAS_POR_SECCION = 50
+MAX_ERRORES_MENSAJE = 100
+
 
+def _conteo_por_estado(qs):
+    """Totales por estado del queryset en un solo GROUP BY."""
+    return dict(qs.order_by().values_list('estado').annotate(total=Count('id')))
+
+
+def _filas_por_seccion(qs, secciones):
+    """
+    Trae en una sola consulta las filas visibles de varias secciones del dashboard.
+    `secciones` es una lista de (clave, estados, campo_orden, limite). Cada fila se
+    etiqueta con su sección y se numera con ROW_NUMBER() dentro de ella, de modo que
+    la base de datos devuelve a lo más `limite` filas por sección ya ordenadas.
+    """
+    seccion = Case(
+        *[When(estado__in=estados, then=Value(clave)) for clave, estados, _, _ in secciones],
+        default=Value(''),
+    )
+    orden = Case(
+        *[When(estado__in=estados, then=F(campo)) for _, estados, campo, _ in secciones],
+    )
+    limites = Q()
+    for clave, _, _, limite in secciones:
+        limites |= Q(seccion=clave, fila__lte=limite)
+
+    filas = (
+        qs.filter(estado__in=[e for _, estados, _, _ in secciones for e in estados])
+        .select_related('departamento', 'cuadrilla', 'tipo_incidencia')
+        .annotate(
+            seccion=seccion,
+            fila=Window(RowNumber(), partition_by=[seccion], order_by=[orden.desc(), F('id').desc()]),
+        )
+        .filter(limites)
+        .order_by('seccion', 'fila')
+    )
+    resultado = {clave: [] for clave, _, _, _ in secciones}
+    for incidencia in filas:
+        resultado[incidencia.seccion].append(incidencia)
+    return resultado
+
+@presupuesto_consultas(9)
 @login_required
 def dashboard_admin(request):
-    ultimos_usuarios = Profile.objects.order_by('-id')[:5] 
-    ultimas_direcciones = Direccion.objects.order_by('-creadoEl')[:5]
-    ultimos_departamentos = Departamento.objects.order_by('-creadoEl')[:5]
-    ultimas_incidencias = Incidencia.objects.order_by('-creadoEl')[:5]
+    ultimos_usuarios = Profile.objects.select_related('user', 'group').order_by('-id')[:5] 
+    ultimas_direcciones = Direccion.objects.select_related('encargado__user').order_by('-creadoEl')[:5]
+    ultimos_departamentos = Departamento.objects.select_related('encargado__user').order_by('-creadoEl')[:5]
+    ultimas_incidencias = Incidencia.objects.select_related('departamento__direccion').order_by('-creadoEl')[:5]
     total_usuarios = Profile.objects.count()
-    total_incidencias_creadas = Incidencia.objects.count()
-    total_incidencias_finalizadas = Incidencia.objects.filter(estado='Completada').count()
+    totales = ContadorIncidencias.totales_por_estado()
+    total_incidencias_creadas = sum(totales.values())
+    total_incidencias_finalizadas = totales['Completada']
 
     contexto = {
         'ultimos_usuarios': ultimos_usuarios,
@@ -36,6 +86,7 @@ def dashboard_admin(request):
 
     return render(request, "personas/dashboards/admin.html", contexto)
 
+@presupuesto_consultas(3)
 @login_required
 @solo_territorial
 def dashboard_territorial(request):
@@ -45,6 +96,7 @@ def dashboard_territorial(request):
     })
 
 
+@presupuesto_consultas(7)
 @solo_cuadrilla
 def dashboard_jefe(request):
     try:
@@ -53,47 +105,44 @@ def dashboard_jefe(request):
         profile = None
         
     if profile:
-        cuadrillas = JefeCuadrilla.objects.filter(
-            Q(usuario=profile) | Q(encargado=profile)
+        cuadrillas = list(
+            JefeCuadrilla.objects.filter(Q(usuario=profile) | Q(encargado=profile))
+            .select_related('departamento')
         )
     else:
-        cuadrillas = JefeCuadrilla.objects.none()
+        cuadrillas = []
     
-    incidencias_pendientes = []
-    incidencias_en_progreso = []
-    incidencias_Completadas = []
+    secciones = {'pendientes': [], 'en_progreso': [], 'cerradas': []}
+    totales = {}
     
-    if cuadrillas.exists():
-        incidencias_pendientes = Incidencia.objects.filter(
-            cuadrilla__in=cuadrillas,
-            estado='Pendiente'
-        ).order_by('-creadoEl')
-        
-        incidencias_en_progreso = Incidencia.objects.filter(
-            cuadrilla__in=cuadrillas,
-            estado='En Progreso'
-        ).order_by('-creadoEl')
-        
-        incidencias_Completadas = Incidencia.objects.filter(
-            cuadrilla__in=cuadrillas,
-            estado__in=['Completada', 'Validada', 'Rechazada']
-        ).order_by('-actualizadoEl')[:10]  
+    if cuadrillas:
+        qs = Incidencia.objects.filter(cuadrilla__in=cuadrillas)
+        totales = _conteo_por_estado(qs)
+        secciones = _filas_por_seccion(qs, [
+            ('pendientes', ['Pendiente'], 'creadoEl', FILAS_POR_SECCION),
+            ('en_progreso', ['En Progreso'], 'creadoEl', FILAS_POR_SECCION),
+            ('cerradas', ['Completada', 'Validada', 'Rechazada'], 'actualizadoEl', 10),
+        ])
     
     return render(request, "personas/dashboards/jefeCuadrilla.html", {
         'cuadrillas': cuadrillas,
-        'incidencias_pendientes': incidencias_pendientes,
-        'incidencias_en_progreso': incidencias_en_progreso,
-        'incidencias_Completadas': incidencias_Completadas,
+        'incidencias_pendientes': secciones['pendientes'],
+        'incidencias_en_progreso': secciones['en_progreso'],
+        'incidencias_Completadas': secciones['cerradas'],
+        'total_pendientes': totales.get('Pendiente', 0),
+        'total_en_progreso': totales.get('En Progreso', 0),
     })
 
+@presupuesto_consultas(3)
 @login_required
 @solo_direccion
 def dashboard_direccion(request):
     return render(request, "personas/dashboards/direccion.html")
 
+@presupuesto_consultas(7)
 @login_required
 def dashboard_departamento(request):    
-    roles = set(request.user.groups.values_list("name", flat=True))
+    roles = roles_de(request.user)
     
     if not ("Departamento" in roles or request.user.is_superuser or "Administrador" in roles):
         messages.error(request, "No tienes acceso a este dashboard")
@@ -105,41 +154,33 @@ def dashboard_departamento(request):
         departamento = None
     
     if departamento:
-        incidencias_pendientes = Incidencia.objects.filter(
-            departamento=departamento,
-            estado='Pendiente'
-        ).order_by('-creadoEl')
-        
-        incidencias_en_progreso = Incidencia.objects.filter(
-            departamento=departamento,
-            estado='En progreso'
-        ).order_by('-creadoEl')
-        
-        incidencias_Completadas = Incidencia.objects.filter(
-            departamento=departamento,
-            estado='Completada'
-        ).order_by('-creadoEl')
-        
+        qs = Incidencia.objects.filter(departamento=departamento)
         cuadrillas = JefeCuadrilla.objects.filter(departamento=departamento)
     else:
-        incidencias_pendientes = Incidencia.objects.filter(estado='Pendiente').order_by('-creadoEl')
-        incidencias_en_progreso = Incidencia.objects.filter(estado='En Progreso').order_by('-creadoEl')
-        incidencias_Completadas = Incidencia.objects.filter(estado='Completada').order_by('-creadoEl')
+        qs = Incidencia.objects.all()
         cuadrillas = JefeCuadrilla.objects.all()
+
+    secciones = _filas_por_seccion(qs, [
+        ('pendientes', ['Pendiente'], 'creadoEl', FILAS_POR_SECCION),
+        ('en_progreso', ['En Progreso'], 'creadoEl', FILAS_POR_SECCION),
+        ('completadas', ['Completada'], 'creadoEl', FILAS_POR_SECCION),
+    ])
+    totales = ContadorIncidencias.totales_por_estado(departamento)
     
     ctx = {
         'departamento': departamento,
-        'incidencias_pendientes': incidencias_pendientes,
-        'incidencias_en_progreso': incidencias_en_progreso,
-        'incidencias_Completadas': incidencias_Completadas,
+        'incidencias_pendientes': secciones['pendientes'],
+        'incidencias_en_progreso': secciones['en_progreso'],
+        'incidencias_Completadas': secciones['completadas'],
         'cuadrillas': cuadrillas,
-        'total_pendientes': incidencias_pendientes.count(),
-        'total_en_progreso': incidencias_en_progreso.count(),
-        'total_Completadas': incidencias_Completadas.count(),
+        'total_pendientes': totales['Pendiente'],
+        'total_en_progreso': totales['En Progreso'],
+        'total_Completadas': totales['Completada'],
     }
     
     return render(request, 'personas/dashboards/departamento.html', ctx)
 
+@presupuesto_consultas(4)
 @login_required
 def check_profile(request):
     """
@@ -150,7 +191,7 @@ def check_profile(request):
     if user.is_superuser:
         return redirect("personas:dashboard_admin")
     
-    grupos = list(user.groups.values_list("name", flat=True))
+    grupos = roles_de(user)
 
     try:
         profile = Profile.objects.select_related('group').get(user=user)
@@ -184,6 +225,7 @@ def check_profile(request):
         return redirect("login")
     
 
+@presupuesto_consultas(3)
 @login_required
 @solo_admin
 def usuarios_lista(request):
@@ -192,12 +234,7 @@ def usuarios_lista(request):
     qs = User.objects.all().order_by("id")
     
     if q:
-        qs = qs.filter(
-            Q(username__icontains=q) |
-            Q(first_name__icontains=q) |
-            Q(last_name__icontains=q) |
-            Q(email__icontains=q)
-        )
+        qs = buscar_usuarios(qs, q)
     if rol_seleccionado:
         qs = qs.filter(profile_group__name=rol_seleccionado)
     
@@ -212,60 +249,20 @@ def usuarios_lista(request):
 
     return redirect("core:usuarios_lista")
 
+@presupuesto_consultas(3)
 @login_required
 @solo_admin
 def usuario_crear(request):
-    ROL_VALIDOS = ["Administrador", "Dirección", "Departamento", "Jefe de Cuadrilla", "Territorial"]
-
     if request.method == "POST" and "crear_multiples" in request.POST:
-        bulk_data = request.POST.get("bulk_users", "").strip()
-        lines = bulk_data.split("\n")
-
-        creados = 0
-        errores = []
-
-        for linea in lines:
-            if not linea.strip():
-                continue
-            try:
-                nombre, apellido, correo, rol, telefono = [x.strip() for x in linea.split(",")]
-                if rol not in ROL_VALIDOS:
-                    errores.append(f"Línea '{linea}': Rol inválido '{rol}'")
-                    continue
-
-                form_data = {
-                    "username": correo.split("@")[0],
-                    "first_name": nombre,
-                    "last_name": apellido,
-                    "email": correo,
-                    "password1": "P@ssw0rd2025!",
-                    "password2": "P@ssw0rd2025!",
-                    "rol": rol,
-                    "cargo": rol,
-                }
-
-                form = UsuarioCrearForm(form_data)
-                if not form.is_valid():
-                    errores.append(f"Línea '{linea}': {form.errors.as_json()}")
-                    continue
-
-                user = form.save()
-
-                group, _ = Group.objects.get_or_create(name=rol)
-                user.groups.add(group)
-
-                profile = user.profile
-                profile.telefono = telefono
-                profile.save()
-
-                creados += 1
-
-            except Exception as e:
-                errores.append(f"Error en línea '{linea}': {e}")
-
-        messages.success(request, f"Usuarios creados correctamente: {creados}")
-        for err in errores:
+        archivo = request.FILES.get("archivo_usuarios")
+        origen = codecs.iterdecode(archivo, "utf-8-sig") if archivo else request.POST.get("bulk_users", "")
+        resultado = importar_usuarios(origen, procesos=1, max_filas=MAX_FILAS_WEB)
+
+        messages.success(request, f"Usuarios creados correctamente: {len(resultado.creados)}")
+        for err in resultado.errores[:MAX_ERRORES_MENSAJE]:
             messages.error(request, err)
+        if len(resultado.errores) > MAX_ERRORES_MENSAJE:
+            messages.error(request, f"... y {len(resultado.errores) - MAX_ERRORES_MENSAJE} líneas más con errores.")
 
         return redirect("personas:usuarios_lista")
 
@@ -281,8 +278,9 @@ def usuario_crear(request):
     return render(
         request, 
         "personas/usuario_form.html", 
-        {"form": form, "modo": "crear"}
+        {"form": form, "modo": "crear", "max_filas_web": MAX_FILAS_WEB}
     )
+@presupuesto_consultas(7)
 @login_required
 @solo_admin
 def usuario_editar(request, pk):
@@ -297,6 +295,7 @@ def usuario_editar(request, pk):
         form = UsuarioEditarForm(instance=user)
     return render(request, "personas/usuario_form.html", {"form": form, "modo": "editar", "obj": user})
 
+@presupuesto_consultas(5)
 @login_required
 @solo_admin
 @require_POST
@@ -314,6 +313,7 @@ def usuario_toggle_activo(request, pk):
     messages.success(request, f"Usuario '{user.username}' {estado}.")
     return redirect("personas:usuarios_lista")
 
+@presupuesto_consultas(5)
 @login_required
 @solo_admin
 def usuario_detalle(request, pk):
@@ -321,6 +321,7 @@ def usuario_detalle(request, pk):
     groups = list(user.groups.values_list("name", flat=True))
     return render(request, "personas/usuario_detalle.html", {"obj": user, "groups": groups})
 
+@presupuesto_consultas(4)
 def cerrar_sesion(request):
     logout(request)
     request.session.flush()
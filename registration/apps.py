@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RegistrationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'registration'
+
+    def ready(self):
+        from . import signals
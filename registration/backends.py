@@ -0,0 +1,18 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+UserModel = get_user_model()
+
+
+class PerfilBackend(ModelBackend):
+    """
+    ModelBackend que carga el Profile junto con el usuario de la sesión, así
+    core.middleware.RolesMiddleware lee Profile.version_roles sin otra consulta.
+    """
+
+    def get_user(self, user_id):
+        try:
+            user = UserModel._default_manager.select_related("profile").get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 22:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registration', '0003_profile_cargo_profile_telefono'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='version_roles',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
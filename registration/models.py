@@ -10,6 +10,7 @@ class Profile(models.Model):
     first_session = models.CharField(max_length = 240,null=True, blank=True, default='Si')
     telefono = models.CharField(max_length=20, null=True, blank=True)
     cargo = models.CharField(max_length=100, null=True, blank=True)
+    version_roles = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ['user__username']
@@ -17,12 +18,13 @@ class Profile(models.Model):
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name}" + (f" ({self.cargo})" if self.cargo else "")
 
+def grupo_por_defecto(user):
+    """Grupo del Profile de un usuario sin grupos: Administrador si es superusuario, si no Usuario."""
+    nombre = "Administrador" if user.is_superuser else "Usuario"
+    return Group.objects.get_or_create(name=nombre)[0]
+
                                   
 @receiver(post_save, sender=User)
 def crear_profile(sender, instance, created, **kwargs):
     if created:
-        if instance.is_superuser:
-            grupo, _ = Group.objects.get_or_create(name="Administrador")
-        else:
-            grupo, _ = Group.objects.get_or_create(name="Usuario")
-        Profile.objects.create(user=instance, group=grupo)
+        Profile.objects.create(user=instance, group=grupo_por_defecto(instance))
@@ -1,8 +1,10 @@
-                         
-from django.db.models.signals import post_save, m2m_changed
+from django.contrib.auth.signals import user_logged_in
+from django.db.models import F
+from django.db.models.signals import post_save, pre_delete, m2m_changed
 from django.dispatch import receiver
-from django.contrib.auth.models import User
-from .models import Profile 
+from django.contrib.auth.models import Group, User
+from core.utils import roles_en_sesion
+from .models import Profile, grupo_por_defecto
 
 @receiver(post_save, sender=User)
 def ensure_profile_on_create(sender, instance, created, **kwargs):
@@ -18,13 +20,50 @@ def ensure_profile_on_create(sender, instance, created, **kwargs):
             profile.save()
 
 @receiver(m2m_changed, sender=User.groups.through)
-def sync_profile_when_groups_change(sender, instance, action, **kwargs):
+def sync_profile_when_groups_change(sender, instance, action, reverse, pk_set, **kwargs):
     """
-    Si cambian los grupos del User (p.ej. al editarlo en el panel),
-    sincronizamos el Profile.group con el primer grupo asignado.
+    Si cambian los grupos del User (p.ej. al editarlo en el panel, o al
+    editar el grupo con group.user_set), sincronizamos el Profile.group con
+    el primer grupo asignado; sin grupos vuelve al grupo por defecto.
+    Incrementa Profile.version_roles para que RolesMiddleware descarte los
+    roles guardados en la sesión, en cualquier worker.
     """
-    if action in ("post_add", "post_remove", "post_clear"):
-        profile, _ = Profile.objects.get_or_create(user=instance)
-        first_group = instance.groups.first()
-        profile.group = first_group 
-        profile.save()
+    if reverse:
+        if action == "pre_clear":
+            instance._usuarios_antes_de_vaciar = list(instance.user_set.all())
+            return
+        if action == "post_clear":
+            usuarios = getattr(instance, "_usuarios_antes_de_vaciar", [])
+        elif action in ("post_add", "post_remove"):
+            usuarios = User.objects.filter(pk__in=pk_set or ())
+        else:
+            return
+    elif action in ("post_add", "post_remove", "post_clear"):
+        usuarios = [instance]
+    else:
+        return
+
+    for usuario in usuarios:
+        usuario.__dict__.pop("_roles_cache", None)
+        grupo = usuario.groups.first() or grupo_por_defecto(usuario)
+        profile, _ = Profile.objects.get_or_create(user=usuario, defaults={"group": grupo})
+        if profile.group_id != grupo.pk:
+            profile.group = grupo
+            profile.save(update_fields=["group"])
+    Profile.objects.filter(user__in=[usuario.pk for usuario in usuarios]).update(
+        version_roles=F("version_roles") + 1
+    )
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidar_roles_del_grupo(sender, instance, created=False, **kwargs):
+    """Renombrar o borrar un grupo cambia los roles de sus usuarios: invalida los guardados en sesión."""
+    if not created:
+        Profile.objects.filter(user__groups=instance).update(version_roles=F("version_roles") + 1)
+
+
+@receiver(user_logged_in)
+def guardar_roles_al_iniciar_sesion(sender, request, user, **kwargs):
+    """Los roles quedan en la sesión que el login ya guarda, sin otra escritura en el primer request."""
+    roles_en_sesion(request.session, user)
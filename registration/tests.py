@@ -1,3 +1,83 @@
+from django.contrib.auth.models import Group, User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-                         
+from core.utils import roles_de
+
+
+class SincronizarGruposTests(TestCase):
+    """Profile.group y roles_de siguen a los grupos del usuario."""
+
+    def setUp(self):
+        self.admin = Group.objects.create(name="Administrador")
+        self.territorial = Group.objects.create(name="Territorial")
+        self.usuario = User.objects.create_user("ana", "ana@municipalidad.local", "clave-segura-123")
+
+    def grupo_del_perfil(self):
+        return User.objects.get(pk=self.usuario.pk).profile.group.name
+
+    def test_agregar_y_quitar_grupos_actualiza_el_perfil(self):
+        self.usuario.groups.add(self.territorial)
+        self.assertEqual(self.grupo_del_perfil(), "Territorial")
+        self.usuario.groups.remove(self.territorial)
+        self.assertEqual(self.grupo_del_perfil(), "Usuario")
+
+    def test_vaciar_grupo_desde_el_grupo(self):
+        self.territorial.user_set.add(self.usuario)
+        self.assertEqual(self.grupo_del_perfil(), "Territorial")
+        self.territorial.user_set.clear()
+        self.assertEqual(self.grupo_del_perfil(), "Usuario")
+
+    def test_roles_no_quedan_cacheados_entre_requests(self):
+        self.usuario.groups.add(self.admin)
+        self.assertIn("Administrador", roles_de(User.objects.get(pk=self.usuario.pk)))
+        self.admin.user_set.remove(self.usuario)
+        self.assertNotIn("Administrador", roles_de(User.objects.get(pk=self.usuario.pk)))
+
+    def test_cambio_de_grupos_olvida_los_roles_del_mismo_objeto(self):
+        self.assertEqual(roles_de(self.usuario), frozenset())
+        self.usuario.groups.add(self.admin)
+        self.assertEqual(roles_de(self.usuario), {"Administrador"})
+
+
+class RolesEnSesionTests(TestCase):
+    """RolesMiddleware guarda los roles en la sesión y los descarta cuando cambian los grupos."""
+
+    def setUp(self):
+        self.admin = Group.objects.create(name="Administrador")
+        self.usuario = User.objects.create_user("ana", "ana@municipalidad.local", "clave-segura-123")
+        self.client.force_login(self.usuario)
+
+    def pedir(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse("core:dashboard_admin"))
+        consultas_grupos = [q["sql"] for q in consultas.captured_queries if '"auth_user_groups"' in q["sql"]]
+        return respuesta.status_code, consultas_grupos
+
+    def test_segundo_request_no_consulta_grupos(self):
+        self.admin.user_set.add(self.usuario)
+        estado, consultas_grupos = self.pedir()
+        self.assertEqual((estado, len(consultas_grupos)), (200, 1))
+        self.assertEqual(self.pedir(), (200, []))
+
+    def test_login_deja_los_roles_en_la_sesion(self):
+        self.admin.user_set.add(self.usuario)
+        self.client.force_login(User.objects.get(pk=self.usuario.pk))
+        self.assertEqual(self.pedir(), (200, []))
+
+    def test_cambio_de_grupos_rige_en_el_siguiente_request(self):
+        self.assertEqual(self.pedir()[0], 302)
+        self.assertEqual(self.pedir(), (302, []))
+        self.admin.user_set.add(self.usuario)
+        self.assertEqual(self.pedir()[0], 200)
+        self.usuario.groups.remove(self.admin)
+        self.assertEqual(self.pedir()[0], 302)
+
+    def test_renombrar_o_borrar_el_grupo_invalida_los_roles(self):
+        self.admin.user_set.add(self.usuario)
+        self.assertEqual(self.pedir()[0], 200)
+        self.admin.name = "Ex administrador"
+        self.admin.save()
+        self.assertEqual(self.pedir()[0], 302)
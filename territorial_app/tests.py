@@ -1,3 +1,82 @@
+from django.contrib.auth.models import Group, User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-                         
+from core.models import Departamento, Encuesta, Incidencia, JefeCuadrilla
+from .views import ENCUESTAS_POR_PAGINA
+
+
+class EncuestasListaJefeTests(TestCase):
+    """encuestas_lista no debe hacer una consulta por encuesta para un jefe de cuadrilla."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user("jefe", "jefe@municipalidad.local", "clave-segura-123")
+        for nombre in ("Territorial", "Jefe de Cuadrilla"):
+            cls.usuario.groups.add(Group.objects.get_or_create(name=nombre)[0])
+        otro = User.objects.create_user("otro", "otro@municipalidad.local", "clave-segura-123")
+        cls.departamento = Departamento.objects.create(nombre_departamento="Obras")
+        cls.cuadrilla = JefeCuadrilla.objects.create(
+            nombre_cuadrilla="Cuadrilla 1", usuario=cls.usuario.profile, departamento=cls.departamento
+        )
+        cls.cuadrilla_ajena = JefeCuadrilla.objects.create(
+            nombre_cuadrilla="Cuadrilla 2", usuario=otro.profile, departamento=cls.departamento
+        )
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def _crear_encuestas(self, cantidad):
+        encuestas = []
+        for i in range(cantidad):
+            encuesta = Encuesta.objects.create(
+                titulo=f"Encuesta {Encuesta.objects.count()}", descripcion="d", ubicacion="u",
+                prioridad="Alta", departamento=self.departamento,
+            )
+            for cuadrilla in (self.cuadrilla_ajena, self.cuadrilla):
+                Incidencia.objects.create(
+                    titulo=f"Incidencia {encuesta.pk} {cuadrilla.pk}", descripcion="d", prioridad="media",
+                    latitud=-33.45, longitud=-70.66, nombre_vecino="Vecino",
+                    correo_vecino="vecino@correo.cl", telefono_vecino="+56911112222",
+                    departamento=self.departamento, encuesta=encuesta, cuadrilla=cuadrilla,
+                )
+            encuestas.append(encuesta)
+        return encuestas
+
+    def _consultas_lista(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse("territorial_app:encuestas_lista"))
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta, len(consultas)
+
+    def test_consultas_no_dependen_de_la_cantidad_de_encuestas(self):
+        self._crear_encuestas(2)
+        self._consultas_lista()
+        _, con_pocas = self._consultas_lista()
+
+        self._crear_encuestas(ENCUESTAS_POR_PAGINA)
+        _, con_muchas = self._consultas_lista()
+
+        self.assertEqual(con_pocas, con_muchas)
+
+    def test_anota_la_incidencia_de_la_cuadrilla_del_jefe(self):
+        encuestas = self._crear_encuestas(3)
+        respuesta, _ = self._consultas_lista()
+
+        esperadas = {
+            e.pk: Incidencia.objects.get(encuesta=e, cuadrilla=self.cuadrilla).pk for e in encuestas
+        }
+        obtenidas = {e.pk: e.incidencia_id for e in respuesta.context["encuestas"]}
+        self.assertEqual(obtenidas, esperadas)
+
+    def test_pagina_la_lista(self):
+        self._crear_encuestas(ENCUESTAS_POR_PAGINA + 1)
+
+        respuesta, _ = self._consultas_lista()
+        self.assertEqual(len(respuesta.context["encuestas"]), ENCUESTAS_POR_PAGINA)
+        self.assertTrue(respuesta.context["pagina"].has_next())
+
+        respuesta = self.client.get(reverse("territorial_app:encuestas_lista"), {"page": 2})
+        self.assertEqual(len(respuesta.context["encuestas"]), 1)
@@ -24,6 +24,7 @@ urlpatterns = [
     
                               
     path('encuestas/<int:encuesta_id>/', views.encuesta_detalle, name='encuesta_detalle'),
+    path('encuestas/<int:encuesta_id>/resultados/', views.encuesta_resultados, name='encuesta_resultados'),
 
                      
     path("encuestas/<int:pk>/editar/", views.encuesta_editar, name="encuesta_editar"),
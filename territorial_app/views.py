@@ -2,13 +2,17 @@ from django.shortcuts import get_object_or_404, render, redirect
 from django.utils import timezone
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
+from django.core.paginator import Paginator
+from django.db.models import Max, OuterRef, Prefetch, Subquery
 from core.models import Incidencia, JefeCuadrilla, Departamento, Encuesta, PreguntaEncuesta, TipoIncidencia, PreguntaBase, RespuestaEncuesta, Multimedia
 from .forms import RechazarIncidenciaForm, ReasignarIncidenciaForm, EncuestaForm, FinalizarIncidenciaForm, PreguntaEncuestaForm
 from incidencias.forms import SubirEvidenciaForm
-from core.utils import solo_admin, admin_o_territorial, admin_territorial_cuadrilla
+from core.utils import solo_admin, admin_o_territorial, admin_territorial_cuadrilla, roles_de, presupuesto_consultas
 from django.forms import formset_factory, modelformset_factory
 from django.http import JsonResponse
+from core.condicional import etag_por_actualizacion
+from core.busqueda import buscar
+from core.analitica import resumenes_encuesta
 
                                    
 from django.http import JsonResponse
@@ -24,7 +28,7 @@ import os
 @login_required
 def lista_incidencias(request):
     user = request.user
-    if user.groups.filter(name='Administrador').exists():
+    if 'Administrador' in roles_de(user):
         incidencias = Incidencia.objects.all().order_by('-creadoEl')
     else:
         incidencias = Incidencia.objects.none()
@@ -37,6 +41,7 @@ def lista_incidencias(request):
                                    
                     
                                    
+@presupuesto_consultas(7)
 @login_required
 def validar_incidencia(request, pk):
     incidencia = get_object_or_404(Incidencia, pk=pk)
@@ -49,6 +54,7 @@ def validar_incidencia(request, pk):
                                    
                      
                                    
+@presupuesto_consultas(4)
 @login_required
 def rechazar_incidencia(request, pk):
     incidencia = get_object_or_404(Incidencia, pk=pk)
@@ -72,11 +78,12 @@ def rechazar_incidencia(request, pk):
 
 
                       
+@presupuesto_consultas(5)
 @login_required
 def reasignar_incidencia(request, pk):
     incidencia = get_object_or_404(Incidencia, pk=pk)
     user = request.user
-    grupos = list(user.groups.values_list("name", flat=True))
+    grupos = roles_de(user)
     is_admin = "Administrador" in grupos or user.is_superuser
     is_territorial = "Territorial" in grupos
     is_departamento = "Departamento" in grupos
@@ -107,9 +114,10 @@ def reasignar_incidencia(request, pk):
     return render(request,'territorial_app/reasignar_incidencia.html', ctx)
 
                       
+@presupuesto_consultas(5)
 @login_required
 def finalizar_incidencia(request, pk):
-    incidencia = get_object_or_404(Incidencia, pk=pk)
+    incidencia = get_object_or_404(Incidencia.objects.select_related('encuesta'), pk=pk)
 
     try:
         jefe_cuadrilla = JefeCuadrilla.objects.get(usuario__user=request.user)
@@ -117,20 +125,18 @@ def finalizar_incidencia(request, pk):
         messages.error(request, "No tienes permisos para finalizar incidencias.")
         return redirect('territorial_app:incidencias_lista')
 
-    if incidencia.cuadrilla != jefe_cuadrilla:
+    if incidencia.cuadrilla_id != jefe_cuadrilla.pk:
         messages.error(request, "No puedes finalizar una incidencia que no pertenece a tu cuadrilla.")
         return redirect('territorial_app:incidencias_lista')
 
-    encuesta = getattr(incidencia, 'encuesta', None)
-    if encuesta:
-        preguntas = encuesta.preguntaencuesta_set.all()
-        incompletas = [p for p in preguntas if not p.respuestas.exists()]
-        if incompletas:
-            messages.error(
-                request, 
-                "No puedes completar la incidencia porque la encuesta asociada tiene preguntas sin responder."
-            )
-            return redirect('incidencias:incidencia_detalle', pk=incidencia.id)
+    encuesta = incidencia.encuesta
+    if encuesta and not encuesta.completa:
+        messages.error(
+            request,
+            "No puedes completar la incidencia porque la encuesta asociada tiene preguntas sin responder "
+            f"({encuesta.preguntas_respondidas} de {encuesta.total_preguntas} respondidas)."
+        )
+        return redirect('incidencias:incidencia_detalle', pk=incidencia.id)
     
     if request.method == 'POST':
         form = FinalizarIncidenciaForm(request.POST, request.FILES, instance=incidencia)
@@ -150,12 +156,17 @@ def finalizar_incidencia(request, pk):
         {'form': form, 'incidencia': incidencia}
     )
     
+ENCUESTAS_POR_PAGINA = 25
+
+@presupuesto_consultas(5)
 @login_required
 @admin_o_territorial
 def encuestas_lista(request):
     """
     Lista todas las encuestas.
-    Territorial y Admin pueden verlas todas.
+    Territorial y Admin pueden verlas todas. Para un jefe de cuadrilla se
+    anota `incidencia_id`, la incidencia de su cuadrilla en cada encuesta,
+    con una subconsulta en la misma consulta de la página.
     """
     q = request.GET.get("q", "").strip()
     estado = request.GET.get("estado")                                
@@ -164,11 +175,7 @@ def encuestas_lista(request):
     
                                   
     if q:
-        qs = qs.filter(
-            Q(titulo__icontains=q) | 
-            Q(descripcion__icontains=q) |
-            Q(departamento__nombre_departamento__icontains=q)
-        )
+        qs = buscar(qs, q).order_by('-relevancia', '-creadoEl')
     
                        
     if estado == 'activo':
@@ -177,23 +184,22 @@ def encuestas_lista(request):
         qs = qs.filter(estado=False)
 
     user = request.user
-    is_admin = user.is_superuser or user.groups.filter(name="Administrador").exists()
-    is_territorial = user.groups.filter(name="Territorial").exists()
-    is_jefe = user.groups.filter(name="Jefe de Cuadrilla").exists()
+    grupos = roles_de(user)
+    is_admin = user.is_superuser or "Administrador" in grupos
+    is_territorial = "Territorial" in grupos
+    is_jefe = "Jefe de Cuadrilla" in grupos
 
-    
-    profile = request.user.profile 
     if is_jefe:
-        profile = request.user.profile
-        for encuesta in qs:
-            encuesta.incidencia = encuesta.incidencia_set.filter(cuadrilla__usuario=profile).first()
-    else:   
-        for encuesta in qs:
-            encuesta.incidencia = None
+        incidencia_jefe = Incidencia.objects.filter(
+            encuesta=OuterRef("pk"), cuadrilla__usuario__user=user
+        ).order_by("pk").values("pk")[:1]
+        qs = qs.annotate(incidencia_id=Subquery(incidencia_jefe))
+
+    pagina = Paginator(qs, ENCUESTAS_POR_PAGINA).get_page(request.GET.get("page"))
 
-    
     ctx = {
-        "encuestas": qs,
+        "encuestas": pagina,
+        "pagina": pagina,
         "q": q,
         "estado_seleccionado": estado,
         "is_admin": is_admin,
@@ -203,14 +209,24 @@ def encuestas_lista(request):
     return render(request, "territorial_app/encuestas_lista.html", ctx)
 
 
+def _marca_encuesta(request, encuesta_id):
+    marca = Encuesta.objects.filter(pk=encuesta_id).aggregate(
+        encuesta=Max("actualizadoEl"), incidencia=Max("incidencia__actualizadoEl")
+    )
+    return marca if marca["encuesta"] else None
+
+
+@presupuesto_consultas(12)
 @login_required
-                     
+@etag_por_actualizacion(_marca_encuesta)
 def encuesta_detalle(request, encuesta_id):
     """
     Muestra los detalles de una encuesta, sus preguntas y evidencias.
     """
     encuesta = get_object_or_404(Encuesta, pk=encuesta_id)
-    preguntas = encuesta.preguntaencuesta_set.all().prefetch_related('respuestas')
+    preguntas = encuesta.preguntaencuesta_set.all().prefetch_related(
+        Prefetch('respuestas', queryset=RespuestaEncuesta.objects.order_by('pk'))
+    )
     evidencias = encuesta.evidencias.all().order_by('-creadoEl')
     
                                       
@@ -218,7 +234,7 @@ def encuesta_detalle(request, encuesta_id):
 
     preguntas_con_respuestas = []
     for p in preguntas:
-        respuesta = p.respuestas.first()
+        respuesta = next(iter(p.respuestas.all()), None)
         texto = respuesta.texto_respuesta if respuesta and respuesta.texto_respuesta.strip() else "No respondida"
         preguntas_con_respuestas.append({
             "texto_pregunta": p.texto_pregunta,
@@ -239,6 +255,36 @@ def encuesta_detalle(request, encuesta_id):
 
 
 
+def _resultados(pregunta):
+    resumen = pregunta.resumen
+    return {
+        "id": pregunta.pk,
+        "texto_pregunta": pregunta.texto_pregunta,
+        "tipo": pregunta.tipo,
+        "total_respuestas": resumen.total if resumen else 0,
+        "resultados": resumen.datos if resumen else {},
+        "actualizado": resumen.actualizadoEl.isoformat() if resumen else None,
+    }
+
+
+@presupuesto_consultas(5)
+@login_required
+def encuesta_resultados(request, encuesta_id):
+    """
+    Resultados agregados por pregunta. Lee los resúmenes precalculados,
+    así que no recorre las respuestas. Con ?formato=json entrega lo mismo como JSON.
+    """
+    encuesta = get_object_or_404(Encuesta, pk=encuesta_id)
+    resultados = [_resultados(p) for p in resumenes_encuesta(encuesta)]
+    if request.GET.get("formato") == "json":
+        return JsonResponse({"encuesta": encuesta.pk, "titulo": encuesta.titulo, "preguntas": resultados})
+    return render(request, "territorial_app/encuesta_resultados.html", {
+        "encuesta": encuesta,
+        "resultados": resultados,
+    })
+
+
+@presupuesto_consultas(4)
 @login_required
 @admin_o_territorial
 def json_preguntas(request):
@@ -248,6 +294,7 @@ def json_preguntas(request):
         preguntas = list(PreguntaBase.objects.filter(tipo_incidencia_id=tipo_id).values('texto_pregunta'))
     return JsonResponse(preguntas, safe=False)
 
+@presupuesto_consultas(5)
 @login_required
 @admin_o_territorial
 def encuesta_crear(request):
@@ -312,6 +359,7 @@ def encuesta_crear(request):
 
 
 
+@presupuesto_consultas(4)
 @login_required
 @admin_o_territorial
 def pregunta_agregar(request, encuesta_id):
@@ -337,6 +385,7 @@ def pregunta_agregar(request, encuesta_id):
 
     return render(request, "territorial_app/pregunta_form.html", {"encuesta": encuesta})
 
+@presupuesto_consultas(8)
 @login_required
 @admin_territorial_cuadrilla
 def responder_encuesta(request, encuesta_id, incidencia_id):
@@ -344,23 +393,25 @@ def responder_encuesta(request, encuesta_id, incidencia_id):
     Permite responder las preguntas de una encuesta y subir evidencias.
     """
     encuesta = get_object_or_404(Encuesta, pk=encuesta_id)
-    incidencia = get_object_or_404(Incidencia, pk=incidencia_id)
-    preguntas = encuesta.preguntaencuesta_set.all().prefetch_related('respuestas')
+    incidencia = get_object_or_404(Incidencia.objects.select_related('departamento', 'cuadrilla'), pk=incidencia_id)
+    preguntas = list(encuesta.preguntaencuesta_set.order_by('pk').prefetch_related(
+        Prefetch('respuestas', queryset=RespuestaEncuesta.objects.order_by('pk'))
+    ))
+    for pregunta in preguntas:
+        pregunta.respuesta = next(iter(pregunta.respuestas.all()), None)
     evidencia_form = SubirEvidenciaForm(request.POST or None, request.FILES or None)
 
     if request.method == "POST":
                                            
         for pregunta in preguntas:
             texto = request.POST.get(f"respuesta_{pregunta.id}", "").strip()
-            if texto:
-                                                                                
-                respuesta, created = RespuestaEncuesta.objects.get_or_create(
-                    pregunta=pregunta,
-                    defaults={"texto_respuesta": texto, "tipo": pregunta.tipo}
-                )
-                if not created:
-                    respuesta.texto_respuesta = texto
-                    respuesta.save()
+            if not texto:
+                continue
+            if pregunta.respuesta is None:
+                RespuestaEncuesta.objects.create(pregunta=pregunta, texto_respuesta=texto, tipo=pregunta.tipo)
+            elif pregunta.respuesta.texto_respuesta != texto:
+                pregunta.respuesta.texto_respuesta = texto
+                pregunta.respuesta.save()
 
                                            
         if evidencia_form.is_valid() and evidencia_form.cleaned_data.get('archivo'):
@@ -404,6 +455,7 @@ def responder_encuesta(request, encuesta_id, incidencia_id):
         "form": evidencia_form,
     })
 
+@presupuesto_consultas(6)
 @login_required
 @admin_o_territorial
 def encuesta_editar(request, pk):
@@ -470,6 +522,7 @@ def encuesta_editar(request, pk):
         'modo': 'editar'
     })
 
+@presupuesto_consultas(5)
 @login_required
 @admin_o_territorial
 def encuesta_toggle_estado(request, pk):
@@ -491,6 +544,7 @@ def encuesta_toggle_estado(request, pk):
     return redirect("territorial_app:encuestas_lista")
 
 
+@presupuesto_consultas(5)
 @login_required
 @admin_o_territorial
 def encuesta_eliminar(request, pk):
@@ -515,6 +569,7 @@ def encuesta_eliminar(request, pk):
 
                                   
 
+@presupuesto_consultas(4)
 @login_required
 @admin_o_territorial
 @admin_territorial_cuadrilla
@@ -589,23 +644,28 @@ def evidencia_subir(request, encuesta_id):
     return redirect('territorial_app:encuesta_detalle', encuesta_id=encuesta.id)
 
 
+@presupuesto_consultas(8)
 @login_required
 @admin_o_territorial
 def evidencia_eliminar(request, evidencia_id):
     """
     Elimina una evidencia.
+    El archivo original se borra del disco solo cuando ninguna otra
+    evidencia lo comparte (ver ArchivoEvidencia).
     """
     evidencia = get_object_or_404(Multimedia, pk=evidencia_id)
-    encuesta_id = evidencia.encuesta.id if evidencia.encuesta else None
+    encuesta_id = evidencia.encuesta_id
     
     if request.method == 'POST':
         nombre = evidencia.nombre
         
                                  
-        if evidencia.archivo:
+        for archivo in (evidencia.miniatura, evidencia.vista_previa):
+            if not archivo:
+                continue
             try:
-                if os.path.isfile(evidencia.archivo.path):
-                    os.remove(evidencia.archivo.path)
+                if os.path.isfile(archivo.path):
+                    os.remove(archivo.path)
             except Exception as e:
                 print(f"Error al eliminar archivo físico: {e}")
         